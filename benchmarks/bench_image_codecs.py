@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Benchmark upload size and encode CPU time per image codec on 300 DPI scans.
+
+Each page of the sample student PDF is rendered and encoded with every codec
+and quality of --image-format/--image-quality. The SDK path is what sending
+PIL Images costs: the google-genai SDK encodes them as PNG on every request,
+so its CPU time is paid again on each retry, re-query and escalation, while a
+pre-encoded page is encoded once. --attempts sets the number of requests per
+page that the total encode time is reported for.
+
+Usage:
+    python benchmarks/bench_image_codecs.py [--pdf Data/411000001_範例.pdf] [--dpi 300] [--attempts 2]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from examgrader.utils.image_utils import encode_image, render_page, pixmap_to_image
+
+DEFAULT_PDF = os.path.join(PROJECT_ROOT, "Data", "411000001_範例.pdf")
+
+# (label, format, quality, grayscale)
+CODECS = [
+    ("SDK (PNG per request)", "PNG", None, False),
+    ("JPEG q75", "JPEG", 75, False),
+    ("JPEG q90", "JPEG", 90, False),
+    ("JPEG q90 gray", "JPEG", 90, True),
+    ("WEBP q75", "WEBP", 75, False),
+    ("WEBP q90", "WEBP", 90, False),
+    ("PNG gray", "PNG", None, True),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image codec upload size and encode time benchmark")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="Student PDF to encode")
+    parser.add_argument("--dpi", type=int, default=300, help="Render resolution")
+    parser.add_argument("--attempts", type=int, default=2,
+                        help="Requests per page (first try plus retries, re-queries and escalations)")
+    args = parser.parse_args()
+
+    with fitz.open(args.pdf) as doc:
+        pages = [pixmap_to_image(render_page(page, args.dpi)) for page in doc]
+    if not pages:
+        print(f"No pages in {args.pdf}")
+        return
+    grays = [page.convert('L') for page in pages]
+
+    print(f"{len(pages)} pages of {os.path.basename(args.pdf)} at {args.dpi} DPI; per page, {args.attempts} requests:")
+    print(f"{'codec':>22} | {'KB':>7} | {'vs SDK':>6} | {'encode':>9} | {'all requests':>12}")
+    print("-" * 67)
+    sdk_bytes = None
+    for label, image_format, quality, grayscale in CODECS:
+        total_bytes = 0
+        start = time.process_time()
+        for image in (grays if grayscale else pages):
+            total_bytes += len(encode_image(image, image_format, quality or 90)[0])
+        encode_ms = (time.process_time() - start) * 1000 / len(pages)
+
+        sdk_path = label.startswith("SDK")
+        if sdk_path:
+            sdk_bytes = total_bytes
+        # The SDK encodes on every request; pre-encoded pages only once
+        all_requests_ms = encode_ms * (args.attempts if sdk_path else 1)
+        print(f"{label:>22} | {total_bytes / len(pages) / 1024:>7.1f} | {total_bytes / sdk_bytes:>6.1%} | "
+              f"{encode_ms:>6.1f} ms | {all_requests_ms:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
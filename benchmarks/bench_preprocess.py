@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Benchmark payload size and latency of answer pages with and without preprocessing.
+
+Each page of the sample student PDF is rendered, skewed by a small angle as a
+phone scan would be, and run through each preprocessing step on its own and
+through all of them. For each configuration the benchmark reports the encoded
+JPEG payload, the estimated Gemini image tokens and the preprocessing time per
+page. With --live, each payload is also sent to Gemini and the request latency
+is reported (requires GEMINI_API_KEY).
+
+Usage:
+    python benchmarks/bench_preprocess.py [--pdf Data/411000001_範例.pdf] [--skew 2.0] [--max-long-edge 2000] [--live]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from examgrader.api.rate_limiter import estimate_image_tokens
+from examgrader.utils.image_utils import encode_image, render_page, pixmap_to_image
+from examgrader.utils.preprocess import PagePreprocessor
+from examgrader.utils.prompts import PromptManager
+
+DEFAULT_PDF = os.path.join(PROJECT_ROOT, "Data", "411000001_範例.pdf")
+
+
+def configurations(max_long_edge: int):
+    """Preprocessing configurations to compare, as (label, preprocessor or None)."""
+    return [
+        ("none", None),
+        ("grayscale", PagePreprocessor(['grayscale'])),
+        ("deskew", PagePreprocessor(['deskew'])),
+        ("autocrop", PagePreprocessor(['autocrop'])),
+        ("binarize", PagePreprocessor(['binarize'])),
+        (f"downscale {max_long_edge}", PagePreprocessor([], max_long_edge=max_long_edge)),
+        ("all", PagePreprocessor(['autocrop', 'deskew', 'grayscale'], max_long_edge=max_long_edge)),
+    ]
+
+
+def scanned_pages(pdf_path: str, dpi: int, skew: float):
+    """Yield the rendered pages of a PDF rotated by skew degrees."""
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            image = pixmap_to_image(render_page(page, dpi))
+            yield image.rotate(skew, fillcolor='white', expand=True) if skew else image
+
+
+def send(gemini_api, payload: bytes, mime_type: str) -> float:
+    """Send a page to Gemini and return the request latency in seconds."""
+    start = time.perf_counter()
+    gemini_api.generate_content(PromptManager.get_answer_extraction_prompt(), payload, mime_type=mime_type)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Page preprocessing payload and latency benchmark")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="Student PDF to preprocess")
+    parser.add_argument("--dpi", type=int, default=300, help="Render resolution")
+    parser.add_argument("--skew", type=float, default=2.0, help="Degrees the pages are rotated by to simulate a phone scan")
+    parser.add_argument("--max-long-edge", type=int, default=2000, help="Long edge of the downscale step")
+    parser.add_argument("--live", action="store_true", help="Also send each payload to Gemini and time it")
+    args = parser.parse_args()
+
+    gemini_api = None
+    if args.live:
+        from dotenv import load_dotenv
+        from examgrader.api.gemini import GeminiAPI
+        load_dotenv()
+        gemini_api = GeminiAPI(os.getenv('GEMINI_API_KEY'))
+
+    configs = configurations(args.max_long_edge)
+    totals = {label: [0, 0, 0.0, 0.0] for label, _ in configs}  # bytes, tokens, preprocess ms, API s
+    pages = 0
+    for image in scanned_pages(args.pdf, args.dpi, args.skew):
+        pages += 1
+        for label, preprocessor in configs:
+            start = time.perf_counter()
+            processed = preprocessor.apply(image) if preprocessor else image
+            preprocess_ms = (time.perf_counter() - start) * 1000
+            payload, mime_type = encode_image(processed, 'JPEG', 90)
+            totals[label][0] += len(payload)
+            totals[label][1] += estimate_image_tokens(processed)
+            totals[label][2] += preprocess_ms
+            if gemini_api:
+                totals[label][3] += send(gemini_api, payload, mime_type)
+
+    if not pages:
+        print(f"No pages in {args.pdf}")
+        return
+
+    print(f"{pages} pages of {os.path.basename(args.pdf)} at {args.dpi} DPI, skewed {args.skew} degrees; per page:")
+    print(f"{'steps':>16} | {'KB':>7} | {'saved':>6} | {'tokens':>6} | {'preprocess':>10}"
+          + (f" | {'API s':>6}" if gemini_api else ""))
+    print("-" * (59 + (9 if gemini_api else 0)))
+    baseline = totals["none"][0]
+    for label, _ in configs:
+        size, tokens, preprocess_ms, api_s = totals[label]
+        row = (f"{label:>16} | {size / pages / 1024:>7.1f} | {1 - size / baseline:>6.1%} | {tokens // pages:>6} | "
+               f"{preprocess_ms / pages:>7.1f} ms")
+        if gemini_api:
+            row += f" | {api_s / pages:>6.2f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Benchmark peak RSS of materialized vs. streaming PDF page rendering.
+
+Builds a multi-page scan by repeating the pages of a sample PDF, then renders
+it in a fresh subprocess per mode so each peak RSS measurement is isolated.
+
+Usage:
+    python benchmarks/bench_render_memory.py [--pdf Data/411000001_範例.pdf] [--pages 40] [--dpi 300]
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_PDF = os.path.join(PROJECT_ROOT, "Data", "411000001_範例.pdf")
+
+
+def build_scan(source_pdf: str, pages: int, output_pdf: str) -> None:
+    """Write a PDF with `pages` pages by cycling through the source pages."""
+    with fitz.open(source_pdf) as src, fitz.open() as out:
+        for i in range(pages):
+            page_num = i % src.page_count
+            out.insert_pdf(src, from_page=page_num, to_page=page_num)
+        out.save(output_pdf)
+
+
+def run_mode(mode: str, pdf_path: str, dpi: int) -> None:
+    """Render every page in the given mode and print peak RSS in MB."""
+    from examgrader.extractors.base import BasePDFExtractor
+
+    extractor = BasePDFExtractor(pdf_path, gemini_api=None)
+    start = time.perf_counter()
+    pages = 0
+    if mode == "list":
+        for image in extractor.pdf_to_images(dpi):
+            pages += 1
+    else:
+        for _, image in extractor.iter_images(dpi):
+            pages += 1
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is reported in KB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:<8} pages={pages:<4} peak_rss={peak_mb:8.1f} MB  time={elapsed:6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS benchmark for PDF page rendering")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="Source PDF whose pages are repeated")
+    parser.add_argument("--pages", type=int, default=40, help="Number of pages in the generated scan")
+    parser.add_argument("--dpi", type=int, default=300, help="Render resolution")
+    parser.add_argument("--mode", choices=["list", "stream"], help=argparse.SUPPRESS)
+    parser.add_argument("--scan", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.scan, args.dpi)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scan_path = os.path.join(tmp_dir, "scan.pdf")
+        build_scan(args.pdf, args.pages, scan_path)
+        print(f"Rendering {args.pages}-page scan at {args.dpi} DPI")
+        for mode in ("list", "stream"):
+            subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--scan", scan_path, "--dpi", str(args.dpi)],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Benchmark per-page render time of the JPEG round trip vs. raw pixmap wrapping.
+
+Compares the previous render path (pixmap -> JPEG bytes -> decode -> RGB) with
+pixmap_to_image(), which hands the raw samples to PIL without encoding.
+
+Usage:
+    python benchmarks/bench_render_speed.py [--pdf Data/411000001_範例.pdf] [--dpi 150 200 300]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from examgrader.utils.image_utils import render_page, pixmap_to_image
+
+DEFAULT_PDF = os.path.join(PROJECT_ROOT, "Data", "411000001_範例.pdf")
+
+
+def jpeg_round_trip(page: fitz.Page, dpi: int) -> Image.Image:
+    """Previous render path: encode the pixmap to JPEG and decode it again."""
+    pix = render_page(page, dpi)
+    return Image.open(io.BytesIO(pix.tobytes("jpeg"))).convert('RGB')
+
+
+def raw_samples(page: fitz.Page, dpi: int) -> Image.Image:
+    """Current render path: wrap the raw pixmap samples."""
+    return pixmap_to_image(render_page(page, dpi))
+
+
+def time_per_page(doc: fitz.Document, render, dpi: int, repeats: int) -> float:
+    """Return the mean render time per page in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for page in doc:
+            image = render(page, dpi)
+            image.load()
+    return (time.perf_counter() - start) * 1000 / (repeats * doc.page_count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-page render time benchmark")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="PDF to render")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 200, 300], help="Render resolutions")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the PDF per measurement")
+    args = parser.parse_args()
+
+    with fitz.open(args.pdf) as doc:
+        print(f"{doc.page_count} pages from {os.path.basename(args.pdf)}, {args.repeats} passes")
+        print(f"{'DPI':>5} | {'jpeg round trip':>16} | {'raw samples':>12} | {'speedup':>7}")
+        print("-" * 52)
+        for dpi in args.dpi:
+            jpeg_ms = time_per_page(doc, jpeg_round_trip, dpi, args.repeats)
+            raw_ms = time_per_page(doc, raw_samples, dpi, args.repeats)
+            print(f"{dpi:>5} | {jpeg_ms:>13.1f} ms | {raw_ms:>9.1f} ms | {jpeg_ms / raw_ms:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
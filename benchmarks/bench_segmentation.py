@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Benchmark page latency of transcribing whole pages versus concurrent answer blocks.
+
+Each page of the sample student PDF is cut into blocks at its whitespace gaps as
+with --max-segments. Generation time grows with the amount of handwriting to
+transcribe, so without --live the benchmark reports the share of the page's ink
+rows in its largest block: the expected page latency of the segmented strategy
+relative to sending the whole page, since the blocks are transcribed at once.
+With --live, the whole page and its blocks are sent to Gemini and the measured
+wall-clock latencies of both strategies are compared (requires GEMINI_API_KEY).
+
+Usage:
+    python benchmarks/bench_segmentation.py [--pdf Data/411000001_範例.pdf] [--max-segments 4] [--live]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from examgrader.utils.blank_page import DEFAULT_INK_THRESHOLD
+from examgrader.utils.image_utils import encode_image, render_page, pixmap_to_image
+from examgrader.utils.prompts import PromptManager
+from examgrader.utils.segmentation import segment_rows
+
+DEFAULT_PDF = os.path.join(PROJECT_ROOT, "Data", "411000001_範例.pdf")
+
+
+def ink_rows(gray: np.ndarray) -> np.ndarray:
+    """Mark the rows of a page holding ink."""
+    return (gray < DEFAULT_INK_THRESHOLD).any(axis=1)
+
+
+def send(gemini_api, prompt: str, image) -> float:
+    """Send an image to Gemini and return the request latency in seconds."""
+    payload, mime_type = encode_image(image, 'JPEG', 90)
+    start = time.perf_counter()
+    gemini_api.generate_content(prompt, payload, mime_type=mime_type)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whole-page versus segmented transcription latency benchmark")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="Student PDF to segment")
+    parser.add_argument("--dpi", type=int, default=300, help="Render resolution")
+    parser.add_argument("--max-segments", type=int, default=4, help="Most blocks per page")
+    parser.add_argument("--live", action="store_true", help="Send whole pages and blocks to Gemini and time them")
+    args = parser.parse_args()
+
+    gemini_api = None
+    if args.live:
+        from dotenv import load_dotenv
+        from examgrader.api.gemini import GeminiAPI
+        load_dotenv()
+        gemini_api = GeminiAPI(os.getenv('GEMINI_API_KEY'))
+    page_prompt = PromptManager.get_answer_extraction_prompt()
+    block_prompt = page_prompt + "\n" + PromptManager.get_answer_segment_note()
+
+    print(f"{'page':>4} | {'blocks':>6} | {'segment':>9} | {'critical':>8}"
+          + (f" | {'whole s':>7} | {'blocks s':>8}" if gemini_api else ""))
+    print("-" * (38 + (21 if gemini_api else 0)))
+    totals = [0, 0.0, 0.0, 0.0, 0.0]  # blocks, segment ms, critical share, whole s, blocks s
+    pages = 0
+    with fitz.open(args.pdf) as doc, ThreadPoolExecutor(max_workers=args.max_segments) as executor:
+        for page_num, page in enumerate(doc, start=1):
+            image = pixmap_to_image(render_page(page, args.dpi))
+            gray = np.asarray(image.convert('L'))
+            start = time.perf_counter()
+            rows = segment_rows(gray, args.max_segments)
+            segment_ms = (time.perf_counter() - start) * 1000
+
+            inked = ink_rows(gray)
+            critical = max(inked[top:bottom].sum() for top, bottom in rows) / max(inked.sum(), 1)
+            row = f"{page_num:>4} | {len(rows):>6} | {segment_ms:>6.1f} ms | {critical:>8.0%}"
+
+            whole_s = blocks_s = 0.0
+            if gemini_api:
+                whole_s = send(gemini_api, page_prompt, image)
+                blocks = [image.crop((0, top, image.width, bottom)) for top, bottom in rows]
+                start = time.perf_counter()
+                list(executor.map(lambda block: send(gemini_api, block_prompt, block), blocks))
+                blocks_s = time.perf_counter() - start
+                row += f" | {whole_s:>7.2f} | {blocks_s:>8.2f}"
+            print(row)
+
+            pages += 1
+            for i, value in enumerate((len(rows), segment_ms, critical, whole_s, blocks_s)):
+                totals[i] += value
+
+    if not pages:
+        print(f"No pages in {args.pdf}")
+        return
+    print("-" * (38 + (21 if gemini_api else 0)))
+    print(f"{'mean':>4} | {totals[0] / pages:>6.1f} | {totals[1] / pages:>6.1f} ms | {totals[2] / pages:>8.0%}"
+          + (f" | {totals[3] / pages:>7.2f} | {totals[4] / pages:>8.2f}" if gemini_api else ""))
+    if gemini_api and totals[3]:
+        print(f"Segmented page latency is {totals[4] / totals[3]:.0%} of whole-page latency")
+    else:
+        print(f"Expected segmented page latency: {totals[2] / pages:.0%} of whole-page latency "
+              f"plus {totals[1] / pages:.0f} ms of segmentation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Benchmark payload size and latency of pages with and without template subtraction.
+
+Without a student PDF, student pages are simulated by writing a few answer lines
+onto the template and scanning them with a small skew and offset. For each page
+the benchmark reports the encoded JPEG payload, the estimated Gemini image tokens
+and the preprocessing time. With --live, each payload is also sent to Gemini and
+the request latency is reported (requires GEMINI_API_KEY).
+
+Usage:
+    python benchmarks/bench_template_subtraction.py [--template Data/Homework1_2025.pdf] [--pdf students.pdf] [--live]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from examgrader.api.rate_limiter import estimate_image_tokens
+from examgrader.utils.image_utils import encode_image, render_page, pixmap_to_image
+from examgrader.utils.prompts import PromptManager
+from examgrader.utils.template_subtraction import TemplateSubtractor
+
+DEFAULT_TEMPLATE = os.path.join(PROJECT_ROOT, "Data", "Homework1_2025.pdf")
+
+SIMULATED_ANSWERS = ["x = 42 since 6 * 7 = 42", "T(n) = O(n log n)", "answer: f(x) = x^2"]
+
+
+def simulated_pages(template_path: str, dpi: int):
+    """Yield the template pages with answer lines written on them, scanned with skew and offset."""
+    with fitz.open(template_path) as doc:
+        for page in doc:
+            height = page.rect.height
+            for i, answer in enumerate(SIMULATED_ANSWERS):
+                page.insert_text((300, height * (0.3 + 0.25 * i)), answer, fontsize=18)
+            image = pixmap_to_image(render_page(page, dpi))
+            image = image.rotate(0.4, fillcolor='white')
+            yield image.transform(image.size, Image.Transform.AFFINE, (1, 0, 12, 0, 1, -9), fillcolor='white')
+
+
+def student_pages(pdf_path: str, dpi: int):
+    """Yield the rendered pages of a student PDF."""
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            yield pixmap_to_image(render_page(page, dpi))
+
+
+def send(gemini_api, image: Image.Image) -> float:
+    """Send a page to Gemini and return the request latency in seconds."""
+    payload, mime_type = encode_image(image, 'JPEG', 90)
+    start = time.perf_counter()
+    gemini_api.generate_content(PromptManager.get_answer_extraction_prompt(), payload, mime_type=mime_type)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Template subtraction payload and latency benchmark")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="PDF of the blank answer sheet")
+    parser.add_argument("--pdf", help="Student PDF answered on the template (default: simulated from the template)")
+    parser.add_argument("--dpi", type=int, default=300, help="Render resolution")
+    parser.add_argument("--live", action="store_true", help="Also send each payload to Gemini and time it")
+    args = parser.parse_args()
+
+    gemini_api = None
+    if args.live:
+        from dotenv import load_dotenv
+        from examgrader.api.gemini import GeminiAPI
+        load_dotenv()
+        gemini_api = GeminiAPI(os.getenv('GEMINI_API_KEY'))
+
+    subtractor = TemplateSubtractor(args.template)
+    pages = student_pages(args.pdf, args.dpi) if args.pdf else simulated_pages(args.template, args.dpi)
+
+    print(f"{'page':>4} | {'full KB':>8} | {'crop KB':>8} | {'full tok':>8} | {'crop tok':>8} | {'subtract':>9}"
+          + (f" | {'full s':>7} | {'crop s':>7}" if gemini_api else ""))
+    print("-" * (62 + (20 if gemini_api else 0)))
+    totals = [0, 0, 0, 0, 0.0, 0.0, 0.0]
+    for page_num, image in enumerate(pages, start=1):
+        start = time.perf_counter()
+        cropped = subtractor.apply(page_num, image)
+        subtract_ms = (time.perf_counter() - start) * 1000
+
+        full_bytes = len(encode_image(image, 'JPEG', 90)[0])
+        crop_bytes = len(encode_image(cropped, 'JPEG', 90)[0]) if cropped else 0
+        full_tokens = estimate_image_tokens(image)
+        crop_tokens = estimate_image_tokens(cropped) if cropped else 0
+        row = (f"{page_num:>4} | {full_bytes / 1024:>8.1f} | {crop_bytes / 1024:>8.1f} | {full_tokens:>8} | "
+               f"{crop_tokens:>8} | {subtract_ms:>6.1f} ms")
+
+        full_s = crop_s = 0.0
+        if gemini_api:
+            full_s = send(gemini_api, image)
+            crop_s = send(gemini_api, cropped) if cropped else 0.0
+            row += f" | {full_s:>7.2f} | {crop_s:>7.2f}"
+        print(row)
+
+        for i, value in enumerate((full_bytes, crop_bytes, full_tokens, crop_tokens, subtract_ms, full_s, crop_s)):
+            totals[i] += value
+
+    print("-" * (62 + (20 if gemini_api else 0)))
+    print(f"{'all':>4} | {totals[0] / 1024:>8.1f} | {totals[1] / 1024:>8.1f} | {totals[2]:>8} | {totals[3]:>8} | "
+          f"{totals[4]:>6.1f} ms" + (f" | {totals[5]:>7.2f} | {totals[6]:>7.2f}" if gemini_api else ""))
+    if totals[0]:
+        print(f"Payload reduced to {totals[1] / totals[0]:.1%} of the full pages, tokens to {totals[3] / max(totals[2], 1):.1%}")
+    subtractor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Module for caching API responses on disk."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """Content-addressed on-disk cache of API responses with size-bounded LRU eviction.
+
+    Entries are keyed by a hash of everything that determines a response (model,
+    prompts, image bytes and generation parameters), so identical requests across
+    runs are served from disk. Safe to share between threads: the lock only guards
+    the in-memory LRU index, and entry files are read and written outside it.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1024 * 1024 * 1024):
+        """Initialize the response cache.
+
+        Args:
+            cache_dir: Directory to store cache entries in
+            max_bytes: Maximum total size of cache entries before the least recently
+                used entries are evicted
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(namespace: str, params: Dict[str, Any], data: Optional[bytes] = None) -> str:
+        """Build a cache key from the parameters of a request.
+
+        Args:
+            namespace: Name of the API method, e.g. "gemini.generate_content"
+            params: JSON-serializable request parameters (model, prompts, settings)
+            data: Optional binary payload such as image bytes
+
+        Returns:
+            Hex digest identifying the request
+        """
+        digest = hashlib.sha256()
+        digest.update(namespace.encode('utf-8'))
+        digest.update(json.dumps(params, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        if data:
+            digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response.
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            The cached response text, or None on a miss
+        """
+        with self._lock:
+            known = key in self._entries
+            if known:
+                self._entries.move_to_end(key)
+            else:
+                self.misses += 1
+        if not known:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            response = entry['response']
+        except (OSError, ValueError, KeyError) as e:
+            # Also the case when another thread evicted the entry after the index lookup
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            self._delete_files([key])
+            return None
+
+        # The modification time orders the entries by last use when the index is rebuilt
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += entry.get('request_bytes', 0)
+        return response
+
+    def put(self, key: str, response: str, request_bytes: int = 0) -> None:
+        """Store a response and evict least recently used entries if over the size limit.
+
+        Args:
+            key: Cache key from make_key()
+            response: Response text to cache
+            request_bytes: Size of the request payload, counted as saved on later hits
+        """
+        path = self._entry_path(key)
+        data = json.dumps({'response': response, 'request_bytes': request_bytes}, ensure_ascii=False).encode('utf-8')
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            evicted = self._evict()
+        self._delete_files(evicted)
+
+    def summary(self) -> str:
+        """Format the hit/miss statistics for logging."""
+        with self._lock:
+            total = self.hits + self.misses
+            hit_rate = self.hits / total if total else 0.0
+            return (f"Response cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate), "
+                    f"{self.bytes_saved / (1024 * 1024):.1f} MB of requests saved, "
+                    f"{len(self._entries)} entries using {self._total_bytes / (1024 * 1024):.1f} MB")
+
+    def _entry_path(self, key: str) -> str:
+        """Get the file path of a cache entry."""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_index(self) -> None:
+        """Build the in-memory LRU index from the entries already on disk."""
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, name[:-len('.json')], stat.st_size))
+
+        # Least recently used first, by the modification time get() refreshes
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+        logger.debug(f"Loaded {len(self._entries)} cache entries ({self._total_bytes} bytes) from {self.cache_dir}")
+        self._delete_files(self._evict())
+
+    def _evict(self) -> List[str]:
+        """Drop least recently used entries from the index until the cache fits in max_bytes. Caller holds the lock.
+
+        Returns:
+            Keys of the dropped entries, whose files the caller deletes after releasing the lock
+        """
+        evicted = []
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            evicted.append(key)
+            logger.debug(f"Evicted cache entry {key}")
+        return evicted
+
+    def _forget(self, key: str) -> None:
+        """Drop an entry from the index. Caller holds the lock."""
+        self._total_bytes -= self._entries.pop(key, 0)
+
+    def _delete_files(self, keys: List[str]) -> None:
+        """Delete the files of entries dropped from the index."""
+        for key in keys:
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
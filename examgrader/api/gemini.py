@@ -1,25 +1,60 @@
 """Module for interacting with the Gemini API."""
 
+import asyncio
 import logging
 import time
-from typing import Optional
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Union
 from PIL import Image
 from google import genai
 from google.genai import types
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+from examgrader.api.cache import ResponseCache
+from examgrader.api.governor import governor, GEMINI_EXTRACTION
+from examgrader.api.rate_limiter import rate_limits, estimate_text_tokens, estimate_image_tokens
 
 logger = logging.getLogger(__name__)
 
+def _contents(prompt: str, image, mime_type: Optional[str]) -> list:
+    """Build the request contents from a prompt and an image, a list of images, or None."""
+    contents = [prompt]
+    for item in (image if isinstance(image, list) else [image]):
+        if isinstance(item, bytes):
+            # Pre-encoded bytes are sent as-is instead of being re-encoded by the SDK
+            contents.append(types.Part.from_bytes(data=item, mime_type=mime_type or "image/jpeg"))
+        elif item:
+            contents.append(item)
+    return contents
+
+def _retry_on_rate_limit(func):
+    """Retry a request on rate limit errors with exponential backoff; works on coroutines too."""
+    return retry(
+        stop=stop_after_attempt(5),  # Increase max attempts
+        wait=wait_exponential(multiplier=2, min=4, max=60),  # Longer backoff
+        retry=retry_if_exception(lambda e: GeminiAPI.should_retry_error(e)),  # Custom retry condition
+        retry_error_callback=lambda retry_state: logger.warning(
+            f"Retry {retry_state.attempt_number} failed with error: {retry_state.outcome.exception()}"
+        )
+    )(func)
+
 class GeminiAPI:
     """Handles all interactions with the Gemini API for text extraction."""
     
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash-preview-04-17"):
+    # Output tokens reserved against the TPM quota until the actual usage is known
+    ESTIMATED_OUTPUT_TOKENS = 1000
+    
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash-preview-04-17", cache: Optional[ResponseCache] = None):
         self.client = genai.Client(api_key=api_key)
         self.model_name = model_name
+        self.cache = cache
     
     @staticmethod
     def should_retry_error(exception):
         """Determine if we should retry based on the exception"""
+        # google-genai errors carry the HTTP status code directly
+        if getattr(exception, 'code', None) == 429:
+            return True
         if hasattr(exception, 'error'):
             error_dict = getattr(exception, 'error')
             if isinstance(error_dict, dict):
@@ -31,21 +66,18 @@ class GeminiAPI:
                        'quota' in error_dict.get('message', '').lower())  # Quota exceeded message
         return False
 
-    @retry(
-        stop=stop_after_attempt(5),  # Increase max attempts
-        wait=wait_exponential(multiplier=2, min=4, max=60),  # Longer backoff
-        retry=should_retry_error,  # Custom retry condition
-        retry_error_callback=lambda retry_state: logger.warning(
-            f"Retry {retry_state.attempt_number} failed with error: {retry_state.outcome.exception()}"
-        )
-    )
-    def generate_content(self, prompt: str, image: Optional[Image.Image] = None, model_name: Optional[str] = None, thinking_budget: Optional[int] = None) -> Optional[str]:
+    def generate_content(self, prompt: str, image: Optional[Union[Image.Image, bytes, List[Union[Image.Image, bytes]]]] = None, model_name: Optional[str] = None, thinking_budget: Optional[int] = None, mime_type: Optional[str] = None) -> Optional[str]:
         """Generate content using Gemini API with enhanced retry mechanism.
         
+        Responses are served from the response cache when one is configured.
+        
         Args:
             prompt: The text prompt to send to Gemini
-            image: Optional image to include in the request
+            image: Optional image to include in the request, either a PIL Image
+                or pre-encoded image bytes, or a list of them sent in order
             model_name: Optional model name to override the default
+            thinking_budget: Optional thinking token budget for the model
+            mime_type: MIME type of pre-encoded image bytes (default: image/jpeg), shared by all images
             
         Returns:
             Generated text response or None if all retries fail
@@ -53,33 +85,218 @@ class GeminiAPI:
         Raises:
             Exception: If all retries fail and the error is not retryable
         """
-        try:
-            contents = [prompt]
-            if image:
-                contents.append(image)
+        cached, cache_key, request_bytes = self._cache_lookup(prompt, image, model_name, thinking_budget, mime_type)
+        if cached is not None:
+            return cached
+        
+        text = self._generate_content(prompt, image, model_name, thinking_budget, mime_type)
+        self._cache_store(cache_key, text, request_bytes)
+        return text
 
-            logger.debug(f"Contents: {contents}")
+    @_retry_on_rate_limit
+    def _generate_content(self, prompt: str, image: Optional[Union[Image.Image, bytes, List[Union[Image.Image, bytes]]]], model_name: Optional[str],
+                          thinking_budget: Optional[int], mime_type: Optional[str]) -> Optional[str]:
+        """Send a request to the Gemini API, retrying on rate limit errors.
+        
+        Each attempt holds its own governor slot, so backoff waits do not occupy the lane.
+        """
+        try:
+            request, limiter, estimated_tokens = self._request(prompt, image, model_name, thinking_budget, mime_type)
+            if limiter:
+                limiter.acquire(estimated_tokens)
                         
-            response = self.client.models.generate_content(
-                model=model_name or self.model_name,
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_budget=thinking_budget)
-                ),
-            )
+            with governor.slot(GEMINI_EXTRACTION):
+                response = self.client.models.generate_content(**request)
+            
+            return self._response_text(response, limiter, estimated_tokens)
+            
+        except Exception as e:
+            self._request_failed(e)
+            raise  # Let the retry decorator handle retryable errors
+
+    def _request(self, prompt: str, image: Optional[Union[Image.Image, bytes, List[Union[Image.Image, bytes]]]],
+                 model_name: Optional[str], thinking_budget: Optional[int], mime_type: Optional[str]):
+        """Build the arguments of a generate_content request and its rate limiter reservation.
+        
+        Returns:
+            Tuple of (request keyword arguments, rate limiter of the model or None, estimated tokens)
+        """
+        contents = _contents(prompt, image, mime_type)
+
+        logger.debug(f"Contents: {contents}")
+        
+        limiter = rate_limits.get(model_name or self.model_name)
+        estimated_tokens = 0
+        if limiter:
+            estimated_tokens = estimate_text_tokens(prompt) + estimate_image_tokens(image) + self.ESTIMATED_OUTPUT_TOKENS
+        
+        request = {
+            'model': model_name or self.model_name,
+            'contents': contents,
+            'config': types.GenerateContentConfig(
+                thinking_config=types.ThinkingConfig(thinking_budget=thinking_budget)
+            ),
+        }
+        return request, limiter, estimated_tokens
+
+    @staticmethod
+    def _response_text(response, limiter, estimated_tokens: int) -> Optional[str]:
+        """Record the token usage of a response and get its text, or None if it is empty."""
+        if limiter and response.usage_metadata:
+            limiter.record_usage(estimated_tokens, response.usage_metadata.total_token_count)
+        
+        if not response.text:
+            logger.warning("Gemini API returned empty response")
+            return None
+            
+        logger.debug(f"Gemini API usage metadata: {response.usage_metadata}")
+
+        return response.text
+
+    def _request_failed(self, error: Exception) -> None:
+        """Log a failed request and report rate limit errors to the governor."""
+        if self.should_retry_error(error):
+            governor.throttled(GEMINI_EXTRACTION)
+            logger.warning(f"Retryable error occurred: {str(error)}")
+        else:
+            logger.error(f"Non-retryable Gemini API error: {str(error)}")
+
+    def _cache_lookup(self, prompt: str, image: Optional[Union[Image.Image, bytes, List[Union[Image.Image, bytes]]]],
+                      model_name: Optional[str], thinking_budget: Optional[int], mime_type: Optional[str]):
+        """Look a request up in the response cache.
+        
+        Returns:
+            Tuple of (cached text or None, cache key or None without a cache, request payload size in bytes)
+        """
+        if not self.cache:
+            return None, None, 0
+        
+        cache_key, request_bytes = self._cache_key(prompt, image, model_name or self.model_name, thinking_budget, mime_type)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Gemini API response served from cache")
+        return cached, cache_key, request_bytes
+
+    def _cache_store(self, cache_key: Optional[str], text: Optional[str], request_bytes: int) -> None:
+        """Store a response in the response cache if there is one and the response is not empty."""
+        if cache_key and text:
+            self.cache.put(cache_key, text, request_bytes)
+
+    @staticmethod
+    def _cache_key(prompt: str, image: Optional[Union[Image.Image, bytes, List[Union[Image.Image, bytes]]]], model_name: str,
+                   thinking_budget: Optional[int], mime_type: Optional[str]):
+        """Build the response cache key of a request.
+        
+        Returns:
+            Tuple of (cache key, request payload size in bytes)
+        """
+        params = {
+            'model': model_name,
+            'prompt': prompt,
+            'thinking_budget': thinking_budget,
+        }
+        if isinstance(image, list):
+            # Multi-image requests hash the images in order, each with its mode and size
+            parts = [GeminiAPI._cache_key("", item, model_name, thinking_budget, mime_type) for item in image]
+            key = ResponseCache.make_key("gemini.generate_content", params, "".join(k for k, _ in parts).encode('utf-8'))
+            return key, len(prompt.encode('utf-8')) + sum(size for _, size in parts)
+        if isinstance(image, bytes):
+            data = image
+            params['mime_type'] = mime_type or "image/jpeg"
+        elif image:
+            data = image.tobytes()
+            params['image_mode'] = image.mode
+            params['image_size'] = image.size
+        else:
+            data = None
+        
+        key = ResponseCache.make_key("gemini.generate_content", params, data)
+        return key, len(prompt.encode('utf-8')) + (len(data) if data else 0)
+
+def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    """Check whether the calling thread is running the given event loop."""
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+class AsyncGeminiAPI(GeminiAPI):
+    """Gemini API client with asyncio variants built on the SDK's async client.
+    
+    The synchronous methods inherited from GeminiAPI remain available. While the
+    client is bound to a running event loop with run_on(), synchronous calls made
+    from worker threads, such as those of the thread-based extractors, are sent
+    through the async client on that loop, so all Gemini requests of an async run
+    share one event loop and connection pool.
+    """
+    
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash-preview-04-17", cache: Optional[ResponseCache] = None):
+        super().__init__(api_key, model_name=model_name, cache=cache)
+        self._loop = None
+    
+    @contextmanager
+    def run_on(self, loop: asyncio.AbstractEventLoop) -> Iterator[None]:
+        """Send the synchronous calls of worker threads through the async client on an event loop.
+        
+        Args:
+            loop: Running event loop the requests are sent on
+        """
+        self._loop = loop
+        try:
+            yield
+        finally:
+            self._loop = None
+    
+    def generate_content(self, prompt: str, image: Optional[Union[Image.Image, bytes, List[Union[Image.Image, bytes]]]] = None, model_name: Optional[str] = None, thinking_budget: Optional[int] = None, mime_type: Optional[str] = None) -> Optional[str]:
+        """Generate content, on the bound event loop when called from a worker thread.
+        
+        Same arguments and result as GeminiAPI.generate_content().
+        """
+        loop = self._loop
+        if loop is None or not loop.is_running() or _on_loop(loop):
+            # Blocking the loop's own thread on it would deadlock, so such calls stay synchronous
+            return super().generate_content(prompt, image, model_name, thinking_budget, mime_type)
+        return asyncio.run_coroutine_threadsafe(
+            self.generate_content_async(prompt, image, model_name, thinking_budget, mime_type), loop).result()
+    
+    async def generate_content_async(self, prompt: str, image: Optional[Union[Image.Image, bytes, List[Union[Image.Image, bytes]]]] = None, model_name: Optional[str] = None, thinking_budget: Optional[int] = None, mime_type: Optional[str] = None) -> Optional[str]:
+        """Generate content without blocking the event loop.
+        
+        Responses are served from the response cache when one is configured.
+        
+        Args:
+            prompt: The text prompt to send to Gemini
+            image: Optional image to include in the request, either a PIL Image
+                or pre-encoded image bytes, or a list of them sent in order
+            model_name: Optional model name to override the default
+            thinking_budget: Optional thinking token budget for the model
+            mime_type: MIME type of pre-encoded image bytes (default: image/jpeg), shared by all images
             
-            if not response.text:
-                logger.warning("Gemini API returned empty response")
-                return None
-                
-            logger.debug(f"Gemini API usage metadata: {response.usage_metadata}")
+        Returns:
+            Generated text response or None if all retries fail
+        """
+        cached, cache_key, request_bytes = self._cache_lookup(prompt, image, model_name, thinking_budget, mime_type)
+        if cached is not None:
+            return cached
+        
+        text = await self._generate_content_async(prompt, image, model_name, thinking_budget, mime_type)
+        self._cache_store(cache_key, text, request_bytes)
+        return text
 
-            return response.text
+    @_retry_on_rate_limit
+    async def _generate_content_async(self, prompt: str, image: Optional[Union[Image.Image, bytes, List[Union[Image.Image, bytes]]]], model_name: Optional[str],
+                                      thinking_budget: Optional[int], mime_type: Optional[str]) -> Optional[str]:
+        """Send a request through the async client, retrying on rate limit errors."""
+        try:
+            request, limiter, estimated_tokens = self._request(prompt, image, model_name, thinking_budget, mime_type)
+            if limiter:
+                await limiter.acquire_async(estimated_tokens)
             
+            async with governor.async_slot(GEMINI_EXTRACTION):
+                response = await self.client.aio.models.generate_content(**request)
+            
+            return self._response_text(response, limiter, estimated_tokens)
+        
         except Exception as e:
-            if self.should_retry_error(e):
-                logger.warning(f"Retryable error occurred: {str(e)}")
-                raise  # Let the retry decorator handle it
-            else:
-                logger.error(f"Non-retryable Gemini API error: {str(e)}")
-                raise  # Propagate non-retryable errors
+            self._request_failed(e)
+            raise
@@ -0,0 +1,291 @@
+"""Module for limiting concurrent API calls across the whole process."""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lanes with separate concurrency limits
+GEMINI_EXTRACTION = 'gemini_extraction'
+OPENAI_GRADING = 'openai_grading'
+OPENAI_RUBRIC = 'openai_rubric'
+
+# Executor for the blocks of a page fanned out from a GEMINI_EXTRACTION task, which may not
+# wait on tasks of its own lane; the calls themselves still hold GEMINI_EXTRACTION slots
+GEMINI_SEGMENTS = 'gemini_segments'
+
+def _wake(waiter: asyncio.Future) -> None:
+    """Resolve a waiting coroutine's future unless it was cancelled."""
+    if not waiter.done():
+        waiter.set_result(None)
+
+class AdaptiveWindow:
+    """Concurrency window of one lane, adjusted by additive increase/multiplicative decrease.
+
+    While calls complete under the latency target the window grows by about
+    one slot per window's worth of calls, up to the ceiling. A throttling
+    response (HTTP 429 / RESOURCE_EXHAUSTED) halves it, at most once per
+    cooldown so a burst of 429s from the same window counts as one signal.
+    With adaptation disabled the window stays at its initial size.
+    """
+
+    def __init__(self, lane: str, initial: int, ceiling: int, adaptive: bool = False,
+                 latency_target: float = 60.0, cooldown: float = 5.0):
+        """Initialize the window.
+
+        Args:
+            lane: Lane the window belongs to, used in log messages
+            initial: Initial number of concurrent calls
+            ceiling: Maximum number of concurrent calls the window may grow to
+            adaptive: Whether to adjust the window from call outcomes
+            latency_target: Calls slower than this many seconds do not grow the window
+            cooldown: Minimum seconds between two multiplicative decreases
+        """
+        self.lane = lane
+        self.ceiling = max(initial, ceiling) if adaptive else initial
+        self.adaptive = adaptive
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self._window = float(initial)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._async_waiters = []  # (event loop, future) of coroutines waiting for a slot
+
+        self.peak = initial
+        self.throttles = 0
+
+    @property
+    def size(self) -> int:
+        """Current number of calls allowed in flight."""
+        return max(1, int(self._window))
+
+    def acquire(self) -> None:
+        """Wait until the lane has room for another call."""
+        with self._condition:
+            while self._in_flight >= self.size:
+                self._condition.wait()
+            self._in_flight += 1
+
+    async def acquire_async(self) -> None:
+        """Wait without blocking the event loop until the lane has room for another call.
+
+        Threads and coroutines share the same window.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._in_flight < self.size:
+                    self._in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, latency: Optional[float] = None) -> None:
+        """Give back a slot, growing the window if the call was fast enough.
+
+        Args:
+            latency: Duration of the completed call in seconds, or None if it failed
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if self.adaptive and latency is not None and latency <= self.latency_target:
+                previous = self.size
+                self._window = min(self.ceiling, self._window + 1 / self._window)
+                if self.size > previous:
+                    self.peak = max(self.peak, self.size)
+                    logger.debug(f"Concurrency window for {self.lane} increased to {self.size}")
+            self._condition.notify_all()
+            # Waiting coroutines re-check the window in their own event loop
+            for loop, waiter in self._async_waiters:
+                loop.call_soon_threadsafe(_wake, waiter)
+            self._async_waiters.clear()
+
+    def throttled(self) -> None:
+        """Record a throttling response and halve the window."""
+        with self._condition:
+            self.throttles += 1
+            if not self.adaptive:
+                return
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self._window = max(1.0, self._window / 2)
+            logger.info(f"Concurrency window for {self.lane} decreased to {self.size} after a rate limit response")
+
+class ConcurrencyGovernor:
+    """Process-wide scheduler with a separate concurrency limit per API lane.
+
+    Every API call holds a slot of its lane while it is in flight, so the
+    number of concurrent calls per provider stays within its limit no matter
+    how many students, pages or questions are processed at once. Stages that
+    fan out work submit it to the shared executor of the lane instead of
+    opening their own thread pools.
+
+    In adaptive mode the limit of each lane is only the starting point: the
+    lane's AdaptiveWindow grows it while calls succeed and shrinks it when
+    the provider throttles, up to the configured ceiling.
+    """
+
+    DEFAULT_LIMIT = 12
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        """Initialize the governor.
+
+        Args:
+            limits: Maximum number of concurrent calls per lane; lanes not listed
+                use DEFAULT_LIMIT
+        """
+        self._lock = threading.Lock()
+        self._limits = dict(limits or {})
+        self._windows = {}
+        self._executors = {}
+        self.adaptive = False
+        self.ceiling = None
+        self.latency_target = 60.0
+
+    def configure(self, limits: Dict[str, int], adaptive: Optional[bool] = None,
+                  ceiling: Optional[int] = None, latency_target: Optional[float] = None) -> None:
+        """Set the concurrency limits of one or more lanes.
+
+        Meant to be called once at startup. Calls already in flight keep the
+        slot they acquired under the previous limit.
+
+        Args:
+            limits: Maximum number of concurrent calls per lane, or the initial
+                window in adaptive mode
+            adaptive: Whether to adjust the windows from call outcomes
+            ceiling: Maximum window size in adaptive mode (default: four times the limit)
+            latency_target: Calls slower than this many seconds do not grow the window
+        """
+        with self._lock:
+            if adaptive is not None:
+                self.adaptive = adaptive
+            if ceiling is not None:
+                self.ceiling = ceiling
+            if latency_target is not None:
+                self.latency_target = latency_target
+            for lane, limit in limits.items():
+                if limit is None:
+                    continue
+                if limit < 1:
+                    raise ValueError(f"Concurrency limit for {lane} must be at least 1, got {limit}")
+                self._limits[lane] = limit
+                self._windows.pop(lane, None)
+                executor = self._executors.pop(lane, None)
+                if executor:
+                    executor.shutdown(wait=False)
+                if self.adaptive:
+                    logger.info(f"Adaptive concurrency for {lane}: starting at {limit}, up to {self._ceiling(lane)}")
+                else:
+                    logger.info(f"Concurrency limit for {lane}: {limit}")
+
+    def limit(self, lane: str) -> int:
+        """Get the current concurrency limit of a lane."""
+        with self._lock:
+            window = self._windows.get(lane)
+        return window.size if window else self._limits.get(lane, self.DEFAULT_LIMIT)
+
+    def throttled(self, lane: str) -> None:
+        """Report a rate limit response (HTTP 429 / RESOURCE_EXHAUSTED) on a lane."""
+        self._window(lane).throttled()
+
+    def summary(self) -> str:
+        """Format the current window of each lane for logging."""
+        with self._lock:
+            windows = list(self._windows.values())
+        return "Concurrency: " + ", ".join(
+            f"{w.lane} window {w.size} (peak {w.peak}, {w.throttles} rate limit responses)" for w in windows)
+
+    def _ceiling(self, lane: str) -> int:
+        """Get the maximum window size of a lane. Caller holds the lock."""
+        limit = self._limits.get(lane, self.DEFAULT_LIMIT)
+        return max(limit, self.ceiling or 4 * limit) if self.adaptive else limit
+
+    def _window(self, lane: str) -> AdaptiveWindow:
+        """Get the concurrency window of a lane, creating it on first use."""
+        with self._lock:
+            window = self._windows.get(lane)
+            if window is None:
+                window = self._windows[lane] = AdaptiveWindow(
+                    lane, self._limits.get(lane, self.DEFAULT_LIMIT), self._ceiling(lane),
+                    adaptive=self.adaptive, latency_target=self.latency_target)
+            return window
+
+    @contextmanager
+    def slot(self, lane: str) -> Iterator[None]:
+        """Hold one slot of a lane for the duration of an API call.
+
+        The call's latency feeds the lane's adaptive window when it completes
+        without raising.
+
+        Args:
+            lane: Lane the call belongs to
+        """
+        window = self._window(lane)
+        window.acquire()
+        start_time = time.monotonic()
+        latency = None
+        try:
+            yield
+            latency = time.monotonic() - start_time
+        finally:
+            window.release(latency)
+
+    @asynccontextmanager
+    async def async_slot(self, lane: str) -> AsyncIterator[None]:
+        """Hold one slot of a lane for the duration of an async API call.
+
+        Shares the lane's window with threaded calls made through slot().
+
+        Args:
+            lane: Lane the call belongs to
+        """
+        window = self._window(lane)
+        await window.acquire_async()
+        start_time = time.monotonic()
+        latency = None
+        try:
+            yield
+            latency = time.monotonic() - start_time
+        finally:
+            window.release(latency)
+
+    def executor(self, lane: str) -> ThreadPoolExecutor:
+        """Get the shared executor of a lane, sized to the lane's maximum window.
+
+        Threads beyond the current window wait for a slot, so the executor
+        follows the window as it shrinks and grows.
+
+        Tasks submitted to it must not wait on other tasks of the same lane.
+
+        Args:
+            lane: Lane the work belongs to
+
+        Returns:
+            Shared ThreadPoolExecutor; callers must not shut it down
+        """
+        with self._lock:
+            executor = self._executors.get(lane)
+            if executor is None:
+                executor = self._executors[lane] = ThreadPoolExecutor(
+                    max_workers=self._ceiling(lane), thread_name_prefix=lane)
+            return executor
+
+    def shutdown(self) -> None:
+        """Shut down all shared executors."""
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+# Governor shared by all API clients and stages of the process
+governor = ConcurrencyGovernor()
@@ -1,21 +1,33 @@
 """Module for interacting with the OpenAI API."""
 
+import asyncio
 import logging
 import time
 import random
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from openai import RateLimitError, APIError, APITimeoutError, APIConnectionError
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+from examgrader.api.cache import ResponseCache
+from examgrader.api.governor import governor, OPENAI_GRADING
+from examgrader.api.rate_limiter import rate_limits, estimate_text_tokens
 
 logger = logging.getLogger(__name__)
 
+# Errors a call is retried on with exponential backoff
+RETRYABLE_ERRORS = (RateLimitError, APIError, APITimeoutError, APIConnectionError)
+
 class OpenAIAPI:
     """Handles core OpenAI API interactions."""
     
-    def __init__(self, api_key: str, model_name: str = "o4-mini"):
+    # Completion and reasoning tokens reserved against the TPM quota until the actual usage is known
+    ESTIMATED_COMPLETION_TOKENS = 2000
+    
+    def __init__(self, api_key: str, model_name: str = "o4-mini", cache: Optional[ResponseCache] = None):
         self.api_key = api_key
         self.client = OpenAI(api_key=self.api_key)
         self.model_name = model_name
+        self.cache = cache
     
     def call_api(
         self, 
@@ -23,7 +35,9 @@ class OpenAIAPI:
         system_prompt: str = "",
         model_name: Optional[str] = None,
         reasoning_effort: str = "medium",
-        max_retries: int = 3
+        max_retries: int = 3,
+        use_cache: bool = True,
+        lane: str = OPENAI_GRADING
     ) -> str:
         """Core method for making OpenAI API calls with retry logic.
         
@@ -33,6 +47,8 @@ class OpenAIAPI:
             model_name: Optional model name to override the default
             reasoning_effort: Level of reasoning effort ("auto", "low", "high")
             max_retries: Maximum number of retry attempts
+            use_cache: Whether the response may be served from and stored in the response cache
+            lane: Concurrency governor lane the call counts against
             
         Returns:
             The model's response text
@@ -40,48 +56,202 @@ class OpenAIAPI:
         Raises:
             Exception: If API call fails after max retries
         """
-        retries = 0
-        backoff_time = 1  # Initial backoff time in seconds
+        cached, cache_key = self._cache_lookup(user_prompt, system_prompt, model_name, reasoning_effort, use_cache)
+        if cached is not None:
+            return cached
         
-        while retries <= max_retries:
+        messages = self._messages(user_prompt, system_prompt)
+        response = self._create_completion(messages, model_name, reasoning_effort, max_retries, lane)
+        
+        self._cache_store(cache_key, response, user_prompt, system_prompt)
+        return response
+    
+    def _create_completion(self, messages: list, model_name: Optional[str], reasoning_effort: str, max_retries: int,
+                           lane: str) -> str:
+        """Send a chat completion request, retrying with exponential backoff on API errors.
+        
+        Each attempt holds its own governor slot, so backoff waits do not occupy the lane.
+        """
+        limiter, estimated_tokens = self._reservation(messages, model_name)
+        
+        for retries in range(max_retries + 1):
             try:
-                messages = []
-                if system_prompt:
-                    messages.append({"role": "system", "content": system_prompt})
-                messages.append({"role": "user", "content": user_prompt})
-                
-                completion = self.client.chat.completions.create(
-                    model=model_name or self.model_name,
-                    reasoning_effort=reasoning_effort,
-                    messages=messages,
-                )
+                if limiter:
+                    limiter.acquire(estimated_tokens)
                 
-                response = completion.choices[0].message.content
+                with governor.slot(lane):
+                    completion = self.client.chat.completions.create(
+                        **self._request(messages, model_name, reasoning_effort))
                 
-                # Log token usage if available
-                if hasattr(completion, 'usage'):
-                    logger.debug(f"Token usage: {completion.usage}")
-                    logger.debug(f"Total tokens: {completion.usage.total_tokens}")
-                    logger.debug(f"Prompt tokens: {completion.usage.prompt_tokens}")
-                    logger.debug(f"Completion tokens: {completion.usage.completion_tokens}")
+                return self._completion_text(completion, limiter, estimated_tokens)
                 
-                return response.strip()
-                
-            except (RateLimitError, APIError, APITimeoutError, APIConnectionError) as e:
-                retries += 1
-                if retries > max_retries:
-                    logger.error(f"Max retries exceeded for OpenAI API call: {e}")
-                    raise Exception(f"Failed after {max_retries} attempts: {str(e)}")
-                
-                # Add jitter to backoff time
-                jitter = random.uniform(0, 0.5)
-                sleep_time = backoff_time + jitter
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self._retry_delay(e, retries, max_retries, lane))
+            
+            except Exception as e:
+                logger.error(f"Unexpected error calling OpenAI API: {e}")
+                raise
+    
+    def _cache_lookup(self, user_prompt: str, system_prompt: str, model_name: Optional[str], reasoning_effort: str,
+                      use_cache: bool) -> Tuple[Optional[str], Optional[str]]:
+        """Look a call up in the response cache.
+        
+        Returns:
+            Tuple of (cached response or None, cache key or None if the call is not cached)
+        """
+        if not (self.cache and use_cache):
+            return None, None
+        cache_key = ResponseCache.make_key("openai.call_api", {
+            'model': model_name or self.model_name,
+            'system_prompt': system_prompt,
+            'user_prompt': user_prompt,
+            'reasoning_effort': reasoning_effort,
+        })
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.debug("OpenAI API response served from cache")
+        return cached, cache_key
+    
+    def _cache_store(self, cache_key: Optional[str], response: str, user_prompt: str, system_prompt: str) -> None:
+        """Store a response in the response cache if the call is cached."""
+        if cache_key:
+            request_bytes = len(system_prompt.encode('utf-8')) + len(user_prompt.encode('utf-8'))
+            self.cache.put(cache_key, response, request_bytes)
+    
+    @staticmethod
+    def _messages(user_prompt: str, system_prompt: str) -> List[Dict[str, str]]:
+        """Build the chat messages of a call."""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": user_prompt})
+        return messages
+    
+    def _reservation(self, messages: list, model_name: Optional[str]):
+        """Get the rate limiter of the model, or None, and the tokens a call reserves against it."""
+        limiter = rate_limits.get(model_name or self.model_name)
+        estimated_tokens = sum(estimate_text_tokens(m["content"]) for m in messages) + self.ESTIMATED_COMPLETION_TOKENS
+        return limiter, estimated_tokens
+    
+    def _request(self, messages: list, model_name: Optional[str], reasoning_effort: str) -> Dict[str, Any]:
+        """Build the arguments of a chat completion request."""
+        return {
+            'model': model_name or self.model_name,
+            'reasoning_effort': reasoning_effort,
+            'messages': messages,
+        }
+    
+    @staticmethod
+    def _completion_text(completion, limiter, estimated_tokens: int) -> str:
+        """Record the token usage of a completion and get its text."""
+        response = completion.choices[0].message.content
+        
+        # Log token usage if available
+        if hasattr(completion, 'usage'):
+            if limiter and completion.usage:
+                limiter.record_usage(estimated_tokens, completion.usage.total_tokens)
+            logger.debug(f"Token usage: {completion.usage}")
+            if completion.usage:
+                logger.debug(f"Total tokens: {completion.usage.total_tokens}")
+                logger.debug(f"Prompt tokens: {completion.usage.prompt_tokens}")
+                logger.debug(f"Completion tokens: {completion.usage.completion_tokens}")
+        
+        return response.strip()
+    
+    @staticmethod
+    def _retry_delay(error: Exception, retries: int, max_retries: int, lane: str) -> float:
+        """Handle a failed attempt and get the backoff before the next one.
+        
+        Args:
+            error: Retryable error of the attempt
+            retries: Number of attempts that failed before this one
+            max_retries: Maximum number of retry attempts
+            lane: Concurrency governor lane the call counts against
+            
+        Returns:
+            Seconds to wait, exponential in the attempt with jitter
+            
+        Raises:
+            Exception: If no retries are left
+        """
+        if isinstance(error, RateLimitError):
+            governor.throttled(lane)
+        if retries >= max_retries:
+            logger.error(f"Max retries exceeded for OpenAI API call: {error}")
+            raise Exception(f"Failed after {max_retries} attempts: {str(error)}")
+        
+        # Exponential backoff with jitter
+        sleep_time = 2 ** retries + random.uniform(0, 0.5)
+        logger.warning(f"OpenAI API error: {error}. Retrying in {sleep_time:.2f} seconds (attempt {retries + 1}/{max_retries})")
+        return sleep_time
+
+class AsyncOpenAIAPI(OpenAIAPI):
+    """OpenAI API client with asyncio variants built on the SDK's async client.
+    
+    The synchronous methods inherited from OpenAIAPI remain available, so the
+    same instance can serve both thread-based stages and coroutines. Both share
+    the governor lanes and the response cache.
+    """
+    
+    def __init__(self, api_key: str, model_name: str = "o4-mini", cache: Optional[ResponseCache] = None):
+        super().__init__(api_key, model_name=model_name, cache=cache)
+        self.async_client = AsyncOpenAI(api_key=self.api_key)
+    
+    async def call_api_async(
+        self,
+        user_prompt: str,
+        system_prompt: str = "",
+        model_name: Optional[str] = None,
+        reasoning_effort: str = "medium",
+        max_retries: int = 3,
+        use_cache: bool = True,
+        lane: str = OPENAI_GRADING
+    ) -> str:
+        """Make an OpenAI API call without blocking the event loop.
+        
+        Args:
+            user_prompt: The user message containing the specific task
+            system_prompt: The system message defining AI's role and behavior (optional)
+            model_name: Optional model name to override the default
+            reasoning_effort: Level of reasoning effort ("auto", "low", "high")
+            max_retries: Maximum number of retry attempts
+            use_cache: Whether the response may be served from and stored in the response cache
+            lane: Concurrency governor lane the call counts against
+            
+        Returns:
+            The model's response text
+            
+        Raises:
+            Exception: If API call fails after max retries
+        """
+        cached, cache_key = self._cache_lookup(user_prompt, system_prompt, model_name, reasoning_effort, use_cache)
+        if cached is not None:
+            return cached
+        
+        messages = self._messages(user_prompt, system_prompt)
+        response = await self._create_completion_async(messages, model_name, reasoning_effort, max_retries, lane)
+        
+        self._cache_store(cache_key, response, user_prompt, system_prompt)
+        return response
+    
+    async def _create_completion_async(self, messages: list, model_name: Optional[str], reasoning_effort: str,
+                                       max_retries: int, lane: str) -> str:
+        """Send a chat completion request through the async client, retrying with exponential backoff."""
+        limiter, estimated_tokens = self._reservation(messages, model_name)
+        
+        for retries in range(max_retries + 1):
+            try:
+                if limiter:
+                    await limiter.acquire_async(estimated_tokens)
                 
-                logger.warning(f"OpenAI API error: {e}. Retrying in {sleep_time:.2f} seconds (attempt {retries}/{max_retries})")
-                time.sleep(sleep_time)
+                async with governor.async_slot(lane):
+                    completion = await self.async_client.chat.completions.create(
+                        **self._request(messages, model_name, reasoning_effort))
                 
-                # Exponential backoff
-                backoff_time *= 2
+                return self._completion_text(completion, limiter, estimated_tokens)
+            
+            except RETRYABLE_ERRORS as e:
+                await asyncio.sleep(self._retry_delay(e, retries, max_retries, lane))
             
             except Exception as e:
                 logger.error(f"Unexpected error calling OpenAI API: {e}")
@@ -0,0 +1,240 @@
+"""Module for client-side rate limiting of API calls by request and token quotas."""
+
+import asyncio
+import io
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Environment variable with per-model limits, e.g. "o4-mini=500:200000,gemini-2.5-flash=1000:1000000"
+RATE_LIMITS_ENV = 'EXAMGRADER_RATE_LIMITS'
+
+# Gemini bills images up to 384x384 as one tile and larger images per 768x768 tile
+GEMINI_TOKENS_PER_IMAGE_TILE = 258
+
+class TokenBucket:
+    """Thread-safe token bucket that refills continuously up to its capacity."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        """Initialize a full bucket.
+
+        Args:
+            capacity: Maximum number of tokens the bucket holds
+            refill_per_second: Tokens added per second
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float) -> float:
+        """Take tokens from the bucket, blocking until enough are available.
+
+        Requests larger than the capacity wait for a full bucket and drive it negative,
+        so they are delayed instead of rejected.
+
+        Args:
+            amount: Number of tokens to take
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait = self._try_take(amount)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, amount: float) -> float:
+        """Take tokens from the bucket without blocking the event loop.
+
+        Args:
+            amount: Number of tokens to take
+
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait = self._try_take(amount)
+            if not wait:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def adjust(self, amount: float) -> None:
+        """Add (or with a negative amount, remove) tokens without blocking."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def _try_take(self, amount: float) -> float:
+        """Take tokens if enough are available.
+
+        Returns:
+            0 if the tokens were taken, otherwise the seconds until they will be available
+        """
+        with self._lock:
+            self._refill()
+            needed = min(amount, self.capacity)
+            if self._tokens >= needed:
+                self._tokens -= amount
+                return 0.0
+            return (needed - self._tokens) / self.refill_per_second
+
+    def _refill(self) -> None:
+        """Add the tokens accrued since the last update. Caller holds the lock."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+class ModelRateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets of a single model."""
+
+    def __init__(self, model_name: str, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        """Initialize the limiter.
+
+        Args:
+            model_name: Model the limits apply to
+            rpm: Requests per minute, or None for no request limit
+            tpm: Tokens per minute, or None for no token limit
+        """
+        self.model_name = model_name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm, rpm / 60) if rpm else None
+        self.tokens = TokenBucket(tpm, tpm / 60) if tpm else None
+
+    def acquire(self, estimated_tokens: int) -> None:
+        """Wait until one request with the estimated token cost fits in the quota."""
+        waited = 0.0
+        if self.requests:
+            waited += self.requests.acquire(1)
+        if self.tokens:
+            waited += self.tokens.acquire(estimated_tokens)
+        if waited > 0:
+            logger.debug(f"Rate limiter delayed {self.model_name} request by {waited:.2f}s")
+
+    async def acquire_async(self, estimated_tokens: int) -> None:
+        """Wait without blocking the event loop until one request fits in the quota."""
+        waited = 0.0
+        if self.requests:
+            waited += await self.requests.acquire_async(1)
+        if self.tokens:
+            waited += await self.tokens.acquire_async(estimated_tokens)
+        if waited > 0:
+            logger.debug(f"Rate limiter delayed {self.model_name} request by {waited:.2f}s")
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Correct the token bucket once the real token usage of a request is known."""
+        if self.tokens and actual_tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+class RateLimitRegistry:
+    """Per-model rate limiters shared by all API clients of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits = {}  # model name -> (rpm, tpm)
+        self._limiters = {}
+
+    def configure(self, limits: Dict[str, Tuple[Optional[int], Optional[int]]]) -> None:
+        """Set the request and token quotas of one or more models.
+
+        Args:
+            limits: Mapping of model name to (requests per minute, tokens per minute)
+        """
+        with self._lock:
+            for model_name, (rpm, tpm) in limits.items():
+                self._limits[model_name] = (rpm, tpm)
+                self._limiters.pop(model_name, None)
+                logger.info(f"Rate limit for {model_name}: {rpm or 'unlimited'} RPM, {tpm or 'unlimited'} TPM")
+
+    def get(self, model_name: str) -> Optional[ModelRateLimiter]:
+        """Get the limiter of a model, or None if the model has no configured limits."""
+        with self._lock:
+            if model_name not in self._limits:
+                return None
+            limiter = self._limiters.get(model_name)
+            if limiter is None:
+                limiter = self._limiters[model_name] = ModelRateLimiter(model_name, *self._limits[model_name])
+            return limiter
+
+def parse_rate_limits(specs: List[str]) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """Parse rate limit specifications of the form MODEL=RPM:TPM.
+
+    Either number may be left empty for no limit, e.g. "o4-mini=500:" or "o4-mini=:200000".
+
+    Args:
+        specs: List of specifications
+
+    Returns:
+        Mapping of model name to (requests per minute, tokens per minute)
+
+    Raises:
+        ValueError: If a specification is malformed
+    """
+    limits = {}
+    for spec in specs:
+        try:
+            model_name, quota = spec.split('=', 1)
+            rpm, tpm = quota.split(':', 1)
+            limits[model_name.strip()] = (int(rpm) if rpm.strip() else None, int(tpm) if tpm.strip() else None)
+        except ValueError:
+            raise ValueError(f"Invalid rate limit '{spec}', expected MODEL=RPM:TPM")
+    return limits
+
+def rate_limits_from_env() -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """Read per-model rate limits from the EXAMGRADER_RATE_LIMITS environment variable."""
+    value = os.getenv(RATE_LIMITS_ENV, '')
+    return parse_rate_limits([spec for spec in value.split(',') if spec.strip()])
+
+def estimate_text_tokens(text: str) -> int:
+    """Estimate the token count of text.
+
+    Counts roughly four ASCII characters per token and one token per other
+    character, which is conservative for Chinese text.
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+def estimate_image_tokens(image: Union[Image.Image, bytes, List[Union[Image.Image, bytes]], None]) -> int:
+    """Estimate the Gemini token count of an image from its size.
+
+    Args:
+        image: PIL Image, encoded image bytes, a list of them, or None
+
+    Returns:
+        Estimated number of tokens
+    """
+    if image is None:
+        return 0
+    if isinstance(image, list):
+        return sum(estimate_image_tokens(item) for item in image)
+    if isinstance(image, bytes):
+        try:
+            # Only the header is parsed to get the size
+            width, height = Image.open(io.BytesIO(image)).size
+        except Exception:
+            return GEMINI_TOKENS_PER_IMAGE_TILE
+    else:
+        width, height = image.size
+
+    if width <= 384 and height <= 384:
+        return GEMINI_TOKENS_PER_IMAGE_TILE
+    return math.ceil(width / 768) * math.ceil(height / 768) * GEMINI_TOKENS_PER_IMAGE_TILE
+
+# Registry shared by all API clients of the process
+rate_limits = RateLimitRegistry()
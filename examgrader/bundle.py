@@ -0,0 +1,208 @@
+"""Module for compiling questions, rubrics and reference answers into an exam bundle."""
+
+import argparse
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from examgrader.api.gemini import GeminiAPI
+from examgrader.api.openai import OpenAIAPI
+from examgrader.api.governor import governor, GEMINI_EXTRACTION, OPENAI_RUBRIC
+from examgrader.api.rate_limiter import rate_limits, parse_rate_limits, rate_limits_from_env
+from examgrader.grader import build_subproblem_map
+from examgrader.utils.prompts import PromptManager
+
+logger = logging.getLogger(__name__)
+
+# Bump when the bundle layout changes so stale bundles are rejected instead of misread
+BUNDLE_VERSION = 1
+
+@dataclass
+class ExamBundle:
+    """Everything a grading run needs about an exam, compiled once.
+
+    Holds the parsed questions with rubrics, the reference answers, the
+    parent/subproblem map and the grading prompt segments that do not depend
+    on the student's answer.
+    """
+    questions: Dict[str, Dict[str, Any]]
+    correct_answers: Dict[str, Dict[str, Any]]
+    subproblem_map: Dict[str, List[str]]
+    prompt_segments: Dict[str, Dict[str, Any]]
+    sources: Dict[str, str] = field(default_factory=dict)
+    version: int = BUNDLE_VERSION
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the bundle to a JSON-serializable dictionary."""
+        return {
+            'version': self.version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sources': self.sources,
+            'questions': self.questions,
+            'correct_answers': self.correct_answers,
+            'subproblem_map': self.subproblem_map,
+            'prompt_segments': self.prompt_segments,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ExamBundle':
+        """Create an ExamBundle from a dictionary loaded from a bundle file.
+
+        Raises:
+            ValueError: If the bundle was written with a different bundle version
+        """
+        version = data.get('version')
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"Unsupported exam bundle version {version} (expected {BUNDLE_VERSION}), recompile the bundle")
+        return cls(
+            questions=data['questions'],
+            correct_answers=data['correct_answers'],
+            subproblem_map=data['subproblem_map'],
+            prompt_segments=data['prompt_segments'],
+            sources=data.get('sources', {}),
+            version=version,
+        )
+
+def build_bundle(questions: Dict[str, Dict[str, Any]], correct_answers: Dict[str, Dict[str, Any]],
+                 sources: Optional[Dict[str, str]] = None) -> ExamBundle:
+    """Precompute the grading data derived from parsed questions and reference answers.
+
+    Args:
+        questions: Parsed questions with rubrics
+        correct_answers: Parsed reference answers
+        sources: Optional description of the input files the bundle was compiled from
+
+    Returns:
+        Compiled ExamBundle
+    """
+    subproblem_map = build_subproblem_map(questions)
+
+    prompt_segments = {}
+    for q_num, question_data in questions.items():
+        # Parent questions are graded through their subproblems
+        if q_num in subproblem_map or q_num not in correct_answers:
+            continue
+        try:
+            prompt_segments[q_num] = PromptManager.get_grading_prompt_segments(question_data, correct_answers[q_num])
+        except ValueError as e:
+            logger.warning(f"Question {q_num}: {e} Its grading prompt will be rendered at grading time.")
+
+    return ExamBundle(questions, correct_answers, subproblem_map, prompt_segments, sources or {})
+
+def save_bundle(bundle: ExamBundle, output_path: str) -> str:
+    """Save an exam bundle to a JSON file.
+
+    Args:
+        bundle: Compiled ExamBundle
+        output_path: Path to the bundle file
+
+    Returns:
+        Path to the saved bundle file
+    """
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(bundle.to_dict(), f, ensure_ascii=False, indent=2)
+    return output_path
+
+def load_bundle(bundle_path: str) -> ExamBundle:
+    """Load an exam bundle from a JSON file.
+
+    Args:
+        bundle_path: Path to the bundle file
+
+    Returns:
+        Loaded ExamBundle
+    """
+    start_time = time.time()
+    with open(bundle_path, 'r', encoding='utf-8') as f:
+        bundle = ExamBundle.from_dict(json.load(f))
+    logger.info(f"Loaded exam bundle {bundle_path} with {len(bundle.questions)} questions "
+                f"in {(time.time() - start_time) * 1000:.1f} ms")
+    return bundle
+
+def parse_compile_args(argv: Optional[List[str]] = None):
+    """Parse command line arguments of the compile step."""
+    # Imported here because main imports this module for loading bundles
+    from examgrader.main import add_cache_args, add_image_encoding_args
+
+    parser = argparse.ArgumentParser(
+        prog='run.py compile',
+        description='Compile questions, rubrics and reference answers into an exam bundle')
+    parser.add_argument('-q', '--questions-file', required=True,
+                       help='Path to the questions file (PDF or JSON)')
+    parser.add_argument('-c', '--correct-answers-file', required=True,
+                       help='Path to the correct answers file (PDF or JSON)')
+    parser.add_argument('-o', '--output-file',
+                       help='Path to the bundle file (defaults to <questions_file>_bundle.json)')
+    parser.add_argument('-t', '--workers', type=int, default=12,
+                       help='Number of concurrent Gemini and rubric generation calls (default: 12)')
+    parser.add_argument('--rate-limit', action='append', default=[], metavar='MODEL=RPM:TPM',
+                       help='Requests and tokens per minute allowed for a model; may be repeated')
+    parser.add_argument('--gemini-api-key',
+                       help='Google Gemini API key (overrides GEMINI_API_KEY in .env)')
+    parser.add_argument('--openai-api-key',
+                       help='OpenAI API key (overrides OPENAI_API_KEY in .env)')
+    parser.add_argument('--gemini-model', type=str,
+                       default="gemini-2.5-flash-preview-04-17",
+                       help='Gemini model to use (default: gemini-2.5-flash-preview-04-17)')
+    parser.add_argument('--openai-model', type=str,
+                       default="o4-mini",
+                       help='OpenAI model to use (default: o4-mini)')
+    add_image_encoding_args(parser)
+    add_cache_args(parser)
+    parser.add_argument('--debug', action='store_true',
+                       help='Enable debug logging')
+    return parser.parse_args(argv)
+
+def compile_main(argv: Optional[List[str]] = None) -> int:
+    """Entry point of the compile step."""
+    # Imported here because main imports this module for loading bundles
+    from examgrader.main import setup_logging, parse_questions_and_answers, response_cache
+
+    args = parse_compile_args(argv)
+    setup_logging(args.debug)
+    cache = None
+
+    try:
+        load_dotenv()
+        gemini_api_key = args.gemini_api_key or os.getenv('GEMINI_API_KEY')
+        openai_api_key = args.openai_api_key or os.getenv('OPENAI_API_KEY')
+
+        governor.configure({GEMINI_EXTRACTION: args.workers, OPENAI_RUBRIC: args.workers})
+        limits = rate_limits_from_env()
+        limits.update(parse_rate_limits(args.rate_limit))
+        rate_limits.configure(limits)
+
+        # Same cache and page encoding as grading runs, so either reuses the other's responses
+        cache = response_cache(args)
+        gemini_api = GeminiAPI(gemini_api_key, model_name=args.gemini_model, cache=cache)
+        openai_api = OpenAIAPI(openai_api_key, model_name=args.openai_model, cache=cache)
+
+        questions_path = Path(args.questions_file).resolve()
+        correct_answers_path = Path(args.correct_answers_file).resolve()
+        questions, correct_answers = parse_questions_and_answers(
+            questions_path, correct_answers_path, gemini_api, openai_api, args.workers,
+            args.image_format, args.image_quality
+        )
+
+        bundle = build_bundle(questions, correct_answers, sources={
+            'questions_file': str(questions_path),
+            'correct_answers_file': str(correct_answers_path),
+        })
+        output_path = args.output_file or str(questions_path.parent / f"{questions_path.stem}_bundle.json")
+        save_bundle(bundle, output_path)
+        logger.info(f"Saved exam bundle with {len(questions)} questions to {output_path}")
+
+    except Exception as e:
+        logger.error(f"An error occurred: {e}", exc_info=True)
+        return 1
+    finally:
+        if cache:
+            logger.info(cache.summary())
+
+    return 0
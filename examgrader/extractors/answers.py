@@ -1,9 +1,17 @@
 """Module for extracting answers from PDF files."""
 
+import copy
 import re
 import logging
+import threading
+from concurrent.futures import Future
+from typing import Union
+from examgrader.api.governor import governor, GEMINI_EXTRACTION, GEMINI_SEGMENTS
 from examgrader.extractors.base import BasePDFExtractor
+from examgrader.utils.blank_page import BlankPageDetector
+from examgrader.utils.page_range import PDFPageRange
 from examgrader.utils.prompts import PromptManager
+from examgrader.utils.segmentation import split_page
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +31,8 @@ class QuestionNumberValidator:
         # Create sequential mappings from the dictionary keys
         self.question_sequence = []
         self.subproblem_sequences = {}
+        self.question_order = {str(key): idx for idx, key in enumerate(self.questions_dict)}
+        self.answer_sequence = []  # Answerable questions in order, i.e. keys without subproblems
         
         if self.questions_dict:
             # Get all question numbers
@@ -52,6 +62,8 @@ class QuestionNumberValidator:
             
             # Sort the question sequence
             self.question_sequence = sorted(self.question_sequence, key=lambda x: int(x) if x.isdigit() else 0)
+            
+            self.answer_sequence = [key for key in all_keys if key not in subproblems]
                 
         logger.debug(f"Question sequence: {self.question_sequence}")
         logger.debug(f"Subproblem sequences: {self.subproblem_sequences}")
@@ -111,6 +123,109 @@ class QuestionNumberValidator:
         
         return corrected_text
     
+    def would_correct(self, current_text, main_number, subproblem):
+        """Check whether validate_and_correct would change any question number in text.
+        
+        Runs on a copy, so the reference values of this validator are left untouched.
+        
+        Args:
+            current_text: The text containing question numbers to check
+            main_number: Last main question number before the text
+            subproblem: Last subproblem before the text
+            
+        Returns:
+            True if a question number in the text would be corrected
+        """
+        probe = copy.copy(self)
+        probe.update_last_reference(main_number, subproblem)
+        return probe.validate_and_correct(current_text) != current_text
+    
+    def is_consistent_start(self, current_text):
+        """Check whether the first question number in text follows from the last reference.
+        
+        Used to decide whether a page transcribed without previous-page context can be
+        stitched locally. A start is inconsistent when the first 題號 would be corrected,
+        when it moves backwards in the question order, or when a continuation marker
+        names a different question than the last reference.
+        
+        Args:
+            current_text: The text containing question numbers to check
+            
+        Returns:
+            True if the first question number needs no previous-page context to resolve
+        """
+        if not current_text or not self.questions_dict or not self.last_main_number:
+            return True
+        
+        match = re.search(r'題號：(\d+)((?:\([a-zA-Z]\)|\([a-zA-Z]\)\*\*|[a-zA-Z]|\*\*|[a-zA-Z]\*\*|)(?:（續）)?)', current_text)
+        if not match:
+            return True
+        
+        main_number = match.group(1)
+        subproblem = match.group(2)
+        cleaned_subproblem = self._clean_subproblem_format(subproblem)
+        last_subproblem = self._clean_subproblem_format(self.last_subproblem)
+        
+        if '（續）' in subproblem:
+            return main_number == str(self.last_main_number) and cleaned_subproblem == last_subproblem
+        
+        corrected_number, corrected_subproblem = self._check_and_correct(main_number, subproblem)
+        if corrected_number != main_number or corrected_subproblem != subproblem:
+            return False
+        
+        return self._question_position(main_number, cleaned_subproblem) >= self._question_position(
+            str(self.last_main_number), last_subproblem)
+    
+    def predict_last_question(self, main_number, subproblem, pages_ahead, pages_remaining):
+        """Predict the last question answered on a page that has not been transcribed yet.
+        
+        Assumes the remaining questions in answer_sequence are spread evenly over the
+        remaining pages, starting from the last known question.
+        
+        Args:
+            main_number: Last known main question number, or None before the first page
+            subproblem: Last known subproblem, if any
+            pages_ahead: Number of pages between the last known page and the predicted page
+            pages_remaining: Number of pages left after the last known page
+            
+        Returns:
+            Tuple of (predicted main number, predicted subproblem or None), the subproblem
+            written in parentheses if the last known one is, as the context prompt quotes it
+        """
+        if not self.answer_sequence or pages_ahead <= 0:
+            return main_number, subproblem
+        
+        key = f"{main_number}{self._clean_subproblem_format(subproblem)}"
+        if main_number is None:
+            position = -1
+        elif key in self.answer_sequence:
+            position = self.answer_sequence.index(key)
+        else:
+            # Fall back to the first subproblem of the main question
+            position = next((idx for idx, k in enumerate(self.answer_sequence)
+                             if (k[:-1] if k[-1].isalpha() else k) == str(main_number)), 0)
+        
+        questions_per_page = (len(self.answer_sequence) - 1 - position) / max(pages_remaining, 1)
+        position = min(len(self.answer_sequence) - 1, position + round(questions_per_page * pages_ahead))
+        
+        predicted = self.answer_sequence[position]
+        if predicted[-1].isalpha() and predicted[:-1].isdigit():
+            parenthesized = bool(subproblem) and subproblem.startswith("(") and subproblem.endswith(")")
+            return predicted[:-1], f"({predicted[-1]})" if parenthesized else predicted[-1]
+        return predicted, None
+    
+    def _question_position(self, main_number, subproblem):
+        """Get the position of a question in the questions dictionary order.
+        
+        Args:
+            main_number: The main question number
+            subproblem: The bare subproblem letter, if any
+            
+        Returns:
+            Index in the questions dictionary, or -1 if the question is unknown
+        """
+        return self.question_order.get(f"{main_number}{subproblem}", self.question_order.get(main_number, -1))
+    
     def _check_and_correct(self, main_number, subproblem):
         """Check if the question number follows expected patterns based on the dictionary.
         
@@ -267,21 +382,109 @@ class QuestionNumberValidator:
         # Otherwise, return the last one
         return valid_subs[-1]
 
+class SpeculationStats:
+    """Thread-safe counters of speculative context predictions across a run."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def record(self, hits: int, misses: int):
+        """Add the hits and misses of one extraction."""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+    
+    def summary(self) -> str:
+        """Format the counters for logging."""
+        with self._lock:
+            total = self.hits + self.misses
+            hit_rate = self.hits / total if total else 0.0
+            return f"Speculative extraction: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate)"
+
+# Counters for the whole run, shared by all AnswerExtractor instances
+speculation_stats = SpeculationStats()
+
+class ResolutionStats:
+    """Thread-safe counters of transcription calls and payload bytes per resolution tier across a run."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}  # tier -> number of calls
+        self.payload_bytes = {}  # tier -> bytes of the pre-encoded payloads
+        self.escalations = 0
+    
+    def record(self, tier: str, payload):
+        """Count one call at a tier; payload bytes are only known for pre-encoded pages.
+        
+        Args:
+            tier: Resolution tier label
+            payload: Image sent, or the list of images of a multi-page call
+        """
+        payloads = payload if isinstance(payload, list) else [payload]
+        with self._lock:
+            self.calls[tier] = self.calls.get(tier, 0) + 1
+            if all(isinstance(item, bytes) for item in payloads):
+                self.payload_bytes[tier] = self.payload_bytes.get(tier, 0) + sum(len(item) for item in payloads)
+    
+    def record_escalation(self):
+        """Count a page re-sent at high resolution."""
+        with self._lock:
+            self.escalations += 1
+    
+    def summary(self) -> str:
+        """Format the counters for logging."""
+        with self._lock:
+            tiers = ", ".join(
+                f"{tier}: {calls} calls" + (f", {self.payload_bytes[tier] / 1024 / 1024:.1f} MB" if tier in self.payload_bytes else "")
+                for tier, calls in sorted(self.calls.items()))
+            return f"Answer page resolution tiers: {tiers or 'no calls'}; {self.escalations} pages escalated"
+
+# Counters for the whole run, shared by all AnswerExtractor instances
+resolution_stats = ResolutionStats()
+
+# Fewest characters a transcription should have per percent of ink coverage on the page
+# before it counts as too short and the page is re-sent at high resolution
+MIN_CHARS_PER_INK_PERCENT = 10
+
 class AnswerExtractor(BasePDFExtractor):
     """Extracts answers from PDF files"""
     
-    def __init__(self, pdf_path: str, gemini_api, questions_dict=None):
+    EXTRACTION_MODES = ('serial', 'parallel', 'speculative')
+    
+    def __init__(self, pdf_path: Union[str, PDFPageRange], gemini_api, questions_dict=None, extraction_mode: str = 'serial',
+                 max_workers: int = 4, max_segments: int = 1, pages_per_call: int = 1, **kwargs):
         """Initialize the answer extractor.
         
         Args:
-            pdf_path: Path to the PDF file
+            pdf_path: Path to the PDF file, or a page-range view of a shared PDF
             gemini_api: Initialized GeminiAPI instance
             questions_dict: Dictionary mapping question numbers to subproblems
+            extraction_mode: 'serial' passes each page the previous page's last question number;
+                'parallel' transcribes all pages concurrently and stitches continuations locally;
+                'speculative' dispatches upcoming pages with a predicted previous-page context
+                and re-issues only the mispredicted ones
+            max_workers: Maximum number of pages transcribed concurrently in parallel and speculative modes
+            max_segments: Most blocks each page is cut into at whitespace gaps and transcribed
+                concurrently; 1 sends whole pages
+            pages_per_call: Number of consecutive pages sent in one request, each batch with the
+                previous batch's context; above 1 the extraction mode is not used and batches are
+                sent as whole pages
+            **kwargs: Rendering options forwarded to BasePDFExtractor
         """
-        super().__init__(pdf_path, gemini_api)
+        super().__init__(pdf_path, gemini_api, **kwargs)
+        if extraction_mode not in self.EXTRACTION_MODES:
+            raise ValueError(f"Unknown extraction mode: {extraction_mode}")
         self.last_question_number = '1' # Track the last main question number
         self.last_subproblem = None  # Track the last subproblem letter
         self.validator = QuestionNumberValidator(questions_dict)  # Initialize validator with questions
+        self.extraction_mode = extraction_mode
+        self.max_workers = max_workers
+        self.max_segments = max_segments
+        self.pages_per_call = pages_per_call
+        self.speculation_hits = 0
+        self.speculation_misses = 0
     
     def extract(self) -> str:
         """Extract answers from PDF pages.
@@ -289,67 +492,450 @@ class AnswerExtractor(BasePDFExtractor):
         Returns:
             Concatenated string of all extracted answers
         """
-        images = self.pdf_to_images()
+        if self.pages_per_call > 1:
+            text = self._extract_batched()
+        elif self.extraction_mode == 'parallel':
+            text = self._extract_parallel()
+        elif self.extraction_mode == 'speculative':
+            text = self._extract_speculative()
+        else:
+            text = self._extract_serial()
+        
+        if self.skipped_pages:
+            logger.info(f"Skipped {len(self.skipped_pages)} blank or template pages of {self.pdf_path}")
+            self.save_skipped_pages()
+        return text
+    
+    def _extract_serial(self) -> str:
+        """Extract answers page by page, passing each page the previous page's context."""
+        total_pages = self.page_count()
         all_text = ""
         
-        for page_num, image in enumerate(images, 1):
-            logger.info(f"Processing page {page_num}/{len(images)} for answers")
-            
-            # Add context about previous question number to the prompt
-            context_prompt = ""
-            if self.last_question_number:
-                context_prompt = f"Note: The previous page contained answers for question {self.last_question_number}"
-                if self.last_subproblem:
-                    context_prompt += f"{self.last_subproblem}"
-                context_prompt += ". "
-                context_prompt += f"If you see a lone subproblem letter (e.g., 'a', 'b', 'c') without a question number, "
-                context_prompt += f"it likely belongs to question {self.last_question_number}"
-                if self.last_subproblem:
-                    context_prompt += f"{self.last_subproblem}"
-                context_prompt += ". "
-                context_prompt += f"If the page begins with text without a question number and subproblem letter,"
-                context_prompt += f"treat it as a continuation of question {self.last_question_number}"
-                if self.last_subproblem:
-                    context_prompt += f"{self.last_subproblem}"
-                context_prompt += f" and format it as 題號：{self.last_question_number}"
-                if self.last_subproblem:
-                    context_prompt += f"{self.last_subproblem}"
-                context_prompt += "（續）. "
-                context_prompt += f"IMPORTANT: This page may contain BOTH continuation text at the top from question {self.last_question_number}"
-                if self.last_subproblem:
-                    context_prompt += f"{self.last_subproblem}"
-                context_prompt += f" AND answers for new questions."
-            
-            logger.debug("\n" + context_prompt + "\n")
-            full_prompt = PromptManager.get_answer_extraction_prompt() + "\n" + context_prompt
-            
-            text = self.gemini_api.generate_content(full_prompt, image)
-
-            logger.info("\n" + text + "\n")
-
+        for page_num, image in self.iter_images(self.first_pass_dpi):
+            image = self.prepare_page(page_num, image)
+            if image is None:
+                continue
+            logger.info(f"Processing page {page_num}/{total_pages} for answers")
+            text = self._transcribe_with_context(image, self.last_question_number, self.last_subproblem, page_num)
+            
             if text:
-                # If no question number is found in the response and we have last_question_number,
-                # it might mean the model missed the continuation - add a simple check
-                if self.last_question_number and not re.search(r'題號：', text[:500]):
-                    # Add continuity marker if the model didn't add one
-                    continuation_marker = f"題號：{self.last_question_number}"
-                    if self.last_subproblem:
-                        continuation_marker += f"{self.last_subproblem}"
-                    continuation_marker += "（續）"
-                    text = f"{continuation_marker}\n" + text
+                all_text += self._process_page_text(text) + "\n"
+            self.release_encoded_page(page_num)
                 
-                # Validate and correct question numbers in the text
-                self.validator.update_last_reference(self.last_question_number, self.last_subproblem)
-                text = self.validator.validate_and_correct(text)
+        return all_text
+    
+    def _extract_parallel(self) -> str:
+        """Extract answers in two phases.
+        
+        All pages are first transcribed concurrently without the previous-page hint.
+        A local pass then stitches continuations in page order and re-queries, with
+        the real previous-page context, only the pages whose first question number
+        cannot be resolved locally.
+        """
+        total_pages = self.page_count()
+        prompt = PromptManager.get_answer_extraction_prompt() + "\n" + PromptManager.get_answer_extraction_no_context_note()
+        
+        def transcribe(page_num, image):
+            image = self.prepare_page(page_num, image)
+            if image is None:
+                return None
+            logger.info(f"Processing page {page_num}/{total_pages} for answers")
+            return self._generate(prompt, image, page_num)
+        
+        page_texts = list(self.map_pages(transcribe, max_workers=self.max_workers, dpi=self.first_pass_dpi))
+        
+        all_text = ""
+        requeried = 0
+        for page_num, text in page_texts:
+            if not text:
+                continue
+            
+            text = self._resolve_unnumbered_continuation(text)
+            self.validator.update_last_reference(self.last_question_number, self.last_subproblem)
+            if page_num > 1 and not self.validator.is_consistent_start(text):
+                logger.info(f"Ambiguous first question number on page {page_num}, re-querying with previous-page context")
+                image = self.render_image(page_num, self.first_pass_dpi)
+                if image:
+                    image = self.prepare_page(page_num, image)
+                if image:
+                    text = self._transcribe_with_context(image, self.last_question_number, self.last_subproblem,
+                                                         page_num) or text
+                    requeried += 1
+            
+            all_text += self._process_page_text(text) + "\n"
+            self.release_encoded_page(page_num)
+        
+        logger.info(f"Parallel answer extraction re-queried {requeried}/{total_pages} pages")
+        return all_text
+    
+    def _extract_speculative(self) -> str:
+        """Extract answers serially while transcribing upcoming pages speculatively.
+        
+        Up to max_workers pages are in flight. A page dispatched before its previous
+        page has been processed gets a context predicted by the validator. When its
+        turn comes and the context prompt built from the real last question differs
+        from the predicted one, even only in formatting (3a versus 3(a)), that page is
+        re-issued with the real context, so every page is transcribed with the prompt
+        the serial path would send it.
+        """
+        total_pages = self.page_count()
+        pages = self.iter_images(self.first_pass_dpi)
+        in_flight = {}  # page number -> (image, context, speculative, future)
+        next_page = 1
+        page_num = 1
+        all_text = ""
+        
+        executor = governor.executor(GEMINI_EXTRACTION)
+        while page_num <= total_pages:
+            # Keep the window of in-flight pages full
+            while next_page <= total_pages and next_page < page_num + max(self.max_workers, 1):
+                rendered = next(pages, None)
+                if rendered is None:
+                    total_pages = next_page - 1
+                    break
+                # iter_images releases each image after yielding it, so keep a copy
+                image = rendered[1].copy()
                 
-                # Update last question number and subproblem based on the response
-                # Only look for main question numbers (not continuations)
-                question_matches = re.finditer(r'題號：(\d+)((?:\([a-zA-Z]\)|\([a-zA-Z]\)\*\*|[a-zA-Z]|\*\*|[a-zA-Z]\*\*|))(?!（續）)', text)
-                for match in question_matches:
-                    self.last_question_number = match.group(1)
-                    self.last_subproblem = match.group(2) if match.group(2) else None
-                    logger.debug(f"Last question number: {self.last_question_number}, Last subproblem: {self.last_subproblem}")
+                image = self.prepare_page(next_page, image)
+                if image is None:
+                    # Skipped pages take no request and keep the previous page's context
+                    future = Future()
+                    future.set_result(None)
+                    in_flight[next_page] = (image, None, False, future)
+                    next_page += 1
+                    continue
                 
-                all_text += text + "\n"
+                speculative = next_page > page_num
+                if speculative:
+                    # Before the first page is processed nothing has been answered yet
+                    known = (self.last_question_number, self.last_subproblem) if page_num > 1 else (None, None)
+                    context = self.validator.predict_last_question(
+                        *known,
+                        pages_ahead=next_page - page_num, pages_remaining=total_pages - page_num + 1)
+                else:
+                    context = (self.last_question_number, self.last_subproblem)
                 
+                logger.info(f"Processing page {next_page}/{total_pages} for answers")
+                future = executor.submit(self._transcribe_with_context, image, *context, next_page)
+                in_flight[next_page] = (image, context, speculative, future)
+                next_page += 1
+            
+            if page_num not in in_flight:
+                break
+            
+            image, context, speculative, future = in_flight.pop(page_num)
+            text = future.result()
+            
+            if speculative:
+                # A hit needs the exact prompt the serial path would send, not just the same question
+                real_context = self._build_context_prompt(self.last_question_number, self.last_subproblem)
+                if self._build_context_prompt(*context) == real_context:
+                    self.speculation_hits += 1
+                else:
+                    self.speculation_misses += 1
+                    logger.info(f"Mispredicted context {context[0]}{context[1] or ''} for page {page_num}, "
+                                f"re-issuing with {self.last_question_number}{self.last_subproblem or ''}")
+                    text = self._transcribe_with_context(image, self.last_question_number, self.last_subproblem,
+                                                         page_num)
+            
+            if text:
+                all_text += self._process_page_text(text) + "\n"
+            self.release_encoded_page(page_num)
+            page_num += 1
+        
+        speculation_stats.record(self.speculation_hits, self.speculation_misses)
+        logger.info(f"Speculative answer extraction for {self.pdf_path}: "
+                    f"{self.speculation_hits} hits, {self.speculation_misses} misses")
+        return all_text
+    
+    def _extract_batched(self) -> str:
+        """Extract answers sending pages_per_call consecutive pages in each request.
+        
+        The model delimits the output of each page, which is split back into pages
+        for the usual continuation handling and validation. Pages of a response
+        that is not delimited as asked are transcribed one by one.
+        """
+        total_pages = self.page_count()
+        all_text = ""
+        batch = []  # (page number, image) of the pages of the next request
+        
+        for page_num, image in self.iter_images(self.first_pass_dpi):
+            prepared = self.prepare_page(page_num, image)
+            if prepared is None:
+                continue
+            # iter_images releases each image after yielding it, so keep a copy
+            batch.append((page_num, prepared.copy() if prepared is image else prepared))
+            if len(batch) == self.pages_per_call:
+                all_text += self._transcribe_batch(batch, total_pages)
+                batch = []
+        if batch:
+            all_text += self._transcribe_batch(batch, total_pages)
+        
         return all_text
+    
+    def _transcribe_batch(self, batch, total_pages) -> str:
+        """Transcribe consecutive pages in one request and process the text of each page in order.
+        
+        Args:
+            batch: List of (page number, image) of consecutive pages
+            total_pages: Number of pages in the PDF, for logging
+        
+        Returns:
+            Processed text of the pages
+        """
+        first_page, last_page = batch[0][0], batch[-1][0]
+        page_texts = [None] * len(batch)
+        if len(batch) > 1:
+            logger.info(f"Processing pages {first_page}-{last_page}/{total_pages} for answers in one request")
+            prompt = (PromptManager.get_answer_extraction_prompt() + "\n"
+                      + PromptManager.get_answer_batch_note(len(batch)) + "\n"
+                      + self._build_context_prompt(self.last_question_number, self.last_subproblem))
+            encoded = [self.encode_page(image, page_num) for page_num, image in batch]
+            payload = [data for data, _ in encoded]
+            text = self.gemini_api.generate_content(prompt, payload, mime_type=encoded[0][1])
+            resolution_stats.record(self.resolution_tier(self.low_dpi is not None), payload)
+            logger.info("\n" + str(text) + "\n")
+            
+            split = self._split_batch_response(text, len(batch))
+            if split:
+                page_texts = split
+            else:
+                logger.warning(f"Response for pages {first_page}-{last_page} of {self.pdf_path} is not delimited "
+                               f"per page, transcribing them one by one")
+        
+        all_text = ""
+        for (page_num, image), text in zip(batch, page_texts):
+            if text is None:
+                logger.info(f"Processing page {page_num}/{total_pages} for answers")
+                text = self._transcribe_with_context(image, self.last_question_number, self.last_subproblem, page_num)
+            elif self.low_dpi:
+                reason = self._escalation_reason(text, image, self.last_question_number, self.last_subproblem)
+                if reason:
+                    prompt = (PromptManager.get_answer_extraction_prompt() + "\n"
+                              + self._build_context_prompt(self.last_question_number, self.last_subproblem))
+                    text = self._escalate(prompt, page_num, reason) or text
+            if text:
+                all_text += self._process_page_text(text) + "\n"
+            self.release_encoded_page(page_num)
+        return all_text
+    
+    @staticmethod
+    def _split_batch_response(text, page_count):
+        """Split a multi-page response at its ===== PAGE n ===== delimiters.
+        
+        Args:
+            text: Response text
+            page_count: Number of pages sent in the request
+        
+        Returns:
+            Text of each page in order, or None if the pages are not all delimited exactly once
+        """
+        if not text:
+            return None
+        parts = re.split(r'^\s*=+\s*PAGE\s+(\d+)\s*=+\s*$', text, flags=re.MULTILINE)
+        numbers = [int(number) for number in parts[1::2]]
+        if numbers != list(range(1, page_count + 1)):
+            return None
+        return [page_text.strip() for page_text in parts[2::2]]
+    
+    def _transcribe_with_context(self, image, last_question_number, last_subproblem, page_num=None) -> str:
+        """Transcribe a page with the previous page's last question number and subproblem in the prompt.
+        
+        Args:
+            image: Rendered page
+            last_question_number: Last main question number of the previous page
+            last_subproblem: Last subproblem of the previous page
+            page_num: 1-based page number of an image rendered by iter_images(), which may be
+                escalated to high resolution; None for pages already rendered at high resolution
+        """
+        context_prompt = self._build_context_prompt(last_question_number, last_subproblem)
+        logger.debug("\n" + context_prompt + "\n")
+        full_prompt = PromptManager.get_answer_extraction_prompt() + "\n" + context_prompt
+        
+        text = self._generate(full_prompt, image, page_num, last_question_number, last_subproblem)
+
+        logger.info("\n" + str(text) + "\n")
+        return text
+    
+    def _generate(self, prompt, image, page_num=None, last_question_number=None, last_subproblem=None) -> str:
+        """Send a page to Gemini, re-sending it at high resolution if the low-resolution result looks unreliable.
+        
+        Args:
+            prompt: Extraction prompt
+            image: Rendered page
+            page_num: 1-based page number of an image rendered by iter_images(); None for
+                pages already rendered at high resolution
+            last_question_number: Last main question number before the page, for the validator check
+            last_subproblem: Last subproblem before the page, for the validator check
+        
+        Returns:
+            Transcribed text
+        """
+        low_resolution = page_num is not None and self.low_dpi is not None
+        text = self._send_segmented(prompt, image, low_resolution, page_num)
+        if not low_resolution:
+            return text
+        
+        reason = self._escalation_reason(text, image, last_question_number, last_subproblem)
+        if not reason:
+            return text
+        return self._escalate(prompt, page_num, reason) or text
+    
+    def _escalate(self, prompt, page_num, reason):
+        """Re-render a page at high resolution and transcribe it again.
+        
+        Args:
+            prompt: Extraction prompt for the page
+            page_num: 1-based page number
+            reason: Why the low-resolution transcription was rejected, for logging
+        
+        Returns:
+            Transcribed text, or None if the page cannot be rendered
+        """
+        high_image = self.render_image(page_num, self.dpi)
+        if high_image is not None:
+            high_image = self.subtract_template(page_num, high_image)
+        if high_image is None:
+            return None
+        high_image = self.preprocess(high_image)
+        
+        logger.info(f"Re-sending page {page_num} of {self.pdf_path} at {self.dpi} DPI: {reason}")
+        resolution_stats.record_escalation()
+        return self._send_segmented(prompt, high_image, False, page_num)
+    
+    def _send_segmented(self, prompt, image, low_resolution: bool, page_num=None) -> str:
+        """Send a page to Gemini, cut into blocks transcribed concurrently if segmentation is enabled.
+        
+        The first block gets the page prompt with its previous-page context; the blocks
+        below it are transcribed without context and stitched to the block above.
+        
+        Args:
+            prompt: Extraction prompt for the page
+            image: Rendered page
+            low_resolution: Whether the page was rendered at the low resolution tier
+            page_num: Optional 1-based page number, so re-queries reuse the encoded page
+        
+        Returns:
+            Transcribed text of the page
+        """
+        blocks = split_page(image, self.max_segments)
+        if len(blocks) == 1:
+            return self._send(prompt, image, low_resolution, page_num)
+        
+        segment_prompt = PromptManager.get_answer_extraction_prompt() + "\n" + PromptManager.get_answer_segment_note()
+        executor = governor.executor(GEMINI_SEGMENTS)
+        futures = [executor.submit(self._send, segment_prompt, block, low_resolution, page_num, index)
+                   for index, block in enumerate(blocks[1:], start=1)]
+        texts = [self._send(prompt, blocks[0], low_resolution, page_num)] + [future.result() for future in futures]
+        logger.debug(f"Transcribed page of {self.pdf_path} as {len(blocks)} blocks")
+        return self._join_segments(texts)
+    
+    def _send(self, prompt, image, low_resolution: bool, page_num=None, block: int = 0) -> str:
+        """Encode an image, send it to Gemini and count the call in the resolution statistics."""
+        payload, mime_type = self.encode_page(image, page_num, block)
+        text = self.gemini_api.generate_content(prompt, payload, mime_type=mime_type)
+        resolution_stats.record(self.resolution_tier(low_resolution), payload)
+        return text
+    
+    def _escalation_reason(self, text, image, last_question_number, last_subproblem):
+        """Check whether a low-resolution transcription looks unreliable.
+        
+        Returns:
+            Reason to re-send the page at high resolution, or None if the transcription looks complete
+        """
+        detector = BlankPageDetector()
+        ink = detector.measure(image)
+        ink_percent = ink['ink_coverage'] * 100
+        if not text or '題號' not in text:
+            # Pages without ink legitimately have no answers
+            return None if detector.is_blank(ink) else "no 題號 markers in the response"
+        if len(text.strip()) < ink_percent * MIN_CHARS_PER_INK_PERCENT:
+            return f"{len(text.strip())} characters is too short for {ink_percent:.1f}% ink coverage"
+        if last_question_number and self.validator.would_correct(text, last_question_number, last_subproblem):
+            return "the validator would correct its question numbers"
+        return None
+    
+    def _build_context_prompt(self, last_question_number, last_subproblem) -> str:
+        """Build the prompt note about the question number the previous page ended with."""
+        context_prompt = ""
+        if last_question_number:
+            context_prompt = f"Note: The previous page contained answers for question {last_question_number}"
+            if last_subproblem:
+                context_prompt += f"{last_subproblem}"
+            context_prompt += ". "
+            context_prompt += f"If you see a lone subproblem letter (e.g., 'a', 'b', 'c') without a question number, "
+            context_prompt += f"it likely belongs to question {last_question_number}"
+            if last_subproblem:
+                context_prompt += f"{last_subproblem}"
+            context_prompt += ". "
+            context_prompt += f"If the page begins with text without a question number and subproblem letter,"
+            context_prompt += f"treat it as a continuation of question {last_question_number}"
+            if last_subproblem:
+                context_prompt += f"{last_subproblem}"
+            context_prompt += f" and format it as 題號：{last_question_number}"
+            if last_subproblem:
+                context_prompt += f"{last_subproblem}"
+            context_prompt += "（續）. "
+            context_prompt += f"IMPORTANT: This page may contain BOTH continuation text at the top from question {last_question_number}"
+            if last_subproblem:
+                context_prompt += f"{last_subproblem}"
+            context_prompt += f" AND answers for new questions."
+        return context_prompt
+    
+    def _continuation_marker(self) -> str:
+        """Build the continuation marker for the last question number and subproblem."""
+        continuation_marker = f"題號：{self.last_question_number}"
+        if self.last_subproblem:
+            continuation_marker += f"{self.last_subproblem}"
+        continuation_marker += "（續）"
+        return continuation_marker
+    
+    def _join_segments(self, texts) -> str:
+        """Join the transcriptions of the blocks of a page in order.
+        
+        A block starting with the unnumbered 題號：（續） marker continues the last answer
+        of the block above it, so the marker is dropped and its text appended there.
+        """
+        joined = []
+        for text in texts:
+            if not text:
+                continue
+            if joined:
+                text = re.sub(r'^\s*題號：（續）\s*', '', text, count=1)
+            joined.append(text.strip())
+        return "\n".join(joined)
+    
+    def _resolve_unnumbered_continuation(self, text: str) -> str:
+        """Replace the unnumbered 題號：（續） marker emitted in parallel mode with the last question."""
+        if not self.last_question_number:
+            return text
+        return re.sub(r'^(\s*)題號：（續）', lambda m: m.group(1) + self._continuation_marker(), text, count=1)
+    
+    def _process_page_text(self, text: str) -> str:
+        """Add missing continuation markers, validate question numbers and update the last reference.
+        
+        Args:
+            text: Raw transcription of a single page
+            
+        Returns:
+            Corrected page text
+        """
+        # If no question number is found in the response and we have last_question_number,
+        # it might mean the model missed the continuation - add a simple check
+        if self.last_question_number and not re.search(r'題號：', text[:500]):
+            # Add continuity marker if the model didn't add one
+            text = f"{self._continuation_marker()}\n" + text
+        
+        # Validate and correct question numbers in the text
+        self.validator.update_last_reference(self.last_question_number, self.last_subproblem)
+        text = self.validator.validate_and_correct(text)
+        
+        # Update last question number and subproblem based on the response
+        # Only look for main question numbers (not continuations)
+        question_matches = re.finditer(r'題號：(\d+)((?:\([a-zA-Z]\)|\([a-zA-Z]\)\*\*|[a-zA-Z]|\*\*|[a-zA-Z]\*\*|))(?!（續）)', text)
+        for match in question_matches:
+            self.last_question_number = match.group(1)
+            self.last_subproblem = match.group(2) if match.group(2) else None
+            logger.debug(f"Last question number: {self.last_question_number}, Last subproblem: {self.last_subproblem}")
+        
+        return text
@@ -1,28 +1,71 @@
 """Base class for PDF extraction functionality."""
 
 import os
+import json
 import logging
-import fitz  # PyMuPDF
+import threading
+from collections import deque
+from contextlib import contextmanager
 from PIL import Image
-import io
-from typing import List
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
 
 from examgrader.api.gemini import GeminiAPI
+from examgrader.api.governor import governor, GEMINI_EXTRACTION
+from examgrader.utils.blank_page import BlankPageDetector
+from examgrader.utils.image_utils import encode_image
+from examgrader.utils.page_hash import TemplatePageIndex
+from examgrader.utils.preprocess import PagePreprocessor
+from examgrader.utils.template_subtraction import TemplateSubtractor
+from examgrader.utils.page_range import SharedPDF, PDFPageRange
 
 logger = logging.getLogger(__name__)
 
 class BasePDFExtractor:
     """Base class for PDF extraction functionality"""
     
-    def __init__(self, pdf_path: str, gemini_api: GeminiAPI):
+    def __init__(self, pdf_path: Union[str, PDFPageRange], gemini_api: GeminiAPI, image_format: Optional[str] = None,
+                 image_quality: int = 90, blank_detector: Optional[BlankPageDetector] = None,
+                 template_index: Optional[TemplatePageIndex] = None,
+                 template_subtractor: Optional[TemplateSubtractor] = None, dpi: int = 300,
+                 low_dpi: Optional[int] = None, preprocessor: Optional[PagePreprocessor] = None):
         """Initialize the PDF extractor.
         
         Args:
-            pdf_path: Path to the PDF file
+            pdf_path: Path to the PDF file, or a page-range view of a shared PDF
             gemini_api: Initialized GeminiAPI instance
+            image_format: Optional format (JPEG, PNG, WEBP) to pre-encode pages in before
+                sending them to the API; None sends PIL Images and lets the SDK encode them
+            image_quality: Encoder quality for lossy image formats
+            blank_detector: Optional detector of blank pages, which are then skipped instead of sent to the API
+            template_index: Optional index of pre-printed template pages, which are then skipped and
+                learned from the pages of this PDF
+            template_subtractor: Optional blank answer sheet template; pages are then cropped to
+                the handwriting added to it before they are sent to the API
+            dpi: Resolution pages are rendered at for the API
+            low_dpi: Optional lower resolution pages are first rendered at in grayscale; pages
+                whose transcription looks unreliable are then re-sent at dpi. Pages are
+                pre-encoded as JPEG unless image_format is set, so payload sizes are known
+            preprocessor: Optional cleanup (deskew, margin crop, grayscale, ...) run on pages
+                before they are sent to the API
         """
+        if isinstance(pdf_path, PDFPageRange):
+            self.page_range = pdf_path
+            pdf_path = str(pdf_path.path)
+        else:
+            self.page_range = None
         self.pdf_path = pdf_path
         self.gemini_api = gemini_api
+        self.image_format = image_format or ('JPEG' if low_dpi else None)
+        self.image_quality = image_quality
+        self.blank_detector = blank_detector
+        self.template_index = template_index
+        self.template_subtractor = template_subtractor
+        self.dpi = dpi
+        self.low_dpi = low_dpi
+        self.preprocessor = preprocessor
+        self.skipped_pages = []  # Blank and template pages skipped, with the reason
+        self._encoded_pages = {}  # (page number, block, size, mode) -> (bytes, MIME type), see encode_page()
+        self._encoded_lock = threading.Lock()
         
         # Create debug directory relative to the PDF file
         pdf_dir = os.path.dirname(os.path.abspath(pdf_path))
@@ -30,9 +73,300 @@ class BasePDFExtractor:
         self.debug_dir = os.path.join(pdf_dir, "debug_images", pdf_name)
         os.makedirs(self.debug_dir, exist_ok=True)
     
+    @contextmanager
+    def _open_pages(self) -> Iterator[PDFPageRange]:
+        """Open the pages to extract as a page-range view.
+        
+        A view passed to the constructor is used as-is; a path is opened for
+        the duration of the block.
+        """
+        if self.page_range:
+            yield self.page_range
+            return
+        with SharedPDF(self.pdf_path) as pdf_document:
+            yield pdf_document.view(0, pdf_document.page_count - 1)
+    
+    def page_count(self) -> int:
+        """Return the number of pages in the PDF without rendering them.
+        
+        Returns:
+            Number of pages, or 0 if the PDF cannot be opened
+        """
+        try:
+            with self._open_pages() as pages:
+                return pages.page_count
+        except Exception as e:
+            logger.error(f"Error opening PDF {self.pdf_path}: {e}")
+            return 0
+    
+    def iter_images(self, dpi: int = 300) -> Iterator[Tuple[int, Image.Image]]:
+        """Render PDF pages to PIL Images one at a time.
+        
+        Only the page currently being processed is held in memory, so peak
+        memory stays bounded regardless of the number of pages in the PDF.
+        
+        Args:
+            dpi: Resolution for page rendering
+            
+        Yields:
+            Tuples of (1-based page number, PIL Image)
+            
+        Raises:
+            Exception: If the PDF cannot be opened or a page cannot be rendered, so
+                callers never mistake a truncated page sequence for the whole PDF
+        """
+        try:
+            with self._open_pages() as pages:
+                for page_num in range(1, pages.page_count + 1):
+                    image = pages.render(page_num, dpi)
+                    
+                    # Save debug image
+                    debug_path = os.path.join(
+                        self.debug_dir,
+                        f"page_{page_num}.jpg"
+                    )
+                    image.save(debug_path, "JPEG")
+                    logger.debug(f"Saved debug image to {debug_path}")
+                    
+                    yield page_num, image
+                    
+                    # Release the page before rendering the next one
+                    image.close()
+                    del image
+                    
+        except Exception as e:
+            logger.error(f"Error converting PDF {self.pdf_path} to images: {e}")
+            raise
+    
+    def render_image(self, page_num: int, dpi: int = 300) -> Optional[Image.Image]:
+        """Render a single PDF page, e.g. to re-query it after iter_images() moved on.
+        
+        Args:
+            page_num: 1-based page number
+            dpi: Resolution for page rendering
+            
+        Returns:
+            PIL Image, or None if the page cannot be rendered
+        """
+        try:
+            with self._open_pages() as pages:
+                return pages.render(page_num, dpi)
+        except Exception as e:
+            logger.error(f"Error rendering page {page_num} of {self.pdf_path}: {e}")
+            return None
+    
+    def map_pages(self, func: Callable[[int, Image.Image], Any], max_workers: int = 1,
+                  dpi: int = 300) -> Iterator[Tuple[int, Any]]:
+        """Apply a function to every rendered page with bounded concurrency.
+        
+        Pages are rendered lazily and at most max_workers pages of this PDF are in
+        flight at once, so memory stays bounded. The work runs on the governor's
+        shared Gemini executor. Results are yielded in page order.
+        
+        Args:
+            func: Function called as func(page_num, image) for each page
+            max_workers: Maximum number of pages processed concurrently
+            dpi: Resolution for page rendering
+            
+        Yields:
+            Tuples of (1-based page number, func result)
+        """
+        if max_workers <= 1:
+            for page_num, image in self.iter_images(dpi):
+                yield page_num, func(page_num, image)
+            return
+        
+        executor = governor.executor(GEMINI_EXTRACTION)
+        pending = deque()
+        for page_num, image in self.iter_images(dpi):
+            # iter_images releases each image after yielding it, so workers get a copy
+            pending.append((page_num, executor.submit(func, page_num, image.copy())))
+            if len(pending) >= max_workers:
+                done_page, future = pending.popleft()
+                yield done_page, future.result()
+        
+        while pending:
+            done_page, future = pending.popleft()
+            yield done_page, future.result()
+    
+    def prepare_page(self, page_num: int, image: Image.Image) -> Optional[Image.Image]:
+        """Skip or preprocess a rendered page before it is sent to the API.
+        
+        Args:
+            page_num: 1-based page number
+            image: Rendered page image
+            
+        Returns:
+            Image to send, or None if the page is skipped
+        """
+        if self.should_skip_page(page_num, image):
+            return None
+        image = self.subtract_template(page_num, image)
+        if image is None:
+            return None
+        image = self.preprocess(image)
+        if self.low_dpi:
+            image = image.convert('L')
+        return image
+    
+    def preprocess(self, image: Image.Image) -> Image.Image:
+        """Run the page preprocessor on an image, if one is set.
+        
+        Args:
+            image: Rendered page image
+            
+        Returns:
+            Preprocessed image, or the image itself without a preprocessor
+        """
+        if not self.preprocessor:
+            return image
+        return self.preprocessor.apply(image)
+    
+    @property
+    def first_pass_dpi(self) -> int:
+        """Resolution pages are first rendered at: low_dpi in adaptive mode, otherwise dpi."""
+        return self.low_dpi or self.dpi
+    
+    def resolution_tier(self, low: bool) -> str:
+        """Label of a resolution tier for statistics and logging."""
+        return f"{self.low_dpi} DPI gray" if low else f"{self.dpi} DPI"
+    
+    def subtract_template(self, page_num: int, image: Image.Image) -> Optional[Image.Image]:
+        """Crop a page to the handwriting added to the answer sheet template, if one is set.
+        
+        Args:
+            page_num: 1-based page number
+            image: Rendered page image
+            
+        Returns:
+            Cropped image, the image itself without a template, or None if the page holds no handwriting
+        """
+        if not self.template_subtractor:
+            return image
+        cropped = self.template_subtractor.apply(page_num, image)
+        if cropped is None:
+            logger.info(f"Skipping page {page_num} of {self.pdf_path}, it adds no handwriting to the template")
+            self.skipped_pages.append({'page': page_num, 'reason': 'no handwriting'})
+        elif cropped is not image:
+            logger.debug(f"Cropped page {page_num} to its handwriting: {image.size} -> {cropped.size}")
+        return cropped
+    
+    def should_skip_page(self, page_num: int, image: Image.Image) -> bool:
+        """Check whether a page is blank or a pre-printed template page and need not be sent to the API.
+        
+        Args:
+            page_num: 1-based page number
+            image: Rendered page image
+            
+        Returns:
+            True if the page should be skipped
+        """
+        return self.is_blank_page(page_num, image) or self.is_template_page(page_num, image)
+    
+    def is_template_page(self, page_num: int, image: Image.Image) -> bool:
+        """Check whether a page matches a template page, recording it if so.
+        
+        Pages that match no template are added to what the index learns from.
+        
+        Args:
+            page_num: 1-based page number
+            image: Rendered page image
+            
+        Returns:
+            True if a template index is set and the page matches one of its templates
+        """
+        if not self.template_index:
+            return False
+        signature = self.template_index.signature(image)
+        template = self.template_index.match(signature)
+        if not template:
+            self.template_index.observe(signature, str(self.pdf_path))
+            return False
+        
+        logger.info(f"Skipping page {page_num} of {self.pdf_path}, it matches template {template}")
+        self.skipped_pages.append({'page': page_num, 'reason': 'template', 'template': template})
+        return True
+    
+    def is_blank_page(self, page_num: int, image: Image.Image) -> bool:
+        """Check whether a page is blank and should be skipped, recording it if so.
+        
+        Args:
+            page_num: 1-based page number
+            image: Rendered page image
+            
+        Returns:
+            True if a blank detector is set and classifies the page as blank
+        """
+        if not self.blank_detector:
+            return False
+        stats = self.blank_detector.measure(image)
+        if not self.blank_detector.is_blank(stats):
+            return False
+        
+        logger.info(f"Skipping blank page {page_num} of {self.pdf_path} "
+                    f"(ink coverage {stats['ink_coverage']:.4%}, std {stats['std']:.1f})")
+        self.skipped_pages.append({'page': page_num, 'reason': 'blank', **stats})
+        return True
+    
+    def save_skipped_pages(self) -> Optional[str]:
+        """Write the pages skipped so far to the debug directory for auditing.
+        
+        Returns:
+            Path to the written JSON file, or None if no page was skipped
+        """
+        if not self.skipped_pages:
+            return None
+        skipped_path = os.path.join(self.debug_dir, "skipped_pages.json")
+        with open(skipped_path, 'w', encoding='utf-8') as f:
+            json.dump(sorted(self.skipped_pages, key=lambda page: page['page']), f, indent=2)
+        logger.debug(f"Saved {len(self.skipped_pages)} skipped pages to {skipped_path}")
+        return skipped_path
+    
+    def encode_page(self, image: Image.Image, page_num: Optional[int] = None,
+                    block: int = 0) -> Tuple[Union[Image.Image, bytes], Optional[str]]:
+        """Prepare a rendered page for the Gemini API.
+        
+        With a page number, the encoded bytes are kept until release_encoded_page() so
+        re-queries of the page send the same bytes without encoding it again.
+        Retries of a request always reuse its bytes.
+        
+        Args:
+            image: Rendered page image
+            page_num: Optional 1-based page number, keying the reuse of the encoding
+            block: Index of the block of a page cut into blocks
+            
+        Returns:
+            Tuple of (image payload, MIME type). The payload is the encoded bytes when
+            image_format is set, otherwise the PIL Image itself with a MIME type of None.
+        """
+        if not self.image_format:
+            return image, None
+        if page_num is None:
+            return encode_image(image, self.image_format, self.image_quality)
+        
+        # Pages of another resolution tier or preprocessing have another size or mode
+        key = (page_num, block, image.size, image.mode)
+        with self._encoded_lock:
+            encoded = self._encoded_pages.get(key)
+        if encoded is not None:
+            logger.debug(f"Reusing encoded page {page_num} of {self.pdf_path}")
+            return encoded
+        encoded = encode_image(image, self.image_format, self.image_quality)
+        with self._encoded_lock:
+            self._encoded_pages[key] = encoded
+        return encoded
+    
+    def release_encoded_page(self, page_num: int) -> None:
+        """Drop the encodings of a page kept by encode_page() once the page is done."""
+        with self._encoded_lock:
+            for key in [key for key in self._encoded_pages if key[0] == page_num]:
+                del self._encoded_pages[key]
+    
     def pdf_to_images(self, dpi: int = 300) -> List[Image.Image]:
         """Convert PDF pages to PIL Images.
         
+        Materializes every page at once; prefer iter_images() for large PDFs.
+        
         Args:
             dpi: Resolution for page rendering
             
@@ -40,33 +374,7 @@ class BasePDFExtractor:
             List of PIL Image objects
         """
         images = []
-        pdf_document = None
-        
-        try:
-            pdf_document = fitz.open(self.pdf_path)
-            zoom = dpi / 72
-            
-            for page_num in range(pdf_document.page_count):
-                page = pdf_document[page_num]
-                matrix = fitz.Matrix(zoom, zoom).prerotate(page.rotation or 0)
-                pix = page.get_pixmap(matrix=matrix, alpha=False)
-                img_data = pix.tobytes("jpeg")
-                image = Image.open(io.BytesIO(img_data)).convert('RGB')
-                
-                # Save debug image
-                debug_path = os.path.join(
-                    self.debug_dir,
-                    f"page_{page_num + 1}.jpg"
-                )
-                image.save(debug_path, "JPEG")
-                logger.debug(f"Saved debug image to {debug_path}")
-                
-                images.append(image)
-                    
-        except Exception as e:
-            logger.error(f"Error converting PDF {self.pdf_path} to images: {e}")
-            return []
-        finally:
-            if pdf_document:
-                pdf_document.close()
+        for _, image in self.iter_images(dpi):
+            # iter_images closes each image after yielding it, so keep a copy
+            images.append(image.copy())
         return images
@@ -1,7 +1,10 @@
 """Module for extracting questions from PDF files."""
 
 import logging
+from typing import Union
+from PIL import Image
 from examgrader.extractors.base import BasePDFExtractor
+from examgrader.utils.page_range import PDFPageRange
 from examgrader.utils.prompts import PromptManager
 
 logger = logging.getLogger(__name__)
@@ -9,21 +12,40 @@ logger = logging.getLogger(__name__)
 class QuestionExtractor(BasePDFExtractor):
     """Extracts questions from PDF files"""
     
+    def __init__(self, pdf_path: Union[str, PDFPageRange], gemini_api, max_workers: int = 4, **kwargs):
+        """Initialize the question extractor.
+        
+        Args:
+            pdf_path: Path to the PDF file, or a page-range view of a shared PDF
+            gemini_api: Initialized GeminiAPI instance
+            max_workers: Maximum number of pages transcribed concurrently
+            **kwargs: Rendering options forwarded to BasePDFExtractor
+        """
+        super().__init__(pdf_path, gemini_api, **kwargs)
+        self.max_workers = max_workers
+    
     def extract(self) -> str:
         """Extract questions from PDF pages.
         
+        Question pages have no cross-page context, so they are transcribed
+        concurrently and concatenated in page order.
+        
         Returns:
             Concatenated string of all extracted questions
         """
-        images = self.pdf_to_images()
+        total_pages = self.page_count()
         all_text = ""
         
-        for page_num, image in enumerate(images, 1):
-            logger.info(f"Processing page {page_num}/{len(images)} for questions")
-            text = self.gemini_api.generate_content(
+        def extract_page(page_num: int, image: Image.Image) -> str:
+            logger.info(f"Processing page {page_num}/{total_pages} for questions")
+            payload, mime_type = self.encode_page(image)
+            return self.gemini_api.generate_content(
                 PromptManager.get_question_extraction_prompt(), 
-                image
+                payload,
+                mime_type=mime_type
             )
+        
+        for page_num, text in self.map_pages(extract_page, max_workers=self.max_workers):
             if text:
                 all_text += text + "\n"
                 
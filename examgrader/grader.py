@@ -1,29 +1,53 @@
 """Module for grading exam answers."""
 
+import asyncio
 import logging
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import re
-from concurrent.futures import ThreadPoolExecutor
 import threading
 from collections import defaultdict
 
 from examgrader.api.openai import OpenAIAPI
+from examgrader.api.governor import governor, OPENAI_GRADING
 from examgrader.utils.prompts import PromptManager
 
 logger = logging.getLogger(__name__)
 
+def build_subproblem_map(questions: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Map each parent question number to its subproblem question numbers.
+    
+    Args:
+        questions: Dictionary of all questions
+        
+    Returns:
+        Dictionary mapping parent question numbers to their subproblems, e.g. {'2': ['2a', '2b']}
+    """
+    subproblem_map = {}
+    for q_num in questions:
+        subproblems = [key for key in questions
+                       if key.startswith(q_num) and len(key) > len(q_num) and key[len(q_num)].isalpha()]
+        if subproblems:
+            subproblem_map[q_num] = subproblems
+    return subproblem_map
+
 class ExamGrader:
     """Handles exam grading using OpenAI API"""
     
-    def __init__(self, openai_api, max_workers=None):
+    def __init__(self, openai_api, subproblem_map: Optional[Dict[str, List[str]]] = None,
+                 prompt_segments: Optional[Dict[str, Dict[str, Any]]] = None):
         """Initialize the exam grader.
         
+        Grading concurrency is limited by the OPENAI_GRADING lane of the concurrency governor.
+        
         Args:
             openai_api: Initialized OpenAIAPI instance
-            max_workers: Maximum number of worker threads for parallel processing (default: None)
+            subproblem_map: Optional precomputed result of build_subproblem_map() for the questions
+            prompt_segments: Optional pre-rendered grading prompt segments by question number,
+                as produced by PromptManager.get_grading_prompt_segments()
         """
         self.openai_api = openai_api
-        self.max_workers = max_workers
+        self.subproblem_map = subproblem_map
+        self.prompt_segments = prompt_segments or {}
         self._score_lock = threading.Lock()  # Only need lock for accumulating total scores
     
     def _is_parent_question(self, q_num: str, questions: Dict[str, Dict[str, Any]]) -> bool:
@@ -36,6 +60,9 @@ class ExamGrader:
         Returns:
             bool: True if the question has subproblems, False otherwise
         """
+        if self.subproblem_map is not None:
+            return q_num in self.subproblem_map
+        
         # Check if there are any questions that start with this q_num followed by a letter
         return any(key.startswith(q_num) and len(key) > len(q_num) and key[len(q_num)].isalpha() 
                   for key in questions.keys())
@@ -72,13 +99,38 @@ class ExamGrader:
         Raises:
             Exception: If API call fails or response parsing fails
         """
-        response = self.openai_api.call_api(
-            system_prompt=PromptManager.get_grader_system_prompt(),
-            user_prompt=prompt,
-            model_name="o4-mini"
-        )
+        response = self.openai_api.call_api(**self._grading_call(prompt))
+        return self._parse_grading_response(response)
+
+    async def _grade_single_answer_async(self, prompt: str) -> Tuple[int, str]:
+        """Grade a single answer using the async OpenAI client.
+        
+        Args:
+            prompt: The grading prompt containing question, answer, and rubric
+            
+        Returns:
+            Tuple of (score, reason)
+        """
+        response = await self.openai_api.call_api_async(**self._grading_call(prompt))
+        return self._parse_grading_response(response)
+
+    @staticmethod
+    def _grading_call(prompt: str) -> Dict[str, Any]:
+        """Build the OpenAI API call arguments of a grading prompt."""
+        return {
+            'system_prompt': PromptManager.get_grader_system_prompt(),
+            'user_prompt': prompt,
+            'model_name': "o4-mini",
+            'use_cache': False,  # Grading rounds rely on fresh responses
+            'lane': OPENAI_GRADING,
+        }
+
+    def _parse_grading_response(self, response: str) -> Tuple[int, str]:
+        """Extract the score and reason from a grading response.
         
-        # Parse the response
+        Raises:
+            ValueError: If the response does not contain a score and a reason
+        """
         score_match = re.search(r'得分：(\d+)', response)
         reason_match = re.search(r'理由：([\s\S]*?)(?=\n\n|$)', response)
         
@@ -112,69 +164,121 @@ class ExamGrader:
             Tuple of (earned score, max score)
         """
         try:
-            # Skip if this is a parent question with subproblems - we'll grade those individually
-            if self._is_parent_question(q_num, questions) and not processed_parents.get(q_num, False):
-                processed_parents[q_num] = True
-                logger.debug(f"Question {q_num} has subproblems, grading those individually")
-                return 0, 0
-                
-            max_score = float(question_data['score'])
-            
-            # Check if we have both correct and student answers
-            if q_num not in correct_answers or q_num not in student_answers:
-                logger.warning(f"Missing {'correct' if q_num not in correct_answers else 'student'} answer for question {q_num}")
-                results[q_num] = {
-                    'score': 0,
-                    'max_score': max_score,
-                    'reason': f"Missing {'correct' if q_num not in correct_answers else 'student'} answer",
-                    'question': question_data['text'],
-                }
-                
-                # Format answers with tables and figures if available
-                results[q_num]['correct_answer'] = self._format_answer_with_media(correct_answers.get(q_num, {}))
-                results[q_num]['student_answer'] = self._format_answer_with_media(student_answers.get(q_num, {}))
-                results[q_num]['rubric'] = question_data.get('rubric', 'No rubric available')
-                return 0, max_score
-                
-            # Generate grading prompt
-            prompt = PromptManager.get_grading_prompt(
-                question_data, correct_answers[q_num], student_answers[q_num]
-            )
+            prompt, ungraded = self._question_prompt(q_num, question_data, questions, correct_answers,
+                                                     student_answers, results, processed_parents)
+            if prompt is None:
+                return ungraded
                     
             # Call API to grade
             score, reason = self._grade_single_answer(prompt)
+            return self._record_grade(results, q_num, question_data, correct_answers, student_answers, score, reason)
             
-            # Ensure score doesn't exceed max
-            score = min(score, max_score)
+        except Exception as e:
+            return self._record_error(results, q_num, question_data, correct_answers, student_answers, e)
+
+    async def _grade_question_async(self, q_num: str, question_data: Dict[str, Any],
+                                    questions: Dict[str, Dict[str, Any]],
+                                    correct_answers: Dict[str, Dict[str, Any]],
+                                    student_answers: Dict[str, Dict[str, Any]],
+                                    results: Dict[str, Any],
+                                    processed_parents: Dict[str, bool]) -> Tuple[float, float]:
+        """Grade a single question using the async OpenAI client.
+        
+        Same arguments and results as _grade_question().
+        """
+        try:
+            prompt, ungraded = self._question_prompt(q_num, question_data, questions, correct_answers,
+                                                     student_answers, results, processed_parents)
+            if prompt is None:
+                return ungraded
             
-            # Store results
-            results[q_num] = {
-                'score': score,
-                'max_score': max_score,
-                'reason': reason,
-                'question': question_data['text'],
-            }
+            score, reason = await self._grade_single_answer_async(prompt)
+            return self._record_grade(results, q_num, question_data, correct_answers, student_answers, score, reason)
             
-            # Format answers with tables and figures if available
-            results[q_num]['correct_answer'] = self._format_answer_with_media(correct_answers.get(q_num, {}))
-            results[q_num]['student_answer'] = self._format_answer_with_media(student_answers.get(q_num, {}))
-            results[q_num]['rubric'] = question_data.get('rubric', 'No rubric available')
+        except Exception as e:
+            return self._record_error(results, q_num, question_data, correct_answers, student_answers, e)
+
+    def _question_prompt(self, q_num: str, question_data: Dict[str, Any],
+                         questions: Dict[str, Dict[str, Any]],
+                         correct_answers: Dict[str, Dict[str, Any]],
+                         student_answers: Dict[str, Dict[str, Any]],
+                         results: Dict[str, Any],
+                         processed_parents: Dict[str, bool]) -> Tuple[Optional[str], Tuple[float, float]]:
+        """Build the grading prompt of a question, or settle questions that are not sent for grading.
+        
+        Same arguments as _grade_question().
+        
+        Returns:
+            Tuple of (grading prompt, or None if the question is not graded by the API;
+            (earned score, max score) of a question that is not)
+        """
+        # Skip if this is a parent question with subproblems - we'll grade those individually
+        if self._is_parent_question(q_num, questions) and not processed_parents.get(q_num, False):
+            processed_parents[q_num] = True
+            logger.debug(f"Question {q_num} has subproblems, grading those individually")
+            return None, (0, 0)
             
-            logger.debug(f"Question {q_num}: {score}/{max_score} - {reason}")
-            return score, max_score
+        max_score = float(question_data['score'])
+        
+        # Check if we have both correct and student answers
+        if q_num not in correct_answers or q_num not in student_answers:
+            logger.warning(f"Missing {'correct' if q_num not in correct_answers else 'student'} answer for question {q_num}")
+            self._record_result(results, q_num, question_data, correct_answers, student_answers, 0, max_score,
+                                f"Missing {'correct' if q_num not in correct_answers else 'student'} answer")
+            return None, (0, max_score)
             
-        except Exception as e:
-            logger.error(f"Error grading question {q_num}: {e}")
-            results[q_num] = {
-                'score': 0,
-                'max_score': float(question_data['score']),
-                'reason': f"Error grading question: {str(e)}",
-                'question': question_data['text'],
-                'correct_answer': self._format_answer_with_media(correct_answers.get(q_num, {})),
-                'student_answer': self._format_answer_with_media(student_answers.get(q_num, {})),
-                'rubric': question_data.get('rubric', 'No rubric available')
-            }
-            return 0, float(question_data['score'])
+        # Generate grading prompt
+        prompt = PromptManager.get_grading_prompt(
+            question_data, correct_answers[q_num], student_answers[q_num],
+            segments=self.prompt_segments.get(q_num)
+        )
+        return prompt, (0, max_score)
+
+    def _record_grade(self, results: Dict[str, Any], q_num: str, question_data: Dict[str, Any],
+                      correct_answers: Dict[str, Dict[str, Any]], student_answers: Dict[str, Dict[str, Any]],
+                      score: float, reason: str) -> Tuple[float, float]:
+        """Store the API grade of a question, capped at its max score.
+        
+        Returns:
+            Tuple of (earned score, max score)
+        """
+        max_score = float(question_data['score'])
+        
+        # Ensure score doesn't exceed max
+        score = min(score, max_score)
+        
+        # Store results
+        self._record_result(results, q_num, question_data, correct_answers, student_answers, score, max_score, reason)
+        
+        logger.debug(f"Question {q_num}: {score}/{max_score} - {reason}")
+        return score, max_score
+
+    def _record_error(self, results: Dict[str, Any], q_num: str, question_data: Dict[str, Any],
+                      correct_answers: Dict[str, Dict[str, Any]], student_answers: Dict[str, Dict[str, Any]],
+                      error: Exception) -> Tuple[float, float]:
+        """Store a zero score for a question whose grading failed.
+        
+        Returns:
+            Tuple of (earned score, max score)
+        """
+        logger.error(f"Error grading question {q_num}: {error}")
+        self._record_result(results, q_num, question_data, correct_answers, student_answers,
+                            0, float(question_data['score']), f"Error grading question: {str(error)}")
+        return 0, float(question_data['score'])
+
+    def _record_result(self, results: Dict[str, Any], q_num: str, question_data: Dict[str, Any],
+                       correct_answers: Dict[str, Dict[str, Any]], student_answers: Dict[str, Dict[str, Any]],
+                       score: float, max_score: float, reason: str) -> None:
+        """Store the grading result of a question, with answers formatted including tables and figures."""
+        results[q_num] = {
+            'score': score,
+            'max_score': max_score,
+            'reason': reason,
+            'question': question_data['text'],
+            'correct_answer': self._format_answer_with_media(correct_answers.get(q_num, {})),
+            'student_answer': self._format_answer_with_media(student_answers.get(q_num, {})),
+            'rubric': question_data.get('rubric', 'No rubric available'),
+        }
 
     def grade_exam(self, questions: Dict[str, Dict[str, Any]], 
                    correct_answers: Dict[str, Dict[str, Any]], 
@@ -197,24 +301,55 @@ class ExamGrader:
         # Sort questions to process in a predictable order
         sorted_questions = sorted(questions.items())
         
-        # Use ThreadPoolExecutor for parallel processing
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # Submit all grading tasks
-            future_to_question = {
-                executor.submit(
-                    self._grade_question,
-                    q_num, question_data, questions, correct_answers, 
-                    student_answers, results, processed_parents
-                ): q_num 
-                for q_num, question_data in sorted_questions
-            }
-            
-            # Collect results as they complete
-            for future in future_to_question:
-                score, max_score = future.result()
-                with self._score_lock:  # Still need lock for accumulating totals
-                    total_score += score
-                    max_possible_score += max_score
+        # Use the governor's shared grading executor for parallel processing
+        executor = governor.executor(OPENAI_GRADING)
+        
+        # Submit all grading tasks
+        future_to_question = {
+            executor.submit(
+                self._grade_question,
+                q_num, question_data, questions, correct_answers, 
+                student_answers, results, processed_parents
+            ): q_num 
+            for q_num, question_data in sorted_questions
+        }
+        
+        # Collect results as they complete
+        for future in future_to_question:
+            score, max_score = future.result()
+            with self._score_lock:  # Still need lock for accumulating totals
+                total_score += score
+                max_possible_score += max_score
+
+        logger.info(f"Total Score: {total_score}/{max_possible_score}")
+        return results, total_score, max_possible_score
+
+    async def grade_exam_async(self, questions: Dict[str, Dict[str, Any]],
+                               correct_answers: Dict[str, Dict[str, Any]],
+                               student_answers: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Any], float, float]:
+        """Grade exam answers concurrently on the running event loop.
+        
+        Requires an AsyncOpenAIAPI client. All questions are in flight at once,
+        bounded only by the OPENAI_GRADING lane of the concurrency governor.
+        
+        Args:
+            questions: Dictionary of question data including text, score, tables, and figures
+            correct_answers: Dictionary of correct answers with text, tables, and figures
+            student_answers: Dictionary of student answers with text, tables, and figures
+        
+        Returns:
+            Tuple of (results dict, total score, max possible score)
+        """
+        results = {}
+        processed_parents = {}
+        
+        scores = await asyncio.gather(*(
+            self._grade_question_async(q_num, question_data, questions, correct_answers,
+                                       student_answers, results, processed_parents)
+            for q_num, question_data in sorted(questions.items())
+        ))
+        total_score = sum(score for score, _ in scores)
+        max_possible_score = sum(max_score for _, max_score in scores)
 
         logger.info(f"Total Score: {total_score}/{max_possible_score}")
         return results, total_score, max_possible_score
@@ -1,20 +1,32 @@
 """Main entry point for the ExamGrader application."""
 
 import argparse
+import asyncio
 import logging
 import os
 from enum import Enum
 from dotenv import load_dotenv
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Tuple, Any, Union
 from concurrent.futures import ThreadPoolExecutor
 
-from examgrader.api.gemini import GeminiAPI
-from examgrader.api.openai import OpenAIAPI
+from examgrader.api.gemini import GeminiAPI, AsyncGeminiAPI
+from examgrader.api.openai import OpenAIAPI, AsyncOpenAIAPI
+from examgrader.api.cache import ResponseCache
+from examgrader.api.governor import governor, GEMINI_EXTRACTION, GEMINI_SEGMENTS, OPENAI_GRADING, OPENAI_RUBRIC
+from examgrader.api.rate_limiter import rate_limits, parse_rate_limits, rate_limits_from_env
 from examgrader.utils.parsers import parse_questions, parse_answers
+from examgrader.extractors.answers import resolution_stats, speculation_stats
 from examgrader.utils.jailbreak_detector import JailbreakDetector
-from examgrader.utils.pdf_partitioner import partition_multi_student_pdf
+from examgrader.utils.pdf_partitioner import partition_multi_student_pdf_views, iter_student_sections, iter_student_sections_by_stride, create_student_views
+from examgrader.utils.page_range import SharedPDF, PDFPageRange
+from examgrader.utils.blank_page import BlankPageDetector, DEFAULT_MAX_INK_COVERAGE, DEFAULT_MAX_STD
+from examgrader.utils.page_hash import template_pages, HASH_METHODS, DEFAULT_HASH_THRESHOLD, DEFAULT_MIN_STUDENTS
+from examgrader.utils.image_utils import IMAGE_MIME_TYPES
+from examgrader.utils.preprocess import PagePreprocessor, PREPROCESS_STEPS
+from examgrader.utils.template_subtraction import TemplateSubtractor
 from examgrader.grader import ExamGrader
+from examgrader.bundle import load_bundle
 
 logger = logging.getLogger(__name__)
 
@@ -25,17 +37,66 @@ class InputType(Enum):
     MULTI_STUDENT_PDF = 3
 
 
+def add_image_encoding_args(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the page encoding options, shared with the compile step so both encode pages, and key their cache entries, alike.
+    
+    Args:
+        parser: Argument parser to add the options to
+    """
+    parser.add_argument('--image-format', type=lambda value: None if value.lower() == 'none' else value.upper(),
+                       choices=[*IMAGE_MIME_TYPES, None], default='PNG',
+                       help='Format pages are encoded in once and reused across retries, re-queries and escalations: '
+                            'PNG (what the SDK sends), JPEG, WEBP, or none to let the SDK encode them on every request '
+                            '(default: PNG)')
+    parser.add_argument('--image-quality', type=int, default=90,
+                       help='Encoder quality (1-100) for JPEG and WEBP pages (default: 90)')
+
+
+def add_cache_args(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the response cache options, shared with the compile step.
+    
+    Args:
+        parser: Argument parser to add the options to
+    """
+    parser.add_argument('--cache-dir', type=str, default='.examgrader_cache',
+                       help='Directory for the on-disk API response cache (default: .examgrader_cache)')
+    parser.add_argument('--cache-size-mb', type=int, default=1024,
+                       help='Maximum size of the response cache in MB before least recently used entries are evicted (default: 1024)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Disable the API response cache')
+
+
+def response_cache(args) -> Optional[ResponseCache]:
+    """
+    Open the response cache configured on the command line.
+    
+    Args:
+        args: Command line arguments with the options of add_cache_args()
+        
+    Returns:
+        ResponseCache, or None with --no-cache
+    """
+    if args.no_cache:
+        return None
+    logger.info(f"Using API response cache in {args.cache_dir}")
+    return ResponseCache(args.cache_dir, max_bytes=args.cache_size_mb * 1024 * 1024)
+
+
 def parse_args():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description='Grade exam answers using AI')
     
     # Required arguments
-    parser.add_argument('-q', '--questions-file', required=True, 
-                       help='Path to the questions file')
-    parser.add_argument('-c', '--correct-answers-file', required=True, 
-                       help='Path to the correct answers file')
+    parser.add_argument('-q', '--questions-file', 
+                       help='Path to the questions file (required unless --bundle is given)')
+    parser.add_argument('-c', '--correct-answers-file', 
+                       help='Path to the correct answers file (required unless --bundle is given)')
     parser.add_argument('-s', '--student-answers-file', required=True, 
                        help='Path to student answers file or directory containing multiple PDF files')
+    parser.add_argument('-b', '--bundle', 
+                       help='Path to an exam bundle created by "run.py compile"; replaces -q and -c')
     
     # Optional arguments
     parser.add_argument('-o', '--output-file', 
@@ -43,7 +104,70 @@ def parse_args():
     parser.add_argument('-r', '--rounds', type=int, default=1, 
                        help='Number of grading rounds to run (default: 1)')
     parser.add_argument('-t', '--workers', type=int, default=12, 
-                       help='Number of worker threads for parallel processing (default: 12)')
+                       help='Number of students processed in parallel, and default for the API concurrency limits (default: 12)')
+    
+    # Process-wide API concurrency limits
+    parser.add_argument('--gemini-concurrency', type=int,
+                       help='Maximum concurrent Gemini extraction calls across all students (default: --workers)')
+    parser.add_argument('--grading-concurrency', type=int,
+                       help='Maximum concurrent OpenAI grading calls across all students (default: --workers)')
+    parser.add_argument('--rubric-concurrency', type=int,
+                       help='Maximum concurrent OpenAI rubric generation calls (default: --workers)')
+    parser.add_argument('--adaptive-concurrency', action='store_true',
+                       help='Adjust the concurrency limits at runtime: grow while calls succeed, halve on rate limit responses')
+    parser.add_argument('--max-concurrency', type=int,
+                       help='Maximum concurrency per lane in adaptive mode (default: four times the lane limit)')
+    parser.add_argument('--latency-target', type=float, default=60.0,
+                       help='Calls slower than this many seconds do not grow the adaptive limit (default: 60)')
+    
+    # Per-model request and token quotas
+    parser.add_argument('--rate-limit', action='append', default=[], metavar='MODEL=RPM:TPM',
+                       help='Requests and tokens per minute allowed for a model, e.g. o4-mini=500:200000; '
+                            'may be repeated and overrides EXAMGRADER_RATE_LIMITS in .env')
+    
+    parser.add_argument('--answer-extraction', choices=['serial', 'parallel', 'speculative'], default='serial',
+                       help='Answer extraction mode: serial passes each page the previous page\'s question number, '
+                            'parallel transcribes all pages at once and stitches continuations locally, '
+                            'speculative dispatches upcoming pages with a predicted question number (default: serial)')
+    parser.add_argument('--page-workers', type=int, default=4,
+                       help='Number of pages of one student transcribed concurrently in parallel and speculative modes (default: 4)')
+    parser.add_argument('--skip-blank-pages', action='store_true',
+                       help='Skip blank and near-blank student answer pages instead of sending them to Gemini')
+    parser.add_argument('--blank-max-coverage', type=float, default=DEFAULT_MAX_INK_COVERAGE,
+                       help=f'Largest fraction of ink pixels a page may have to count as blank (default: {DEFAULT_MAX_INK_COVERAGE})')
+    parser.add_argument('--blank-max-std', type=float, default=DEFAULT_MAX_STD,
+                       help=f'Largest gray level standard deviation a page may have to count as blank (default: {DEFAULT_MAX_STD})')
+    parser.add_argument('--skip-template-pages', action='store_true',
+                       help='Skip pre-printed pages that appear unchanged in every student PDF, matched by perceptual hash '
+                            'against the questions PDF and against pages learned across students')
+    parser.add_argument('--template-threshold', type=int, default=DEFAULT_HASH_THRESHOLD,
+                       help=f'Largest Hamming distance (of 256 bits) between a page and a template it matches (default: {DEFAULT_HASH_THRESHOLD})')
+    parser.add_argument('--template-min-students', type=int, default=DEFAULT_MIN_STUDENTS,
+                       help=f'Number of students a page must appear unchanged for to be learned as a template (default: {DEFAULT_MIN_STUDENTS})')
+    parser.add_argument('--template-hash', choices=HASH_METHODS, default='dhash',
+                       help='Perceptual hash used to match template pages (default: dhash)')
+    parser.add_argument('--answer-template',
+                       help='PDF of the blank answer sheet; student pages are aligned to it and cropped to the handwriting '
+                            'added to it before transcription')
+    parser.add_argument('--preprocess', metavar='STEPS',
+                       help=f"Comma-separated preprocessing steps run on answer pages before transcription, "
+                            f"any of: {', '.join(PREPROCESS_STEPS)}")
+    parser.add_argument('--max-long-edge', type=int,
+                       help='Downscale answer pages whose long edge is larger than this many pixels before transcription')
+    parser.add_argument('--max-segments', type=int, default=1,
+                       help='Cut answer pages into at most this many blocks at whitespace gaps and transcribe the blocks '
+                            'concurrently (default: 1, whole pages)')
+    parser.add_argument('--pages-per-call', type=int, default=1,
+                       help='Send this many consecutive answer pages in one Gemini request, for short submissions '
+                            '(default: 1)')
+    add_image_encoding_args(parser)
+    parser.add_argument('--adaptive-resolution', action='store_true',
+                       help='Send answer pages in grayscale at --low-dpi first and re-send them at full resolution only '
+                            'when the transcription looks unreliable')
+    parser.add_argument('--low-dpi', type=int, default=150,
+                       help='Resolution of the first pass with --adaptive-resolution (default: 150)')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                       help='Grade student PDFs on one asyncio event loop instead of one thread per call (not with --stream)')
     
     # API keys
     parser.add_argument('--gemini-api-key', 
@@ -54,6 +178,20 @@ def parse_args():
     # Multi-student PDF handling
     parser.add_argument('-m', '--split-multi-student-pdf', action='store_true',
                        help='Split a multi-student PDF into individual files')
+    parser.add_argument('--id-region', type=float, nargs=4, metavar=('X0', 'Y0', 'X1', 'Y1'),
+                       help='With -m, region of each student\'s first page holding the student ID and name, in PDF points '
+                            'from the top-left corner (default: 0 0 250 50)')
+    parser.add_argument('--id-batch-size', type=int, default=1,
+                       help='With -m, number of pages whose ID regions are tiled into one Gemini request (default: 1, no batching)')
+    parser.add_argument('--pages-per-student', type=int,
+                       help='With -m, expected number of pages per student; only the pages where student boundaries are expected are analyzed, '
+                            'with neighbouring pages scanned when a boundary shifts')
+    parser.add_argument('--export-split-pdfs', action='store_true',
+                       help='With -m, also write each student\'s pages to a split PDF (students are otherwise '
+                            'read from page ranges of the original PDF)')
+    parser.add_argument('--stream', action='store_true',
+                       help='With -m, start extracting and grading each student as soon as their pages are identified '
+                            'instead of after the whole PDF is partitioned')
     
     # Model configuration
     parser.add_argument('--gemini-model', type=str, 
@@ -63,13 +201,26 @@ def parse_args():
                        default="o4-mini",
                        help='OpenAI model to use (default: o4-mini)')
     
+    # Response cache
+    add_cache_args(parser)
+    
     # Debug and safety options
     parser.add_argument('--debug', action='store_true', 
                        help='Enable debug logging')
     parser.add_argument('--enable-jailbreak-check', action='store_true', 
                        help='Enable jailbreak detection (disabled by default)')
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.bundle and not (args.questions_file and args.correct_answers_file):
+        parser.error('either --bundle or both --questions-file and --correct-answers-file are required')
+    if args.pages_per_call < 1:
+        parser.error('--pages-per-call must be at least 1')
+    if args.use_async and args.stream:
+        parser.error('--async cannot be combined with --stream, which grades students in threads as they are identified')
+    unknown_steps = set(filter(None, (args.preprocess or '').split(','))) - set(PREPROCESS_STEPS)
+    if unknown_steps:
+        parser.error(f"unknown --preprocess steps: {', '.join(sorted(unknown_steps))}")
+    return args
 
 
 def setup_logging(debug: bool) -> None:
@@ -113,16 +264,50 @@ def determine_input_type(args) -> InputType:
         return InputType.SINGLE_PDF
 
 
-def split_multi_student_pdf(args, gemini_api) -> str:
+def blank_page_detector(args) -> Optional[BlankPageDetector]:
+    """
+    Create the blank page detector configured on the command line.
+    
+    Args:
+        args: Command line arguments
+        
+    Returns:
+        BlankPageDetector, or None if blank pages are not skipped
+    """
+    if not args.skip_blank_pages:
+        return None
+    return BlankPageDetector(max_ink_coverage=args.blank_max_coverage, max_std=args.blank_max_std)
+
+
+def page_preprocessor(args) -> Optional[PagePreprocessor]:
     """
-    Handle multi-student PDF by splitting it into individual PDFs.
+    Create the page preprocessor configured on the command line.
+    
+    Args:
+        args: Command line arguments
+        
+    Returns:
+        PagePreprocessor, or None if pages are sent as rendered
+    """
+    steps = [step for step in args.preprocess.split(',') if step] if args.preprocess else []
+    if not steps and not args.max_long_edge:
+        return None
+    return PagePreprocessor(steps, max_long_edge=args.max_long_edge)
+
+
+def split_multi_student_pdf(args, gemini_api, source: SharedPDF) -> List[PDFPageRange]:
+    """
+    Handle multi-student PDF by partitioning it into per-student page ranges.
+    
+    Split PDFs are only written with --export-split-pdfs.
     
     Args:
         args: Command line arguments
         gemini_api: Initialized Gemini API client
+        source: The open multi-student PDF
         
     Returns:
-        Path to directory containing split PDFs
+        Page-range views of each student's pages, empty if partitioning failed
     """
     student_path = Path(args.student_answers_file)
     
@@ -132,28 +317,86 @@ def split_multi_student_pdf(args, gemini_api) -> str:
     logger.info(f"Splitting multi-student PDF: {student_path}")
     
     try:
-        split_pdfs = partition_multi_student_pdf(
-            student_path, 
+        students = partition_multi_student_pdf_views(
+            source, 
             output_dir, 
-            gemini_api, 
-            max_workers=args.workers
+            gemini_api,
+            export_pdfs=args.export_split_pdfs,
+            id_region=args.id_region,
+            batch_size=args.id_batch_size,
+            pages_per_student=args.pages_per_student
         )
-        logger.info(f"Created {len(split_pdfs)} individual student PDFs in {output_dir}")
+        logger.info(f"Identified {len(students)} students in {student_path}")
+        if args.export_split_pdfs:
+            logger.info(f"Created {len(students)} individual student PDFs in {output_dir}")
         
-        if not split_pdfs:
-            logger.warning("No student PDFs were created. Check if the PDF contains student information.")
-            return str(student_path)
+        if not students:
+            logger.warning("No students were identified. Check if the PDF contains student information.")
             
-        return str(output_dir)
+        return students
     except Exception as e:
         logger.error(f"Error splitting multi-student PDF: {e}")
-        # Fall back to processing the original PDF
-        logger.warning("Falling back to processing the original PDF without splitting")
-        return str(student_path)
+        return []
+
+
+def process_multi_student_pdf_streaming(args, questions: Dict, correct_answers: Dict,
+                                        grader: ExamGrader, gemini_api: GeminiAPI) -> None:
+    """
+    Partition, extract and grade a multi-student PDF as a pipeline.
+    
+    Each student's page range is handed to extraction and grading as soon as the
+    next student's first page is found, so the first results appear while later
+    pages are still being partitioned.
+    
+    Args:
+        args: Command line arguments
+        questions: Questions dictionary
+        correct_answers: Correct answers dictionary
+        grader: ExamGrader instance
+        gemini_api: Initialized GeminiAPI client
+    """
+    student_path = Path(args.student_answers_file)
+    output_dir = student_path.parent / f"{student_path.stem}_split"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    args.output_file = None
+    
+    logger.info(f"Streaming multi-student PDF: {student_path}")
+    
+    with SharedPDF(student_path) as source, ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = []
+        if args.pages_per_student:
+            sections = iter_student_sections_by_stride(student_path, gemini_api, args.pages_per_student,
+                                                       args.id_region, source=source)
+        else:
+            sections = iter_student_sections(student_path, gemini_api, args.id_region, source=source,
+                                             batch_size=args.id_batch_size)
+        for section in sections:
+            mapping = {section['student_id']: (section['start_page'], section['end_page'])}
+            for student in create_student_views(source, mapping, output_dir):
+                if args.export_split_pdfs:
+                    student.export()
+                logger.info(f"\nProcessing student: {student}")
+                futures.append(executor.submit(
+                    process_single_student_pdf,
+                    student.path,
+                    questions,
+                    correct_answers,
+                    grader,
+                    args,
+                    gemini_api,
+                    student
+                ))
+        
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Error processing student file: {e}")
 
 
 def parse_questions_and_answers(questions_path: Path, correct_answers_path: Path, 
-                     gemini_api: GeminiAPI, openai_api: OpenAIAPI, max_workers: int) -> Tuple[Dict, Dict]:
+                     gemini_api: GeminiAPI, openai_api: OpenAIAPI, max_workers: int,
+                     image_format: Optional[str] = None, image_quality: int = 90) -> Tuple[Dict, Dict]:
     """
     Parse question and answer files.
     
@@ -162,7 +405,9 @@ def parse_questions_and_answers(questions_path: Path, correct_answers_path: Path
         correct_answers_path: Path to correct answers file
         gemini_api: Initialized GeminiAPI client
         openai_api: Initialized OpenAIAPI client
-        max_workers: Maximum worker threads
+        max_workers: Maximum number of question pages transcribed concurrently
+        image_format: Optional format (JPEG, PNG, WEBP) pages are encoded in before they are sent
+        image_quality: Encoder quality for lossy image formats
         
     Returns:
         Tuple of (questions dict, correct answers dict)
@@ -180,7 +425,9 @@ def parse_questions_and_answers(questions_path: Path, correct_answers_path: Path
         str(questions_path),  # Convert Path to string
         gemini_api=gemini_api,
         openai_api=openai_api,
-        max_workers=max_workers
+        max_workers=max_workers,
+        image_format=image_format,
+        image_quality=image_quality
     )
     
     # Process correct answers file
@@ -189,7 +436,9 @@ def parse_questions_and_answers(questions_path: Path, correct_answers_path: Path
         str(correct_answers_path),  # Convert Path to string
         gemini_api=gemini_api,
         is_correct_answer=True, 
-        questions_dict=questions
+        questions_dict=questions,
+        image_format=image_format,
+        image_quality=image_quality
     )
     
     return questions, correct_answers
@@ -215,24 +464,41 @@ def process_directory_of_pdfs(directory_path: Path, questions: Dict, correct_ans
         return
         
     logger.info(f"Found {len(pdf_files)} PDF files to process")
+    process_students(pdf_files, questions, correct_answers, grader, args, gemini_api)
+
+
+def process_students(students: List[Union[Path, PDFPageRange]], questions: Dict, correct_answers: Dict,
+                     grader: ExamGrader, args, gemini_api: GeminiAPI) -> None:
+    """
+    Process student PDFs or page-range views in parallel.
     
+    Args:
+        students: Paths to student PDFs, or page-range views of a multi-student PDF
+        questions: Questions dictionary
+        correct_answers: Correct answers dictionary
+        grader: ExamGrader instance
+        args: Command line arguments
+        gemini_api: Initialized GeminiAPI client
+    """
     # Process files in parallel using ThreadPoolExecutor
     with ThreadPoolExecutor(max_workers=args.workers) as executor:
         futures = []
-        for student_file in pdf_files:
-            logger.info(f"\nProcessing student file: {student_file}")
+        for student in students:
+            logger.info(f"\nProcessing student file: {student}")
             # Clear output file for each student to generate unique output
             current_args = args
             current_args.output_file = None
             # Submit each student file for processing
+            page_range = student if isinstance(student, PDFPageRange) else None
             future = executor.submit(
                 process_single_student_pdf,
-                student_file,
+                page_range.path if page_range else student,
                 questions,
                 correct_answers,
                 grader,
                 current_args,
-                gemini_api
+                gemini_api,
+                page_range
             )
             futures.append(future)
         
@@ -244,36 +510,189 @@ def process_directory_of_pdfs(directory_path: Path, questions: Dict, correct_ans
                 logger.error(f"Error processing student file: {e}")
 
 
+def student_extraction_options(args) -> Dict[str, Any]:
+    """
+    Collect the parse_answers() options of student answer extraction configured on the command line.
+    
+    Args:
+        args: Command line arguments
+        
+    Returns:
+        Keyword arguments for parse_answers()
+    """
+    return {
+        'extraction_mode': args.answer_extraction,
+        'max_workers': args.page_workers,
+        'blank_detector': blank_page_detector(args),
+        'template_index': template_pages if args.skip_template_pages else None,
+        'template_subtractor': args.template_subtractor,
+        'low_dpi': args.low_dpi if args.adaptive_resolution else None,
+        'preprocessor': page_preprocessor(args),
+        'max_segments': args.max_segments,
+        'pages_per_call': args.pages_per_call,
+        'image_format': args.image_format,
+        'image_quality': args.image_quality,
+    }
+
+
+def student_output_file(args, student_path: Path) -> str:
+    """
+    Get the results file of a student: --output-file if given, else <stem>_results.txt next to the PDF.
+    
+    Args:
+        args: Command line arguments
+        student_path: Path to student PDF, or the path a page-range view stands in for
+        
+    Returns:
+        Path of the results file
+    """
+    if not args.output_file:
+        return str(student_path.parent / f"{student_path.stem}_results.txt")
+    return args.output_file
+
+
+async def process_directory_of_pdfs_async(directory_path: Path, questions: Dict, correct_answers: Dict,
+                                         grader: ExamGrader, args, gemini_api: GeminiAPI) -> None:
+    """
+    Process all PDF files in a directory on a single event loop.
+    
+    Answer extraction runs the thread-based extractors, at most --workers students
+    at a time, but their Gemini requests are sent through the async Gemini client on
+    the event loop. Grading calls of all students are coroutines sharing the async
+    OpenAI client, so their number in flight is bounded only by the governor.
+    
+    Args:
+        directory_path: Path to directory containing PDFs
+        questions: Questions dictionary
+        correct_answers: Correct answers dictionary
+        grader: ExamGrader instance with an AsyncOpenAIAPI client
+        args: Command line arguments
+        gemini_api: Initialized AsyncGeminiAPI client
+    """
+    pdf_files = sorted(directory_path.glob('*.pdf'))
+    
+    if not pdf_files:
+        logger.warning(f"No PDF files found in directory: {directory_path}")
+        return
+        
+    logger.info(f"Found {len(pdf_files)} PDF files to process")
+    await process_students_async(pdf_files, questions, correct_answers, grader, args, gemini_api)
+
+
+async def process_students_async(students: List[Union[Path, PDFPageRange]], questions: Dict, correct_answers: Dict,
+                                 grader: ExamGrader, args, gemini_api: GeminiAPI) -> None:
+    """
+    Process student PDFs or page-range views on the running event loop.
+    
+    Args:
+        students: Paths to student PDFs, or page-range views of a multi-student PDF
+        questions: Questions dictionary
+        correct_answers: Correct answers dictionary
+        grader: ExamGrader instance with an AsyncOpenAIAPI client
+        args: Command line arguments
+        gemini_api: Initialized AsyncGeminiAPI client
+    """
+    extraction_slots = asyncio.Semaphore(args.workers)
+    if len(students) > 1:
+        # --output-file names the results of a single student; several students get one file each
+        args.output_file = None
+    
+    async def process(student: Union[Path, PDFPageRange]) -> None:
+        try:
+            await process_single_student_pdf_async(student, questions, correct_answers, grader, args,
+                                                   gemini_api, extraction_slots)
+        except Exception as e:
+            logger.error(f"Error processing student file {student}: {e}")
+    
+    # Gemini requests of the extraction threads run on this loop through the async client
+    with gemini_api.run_on(asyncio.get_running_loop()):
+        await asyncio.gather(*(process(student) for student in students))
+
+
+async def process_single_student_pdf_async(student: Union[Path, PDFPageRange], questions: Dict, correct_answers: Dict,
+                                           grader: ExamGrader, args, gemini_api: GeminiAPI,
+                                           extraction_slots: asyncio.Semaphore) -> None:
+    """
+    Process a single student PDF of a directory on the event loop.
+    
+    Args:
+        student: Path to student PDF, or a page-range view of a multi-student PDF
+        questions: Questions dictionary
+        correct_answers: Correct answers dictionary
+        grader: ExamGrader instance with an AsyncOpenAIAPI client
+        args: Command line arguments
+        gemini_api: Initialized AsyncGeminiAPI client
+        extraction_slots: Semaphore limiting the number of students extracted at once
+    """
+    student_path = student.path if isinstance(student, PDFPageRange) else student
+    output_file = student_output_file(args, student_path)
+    
+    async with extraction_slots:
+        logger.info(f"Parsing student answers from {student}")
+        student_answers, student_json = await asyncio.to_thread(
+            parse_answers,
+            student if isinstance(student, PDFPageRange) else str(student_path),
+            gemini_api=gemini_api,
+            is_correct_answer=False,
+            questions_dict=questions,
+            **student_extraction_options(args)
+        )
+        logger.info(f"Saved parsed student answers to {student_json}")
+        
+        if not args.enable_jailbreak_check:
+            if await asyncio.to_thread(has_jailbreak_attempt, student_path, student_answers, output_file, grader, gemini_api):
+                logger.warning(f"Jailbreak attempt detected in {student_path}. Aborting grading.")
+                return
+    
+    if args.rounds > 1:
+        # Multiple rounds are graded with the synchronous client in a worker thread
+        await asyncio.to_thread(grade_exam, student_path, student_answers, questions, correct_answers,
+                                output_file, grader, args.rounds)
+        return
+    
+    logger.info(f"Grading {student_path}")
+    try:
+        results, total_score, max_possible = await grader.grade_exam_async(questions, correct_answers, student_answers)
+        grader.save_results(results, total_score, max_possible, output_file)
+        logger.info(f"Grading complete. Results saved to {output_file}")
+        logger.info(f"Total score: {total_score}/{max_possible}")
+    except Exception as e:
+        logger.error(f"Error during grading: {e}")
+        with open(output_file, 'w') as f:
+            f.write(f"Error grading exam: {str(e)}\n")
+        raise
+
+
 def process_single_student_pdf(student_path: Path, questions: Dict, correct_answers: Dict, 
-                              grader: ExamGrader, args, gemini_api: GeminiAPI) -> None:
+                              grader: ExamGrader, args, gemini_api: GeminiAPI,
+                              page_range: Optional[PDFPageRange] = None) -> None:
     """
     Process a single student PDF file.
     
     Args:
-        student_path: Path to student PDF
+        student_path: Path to student PDF, or the path a page-range view stands in for
         questions: Questions dictionary
         correct_answers: Correct answers dictionary
         grader: ExamGrader instance
         args: Command line arguments
         gemini_api: Initialized GeminiAPI client
+        page_range: Optional page-range view to extract instead of reading student_path
     """
-    if not student_path.exists():
+    if page_range is None and not student_path.exists():
         logger.error(f"Student file not found: {student_path}")
         return
         
     # Set default output file if not specified
-    if not args.output_file:
-        output_file = str(student_path.parent / f"{student_path.stem}_results.txt")
-    else:
-        output_file = args.output_file
+    output_file = student_output_file(args, student_path)
             
     # Parse student answers
     logger.info(f"Parsing student answers from {student_path}")
     student_answers, student_json = parse_answers(
-        str(student_path),  # Convert Path to string
+        page_range or str(student_path),  # Convert Path to string
         gemini_api=gemini_api,
         is_correct_answer=False, 
-        questions_dict=questions
+        questions_dict=questions,
+        **student_extraction_options(args)
     )
     logger.info(f"Saved parsed student answers to {student_json}")
 
@@ -390,6 +809,7 @@ def grade_exam(student_path: Path, student_answers: Dict, questions: Dict,
 def main():
     """Main entry point."""
     args = parse_args()
+    cache = None
     
     # Set up logging
     setup_logging(args.debug)
@@ -405,51 +825,113 @@ def main():
         if not openai_api_key and not gemini_api_key:
             raise ValueError("OpenAI API and Gemini API key must be provided either via --openai-api-key or OPENAI_API_KEY in .env")
             
-        # Set up API clients
-        gemini_api = GeminiAPI(gemini_api_key, model_name=args.gemini_model)
-        openai_api = OpenAIAPI(openai_api_key, model_name=args.openai_model)
+        # Limit concurrent API calls per provider across the whole process
+        governor.configure({
+            GEMINI_EXTRACTION: args.gemini_concurrency or args.workers,
+            GEMINI_SEGMENTS: args.gemini_concurrency or args.workers,
+            OPENAI_GRADING: args.grading_concurrency or args.workers,
+            OPENAI_RUBRIC: args.rubric_concurrency or args.workers,
+        }, adaptive=args.adaptive_concurrency, ceiling=args.max_concurrency, latency_target=args.latency_target)
+        
+        # Pace requests per model to stay within the provider quotas
+        limits = rate_limits_from_env()
+        limits.update(parse_rate_limits(args.rate_limit))
+        rate_limits.configure(limits)
         
-        # Initialize grader
-        grader = ExamGrader(openai_api, max_workers=args.workers)
+        # Set up the response cache shared by both API clients
+        cache = response_cache(args)
+        
+        # Set up API clients
+        gemini_api_class = AsyncGeminiAPI if args.use_async else GeminiAPI
+        gemini_api = gemini_api_class(gemini_api_key, model_name=args.gemini_model, cache=cache)
+        openai_api_class = AsyncOpenAIAPI if args.use_async else OpenAIAPI
+        openai_api = openai_api_class(openai_api_key, model_name=args.openai_model, cache=cache)
         
         # Determine input type
         input_type = determine_input_type(args)
         
-        # Convert file paths to Path objects
-        questions_path = Path(args.questions_file).resolve()
-        correct_answers_path = Path(args.correct_answers_file).resolve()
+        if args.bundle:
+            # Load the precompiled questions, rubrics and correct answers
+            bundle = load_bundle(args.bundle)
+            questions, correct_answers = bundle.questions, bundle.correct_answers
+            grader = ExamGrader(openai_api,
+                                subproblem_map=bundle.subproblem_map,
+                                prompt_segments=bundle.prompt_segments)
+        else:
+            # Convert file paths to Path objects
+            questions_path = Path(args.questions_file).resolve()
+            correct_answers_path = Path(args.correct_answers_file).resolve()
+            
+            # Parse questions and correct answers
+            questions, correct_answers = parse_questions_and_answers(
+                questions_path, correct_answers_path, gemini_api, openai_api, args.workers,
+                args.image_format, args.image_quality
+            )
+            grader = ExamGrader(openai_api)
         
-        # Parse questions and correct answers
-        questions, correct_answers = parse_questions_and_answers(
-            questions_path, correct_answers_path, gemini_api, openai_api, args.workers
-        )
+        # Index the pre-printed pages of the exam so they are not transcribed for every student
+        if args.skip_template_pages:
+            template_pages.configure(args.template_threshold, args.template_min_students, args.template_hash)
+            questions_file = bundle.sources.get('questions_file') if args.bundle else args.questions_file
+            if questions_file and questions_file.lower().endswith('.pdf') and Path(questions_file).exists():
+                template_pages.seed_from_pdf(questions_file)
+        
+        # Open the blank answer sheet once for all students
+        args.template_subtractor = TemplateSubtractor(args.answer_template) if args.answer_template else None
         
         # Process student answers based on input type
+        if input_type == InputType.MULTI_STUDENT_PDF and args.stream:
+            process_multi_student_pdf_streaming(args, questions, correct_answers, grader, gemini_api)
+            return 0
+        
         if input_type == InputType.MULTI_STUDENT_PDF:
-            # split multi-student PDF, returns path to directory of split PDFs
-            output_dir = split_multi_student_pdf(args, gemini_api)
-
-            # If in debug mode, stop after splitting the PDF
-            if args.debug:
-                logger.debug("Debug mode: Stopping after PDF split")
-                return 0
-            # Update student path to the split directory and continue with directory processing
-            args.student_answers_file = output_dir
-            process_directory_of_pdfs(Path(output_dir), questions, correct_answers, grader, args, gemini_api)
-            
+            with SharedPDF(args.student_answers_file) as source:
+                # Partition the multi-student PDF into page-range views of each student
+                students = split_multi_student_pdf(args, gemini_api, source)
+
+                # If in debug mode, stop after splitting the PDF
+                if args.debug:
+                    logger.debug("Debug mode: Stopping after PDF split")
+                    return 0
+                
+                if args.use_async:
+                    asyncio.run(process_students_async(students, questions, correct_answers, grader, args, gemini_api))
+                else:
+                    process_students(students, questions, correct_answers, grader, args, gemini_api)
+        
         elif input_type == InputType.DIRECTORY_OF_PDFS:
             # Process all PDFs in the directory
-            process_directory_of_pdfs(Path(args.student_answers_file), questions, correct_answers, 
-                                     grader, args, gemini_api)
+            if args.use_async:
+                asyncio.run(process_directory_of_pdfs_async(Path(args.student_answers_file), questions,
+                                                            correct_answers, grader, args, gemini_api))
+            else:
+                process_directory_of_pdfs(Path(args.student_answers_file), questions, correct_answers, 
+                                         grader, args, gemini_api)
             
         else:  # InputType.SINGLE_PDF
             # Process a single student PDF
-            process_single_student_pdf(Path(args.student_answers_file), questions, correct_answers, 
-                                      grader, args, gemini_api)
+            if args.use_async:
+                asyncio.run(process_students_async([Path(args.student_answers_file)], questions, correct_answers,
+                                                   grader, args, gemini_api))
+            else:
+                process_single_student_pdf(Path(args.student_answers_file), questions, correct_answers, 
+                                          grader, args, gemini_api)
         
     except Exception as e:
         logger.error(f"An error occurred: {e}", exc_info=True)
         return 1
+    finally:
+        logger.info(governor.summary())
+        if args.answer_extraction == 'speculative':
+            logger.info(speculation_stats.summary())
+        if cache:
+            logger.info(cache.summary())
+        if args.skip_template_pages:
+            logger.info(template_pages.summary())
+        if args.adaptive_resolution:
+            logger.info(resolution_stats.summary())
+        if getattr(args, 'template_subtractor', None):
+            args.template_subtractor.close()
         
     return 0
 
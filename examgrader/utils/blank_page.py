@@ -0,0 +1,87 @@
+"""Local detection of blank and near-blank scanned pages."""
+
+import logging
+from typing import Dict, Union
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Gray level (0-255) below which a pixel counts as ink
+DEFAULT_INK_THRESHOLD = 160
+
+# Largest fraction of ink pixels a blank page may have; a single handwritten digit at 300 DPI covers about 0.02%
+DEFAULT_MAX_INK_COVERAGE = 0.0001
+
+# Largest gray level standard deviation a blank page may have
+DEFAULT_MAX_STD = 10.0
+
+# Fraction of the page width and height ignored at each edge, where scanners leave shadows and punch holes
+DEFAULT_MARGIN = 0.05
+
+# Side of the blocks averaged before thresholding, so isolated dust specks fade instead of counting as ink
+SPECK_BLOCK_SIZE = 4
+
+
+class BlankPageDetector:
+    """Classifies rendered pages as blank from their ink coverage and gray level variance.
+
+    A page is blank when both its ink coverage and its gray level standard
+    deviation are at or below the thresholds. The check is vectorized with NumPy
+    and takes a few milliseconds on a 300 DPI page.
+    """
+
+    def __init__(self, max_ink_coverage: float = DEFAULT_MAX_INK_COVERAGE, max_std: float = DEFAULT_MAX_STD,
+                 ink_threshold: int = DEFAULT_INK_THRESHOLD, margin: float = DEFAULT_MARGIN):
+        """Initialize the detector.
+
+        Args:
+            max_ink_coverage: Largest fraction of ink pixels a blank page may have
+            max_std: Largest gray level standard deviation a blank page may have
+            ink_threshold: Gray level (0-255) below which a pixel counts as ink
+            margin: Fraction of the page width and height ignored at each edge
+        """
+        self.max_ink_coverage = max_ink_coverage
+        self.max_std = max_std
+        self.ink_threshold = ink_threshold
+        self.margin = margin
+
+    def measure(self, image: Image.Image) -> Dict[str, float]:
+        """Measure the ink coverage and gray level standard deviation of a page.
+
+        Args:
+            image: Rendered page
+
+        Returns:
+            Dict with 'ink_coverage' (fraction of ink pixels) and 'std' (gray level standard deviation)
+        """
+        gray = np.asarray(image.convert('L'), dtype=np.float32)
+        height, width = gray.shape
+        dy, dx = int(height * self.margin), int(width * self.margin)
+        gray = gray[dy:height - dy, dx:width - dx]
+
+        # Average SPECK_BLOCK_SIZE x SPECK_BLOCK_SIZE blocks; strokes stay dark, specks do not
+        block = SPECK_BLOCK_SIZE
+        height, width = (gray.shape[0] // block) * block, (gray.shape[1] // block) * block
+        if height and width:
+            gray = gray[:height, :width].reshape(height // block, block, width // block, block).mean(axis=(1, 3))
+        if not gray.size:
+            return {'ink_coverage': 0.0, 'std': 0.0}
+
+        return {
+            'ink_coverage': float(np.count_nonzero(gray < self.ink_threshold)) / gray.size,
+            'std': float(gray.std()),
+        }
+
+    def is_blank(self, image: Union[Image.Image, Dict[str, float]]) -> bool:
+        """Check whether a page is blank.
+
+        Args:
+            image: Rendered page, or its measurements from measure()
+
+        Returns:
+            True if the page is blank
+        """
+        stats = image if isinstance(image, dict) else self.measure(image)
+        return stats['ink_coverage'] <= self.max_ink_coverage and stats['std'] <= self.max_std
@@ -0,0 +1,77 @@
+"""Utility functions for rendering and encoding page images."""
+
+import io
+import logging
+from typing import Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Image formats the extractors can hand to the Gemini API, mapped to MIME types
+IMAGE_MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+
+def render_page(page: fitz.Page, dpi: int = 300, clip: Optional[fitz.Rect] = None) -> fitz.Pixmap:
+    """Render a PDF page to an RGB pixmap.
+
+    Args:
+        page: PyMuPDF page to render
+        dpi: Resolution for page rendering
+        clip: Optional region of the page to render, in page coordinates
+
+    Returns:
+        RGB pixmap without alpha channel
+    """
+    zoom = dpi / 72
+    matrix = fitz.Matrix(zoom, zoom).prerotate(page.rotation or 0)
+    return page.get_pixmap(matrix=matrix, alpha=False, clip=clip)
+
+
+def pixmap_to_image(pix: fitz.Pixmap) -> Image.Image:
+    """Wrap the raw samples of a pixmap in a PIL Image without encoding.
+
+    The pixel buffer is handed to PIL as-is, avoiding the lossy
+    JPEG encode/decode round trip of going through pix.tobytes().
+
+    Args:
+        pix: RGB or grayscale pixmap without alpha channel
+
+    Returns:
+        PIL Image in RGB or L mode
+    """
+    mode = 'L' if pix.n == 1 else 'RGB'
+    # pix.samples is a bytes object owned by the image, so the image stays
+    # valid after the pixmap is released
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples, 'raw', mode, pix.stride, 1)
+
+
+def encode_image(image: Image.Image, image_format: str = 'JPEG', quality: int = 90) -> Tuple[bytes, str]:
+    """Encode a PIL Image once so the bytes can be reused across API calls.
+
+    Args:
+        image: PIL Image to encode
+        image_format: One of IMAGE_MIME_TYPES (JPEG, PNG, WEBP)
+        quality: Encoder quality for lossy formats (1-100)
+
+    Returns:
+        Tuple of (encoded bytes, MIME type)
+
+    Raises:
+        ValueError: If the image format is not supported
+    """
+    image_format = image_format.upper()
+    if image_format not in IMAGE_MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {image_format}")
+
+    buffer = io.BytesIO()
+    if image_format == 'PNG':
+        image.save(buffer, format=image_format, optimize=False)
+    else:
+        image.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue(), IMAGE_MIME_TYPES[image_format]
@@ -0,0 +1,121 @@
+"""Local student ID detection from PDF text layers and barcodes, tried before asking Gemini."""
+
+import logging
+import re
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pyzbar import pyzbar
+except ImportError:  # optional dependency, barcodes are only decoded when a decoder is available
+    pyzbar = None
+
+# Student IDs contain exactly nine digits, as described in the student ID prompt
+STUDENT_ID_PATTERN = re.compile(r'(?<!\d)\d{9}(?!\d)')
+
+# Student names contain traditional Chinese characters
+STUDENT_NAME_PATTERN = re.compile(r'[一-鿿]{2,4}')
+
+# Name recorded when a student ID is found locally without a name next to it
+UNKNOWN_NAME = '-'
+
+# Decodes the barcodes and QR codes in an image and returns their payloads
+BarcodeDecoder = Callable[[Image.Image], List[str]]
+
+
+def pyzbar_decoder(image: Image.Image) -> List[str]:
+    """Decode barcodes and QR codes with pyzbar (requires the zbar library)."""
+    return [symbol.data.decode('utf-8', errors='replace') for symbol in pyzbar.decode(image)]
+
+
+_barcode_decoder: Optional[BarcodeDecoder] = pyzbar_decoder if pyzbar else None
+
+
+def set_barcode_decoder(decoder: Optional[BarcodeDecoder]) -> None:
+    """Set the barcode decoder used for local student ID detection.
+
+    Args:
+        decoder: Function returning the payloads of the barcodes in an image, or None to disable barcode decoding
+    """
+    global _barcode_decoder
+    _barcode_decoder = decoder
+
+
+def get_barcode_decoder() -> Optional[BarcodeDecoder]:
+    """Get the barcode decoder used for local student ID detection, or None if there is none."""
+    return _barcode_decoder
+
+
+def find_student_in_text(text: str) -> Optional[Tuple[str, str]]:
+    """Find a student ID, and the name next to it if there is one, in extracted text.
+
+    Args:
+        text: Text from a PDF text layer or a barcode payload
+
+    Returns:
+        Tuple of (student ID, name), or None if the text holds no student ID
+    """
+    id_match = STUDENT_ID_PATTERN.search(text or '')
+    if not id_match:
+        return None
+    name_match = STUDENT_NAME_PATTERN.search(text)
+    return id_match.group(0), name_match.group(0) if name_match else UNKNOWN_NAME
+
+
+def decode_student_barcode(image: Image.Image) -> Optional[Tuple[str, str]]:
+    """Find a student ID in the barcodes of an image with the configured decoder.
+
+    Args:
+        image: Rendered region of a page
+
+    Returns:
+        Tuple of (student ID, name), or None if no decoder is set or no barcode holds a student ID
+    """
+    decoder = _barcode_decoder
+    if decoder is None:
+        return None
+    try:
+        payloads = decoder(image)
+    except Exception as e:
+        logger.warning(f"Barcode decoder failed: {str(e)}")
+        return None
+    for payload in payloads:
+        student = find_student_in_text(payload)
+        if student:
+            return student
+    return None
+
+
+class IDDetectionStats:
+    """Thread-safe count of how the student ID of each page was resolved."""
+
+    LOCAL_METHODS = ('text', 'barcode')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'text': 0, 'barcode': 0, 'remote': 0}
+
+    def record(self, method: str, pages: int = 1) -> None:
+        """Count pages resolved by a method ('text', 'barcode' or 'remote')."""
+        with self._lock:
+            self.counts[method] += pages
+
+    @property
+    def local(self) -> int:
+        """Number of pages resolved without an API call."""
+        return sum(self.counts[method] for method in self.LOCAL_METHODS)
+
+    @property
+    def remote(self) -> int:
+        """Number of pages sent to Gemini."""
+        return self.counts['remote']
+
+    def summary(self) -> str:
+        """One-line report of local versus remote resolution."""
+        return (f"Student ID detection: {self.local} pages resolved locally "
+                f"(text layer: {self.counts['text']}, barcode: {self.counts['barcode']}), "
+                f"{self.remote} pages sent to Gemini")
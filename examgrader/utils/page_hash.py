@@ -0,0 +1,317 @@
+"""Perceptual page hashes and a class-wide index of pre-printed template pages."""
+
+import logging
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Set, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from examgrader.utils.blank_page import DEFAULT_INK_THRESHOLD
+from examgrader.utils.page_range import SharedPDF
+from examgrader.utils.template_subtraction import ink_blocks, new_ink_blocks
+
+logger = logging.getLogger(__name__)
+
+# Side of the hash grid; hashes have HASH_SIZE * HASH_SIZE bits
+HASH_SIZE = 16
+
+# Side of the grid of ink coverage blocks used to verify hash matches
+INK_GRID_SIZE = 32
+
+# Largest Hamming distance between the hashes of a page and a template it matches
+DEFAULT_HASH_THRESHOLD = 40
+
+# Largest ink coverage a block of the coarse ink grid may add over the template around it.
+# Only a cheap pre-filter: a few lines of handwriting stay below it, so every page passing it
+# is verified block by block at full resolution
+DEFAULT_MAX_NEW_INK = 0.1
+
+# Resolution templates are seeded at, matching the resolution answer pages are rendered at
+SEED_DPI = 300
+
+# Number of different students a page must appear unchanged for before it becomes a template
+DEFAULT_MIN_STUDENTS = 3
+
+# Most candidate pages remembered while learning templates
+MAX_CANDIDATES = 1000
+
+HASH_METHODS = ('dhash', 'phash')
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """DCT-II basis of size n, rows are frequencies."""
+    frequencies = np.arange(n)[:, None]
+    positions = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * positions + 1) * frequencies / (2 * n)).astype(np.float32)
+
+
+_DCT = _dct_matrix(HASH_SIZE * 4)
+
+
+def dhash(gray: np.ndarray) -> np.ndarray:
+    """Difference hash: whether each cell of a downscaled page is brighter than its left neighbour.
+
+    Args:
+        gray: Grayscale page as a 2D array
+
+    Returns:
+        Packed hash bits as a uint8 array
+    """
+    small = np.asarray(Image.fromarray(gray).resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX), dtype=np.float32)
+    return np.packbits((small[:, 1:] > small[:, :-1]).ravel())
+
+
+def phash(gray: np.ndarray) -> np.ndarray:
+    """Perceptual hash: whether each low-frequency DCT coefficient of a downscaled page is above the median.
+
+    Args:
+        gray: Grayscale page as a 2D array
+
+    Returns:
+        Packed hash bits as a uint8 array
+    """
+    side = _DCT.shape[0]
+    small = np.asarray(Image.fromarray(gray).resize((side, side), Image.Resampling.BOX), dtype=np.float32)
+    coefficients = (_DCT @ small @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return np.packbits((coefficients > np.median(coefficients)).ravel())
+
+
+def _hamming(hashes: np.ndarray, page_hash: np.ndarray) -> np.ndarray:
+    """Hamming distances between the packed hashes in the rows of hashes and one packed hash."""
+    return np.unpackbits(hashes ^ page_hash, axis=-1).sum(axis=-1)
+
+
+def _stroke_blocks(new_ink: np.ndarray) -> int:
+    """Count the new-ink blocks with a new-ink neighbour, so isolated scanner specks do not count as strokes."""
+    padded = np.pad(new_ink, 1).astype(np.uint8)
+    rows, cols = new_ink.shape
+    neighbours = sum(padded[dy:dy + rows, dx:dx + cols] for dy in range(3) for dx in range(3)) - new_ink
+    return int(np.count_nonzero(new_ink & (neighbours > 0)))
+
+
+@dataclass(eq=False)
+class PageSignature:
+    """Perceptual hash of a page, the ink coverage of a coarse grid over it and its full-resolution ink blocks."""
+    hash: np.ndarray
+    ink: np.ndarray
+    blocks: np.ndarray  # Packed ink blocks of the page at its render resolution, see ink_blocks()
+    blocks_shape: Tuple[int, int]
+
+    @classmethod
+    def from_image(cls, image: Image.Image, method: str = 'dhash') -> 'PageSignature':
+        """Compute the signature of a rendered page.
+
+        Args:
+            image: Rendered page
+            method: Hash method, one of HASH_METHODS
+
+        Returns:
+            PageSignature of the page
+        """
+        gray_image = image.convert('L')
+        blocks = ink_blocks(np.asarray(gray_image))
+        block = 8
+        side = INK_GRID_SIZE * block
+        gray = np.asarray(gray_image.resize((side, side), Image.Resampling.BOX))
+        page_hash = phash(gray) if method == 'phash' else dhash(gray)
+        ink = (gray < DEFAULT_INK_THRESHOLD).reshape(INK_GRID_SIZE, block, INK_GRID_SIZE, block).mean(axis=(1, 3))
+        return cls(page_hash, ink.astype(np.float32), np.packbits(blocks), blocks.shape)
+
+    def block_mask(self, shape: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """Unpack the full-resolution ink blocks, resized to another page's block grid if given."""
+        rows, cols = self.blocks_shape
+        mask = np.unpackbits(self.blocks, count=rows * cols).reshape(rows, cols).astype(bool)
+        if shape is None or shape == mask.shape:
+            return mask
+        # Nearest-neighbour resizing never adds template ink, so it cannot hide new strokes
+        resized = Image.fromarray(mask.astype(np.uint8) * 255).resize((shape[1], shape[0]), Image.Resampling.NEAREST)
+        return np.asarray(resized) > 0
+
+    def new_ink(self, template: 'PageSignature') -> float:
+        """Largest ink coverage a block of this page adds over the template around it.
+
+        The template's ink is spread over neighbouring blocks first, so ink that only
+        moved by a block because of skew or offset does not count as new.
+        """
+        padded = np.pad(template.ink, 1)
+        rows, cols = template.ink.shape
+        spread = np.max([padded[dy:dy + rows, dx:dx + cols] for dy in range(3) for dx in range(3)], axis=0)
+        return float((self.ink - spread).max())
+
+    def new_strokes(self, template: 'PageSignature') -> int:
+        """Count the full-resolution ink blocks this page adds to the template as pen strokes.
+
+        The page is aligned to the template as in template subtraction, so ink that
+        only moved because of skew or offset does not count as new.
+        """
+        page = self.block_mask()
+        return _stroke_blocks(new_ink_blocks(page, template.block_mask(page.shape)))
+
+
+@dataclass(eq=False)
+class _Candidate:
+    """A page seen while learning templates, with the students it appeared unchanged for."""
+    signature: PageSignature
+    students: Set[str] = field(default_factory=set)
+
+
+class TemplatePageIndex:
+    """Thread-safe index of pre-printed pages that appear unchanged in every student PDF.
+
+    Templates are seeded from the questions PDF and learned from student pages that
+    appear unchanged for several students. The hashes only choose which templates
+    to check: a page matches a template when their hashes are within the Hamming
+    threshold and the page adds no pen stroke to it at full resolution.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_HASH_THRESHOLD, min_students: int = DEFAULT_MIN_STUDENTS,
+                 method: str = 'dhash', max_new_ink: float = DEFAULT_MAX_NEW_INK):
+        """Initialize an empty index.
+
+        Args:
+            threshold: Largest Hamming distance between the hashes of a page and a matching template
+            min_students: Number of different students a page must appear unchanged for to become a template
+            method: Hash method, one of HASH_METHODS
+            max_new_ink: Largest coarse ink coverage a block of a page may add over a template
+                before the full-resolution check is skipped
+        """
+        self._lock = threading.Lock()
+        self.configure(threshold, min_students, method, max_new_ink)
+
+    def configure(self, threshold: int = DEFAULT_HASH_THRESHOLD, min_students: int = DEFAULT_MIN_STUDENTS,
+                  method: str = 'dhash', max_new_ink: float = DEFAULT_MAX_NEW_INK) -> None:
+        """Set the matching parameters and clear the index.
+
+        Args:
+            threshold: Largest Hamming distance between the hashes of a page and a matching template
+            min_students: Number of different students a page must appear unchanged for to become a template
+            method: Hash method, one of HASH_METHODS
+            max_new_ink: Largest coarse ink coverage a block of a page may add over a template
+                before the full-resolution check is skipped
+        """
+        if method not in HASH_METHODS:
+            raise ValueError(f"Unknown page hash method: {method}")
+        with self._lock:
+            self.threshold = threshold
+            self.min_students = min_students
+            self.method = method
+            self.max_new_ink = max_new_ink
+            self._templates: List[PageSignature] = []
+            self._labels: List[str] = []
+            self._hashes = np.zeros((0, HASH_SIZE * HASH_SIZE // 8), dtype=np.uint8)
+            self._candidates: List[_Candidate] = []
+            self.matches = 0
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def signature(self, image: Image.Image) -> PageSignature:
+        """Compute the signature of a rendered page with the index's hash method."""
+        return PageSignature.from_image(image, self.method)
+
+    def add(self, signature: PageSignature, label: str) -> None:
+        """Add a template page.
+
+        Args:
+            signature: Signature of the template page
+            label: Description of where the template came from, for logging
+        """
+        with self._lock:
+            self._add(signature, label)
+
+    def seed_from_pdf(self, pdf_path: Union[str, Path], dpi: int = SEED_DPI) -> int:
+        """Add every page of a PDF, e.g. the questions PDF, as a template.
+
+        Args:
+            pdf_path: Path to the PDF
+            dpi: Resolution the pages are rendered at, that of the answer pages they are compared with
+
+        Returns:
+            Number of templates added
+        """
+        pdf_path = Path(pdf_path)
+        with SharedPDF(pdf_path) as pdf:
+            for page_index in range(pdf.page_count):
+                self.add(self.signature(pdf.render(page_index, dpi)), f"{pdf_path.name} page {page_index + 1}")
+            logger.info(f"Seeded template page index with {pdf.page_count} pages of {pdf_path}")
+            return pdf.page_count
+
+    def match(self, signature: PageSignature) -> Optional[str]:
+        """Find the template a page matches.
+
+        Args:
+            signature: Signature of the page
+
+        Returns:
+            Label of the matching template, or None if the page matches no template
+        """
+        with self._lock:
+            if not self._templates:
+                return None
+            distances = _hamming(self._hashes, signature.hash)
+            nearby = np.flatnonzero(distances <= self.threshold)
+            candidates = [(self._templates[index], self._labels[index]) for index in nearby[np.argsort(distances[nearby])]]
+            max_new_ink = self.max_new_ink
+
+        # The full-resolution check is the slow part, so it runs outside the lock
+        for template, label in candidates:
+            if signature.new_ink(template) <= max_new_ink and not signature.new_strokes(template):
+                with self._lock:
+                    self.matches += 1
+                return label
+        return None
+
+    def observe(self, signature: PageSignature, student: str) -> bool:
+        """Learn from a page of a student that matched no template.
+
+        Args:
+            signature: Signature of the page
+            student: Identifier of the student the page belongs to, e.g. their PDF path
+
+        Returns:
+            True if the page became a template
+        """
+        with self._lock:
+            candidates = list(self._candidates)
+            threshold, max_new_ink = self.threshold, self.max_new_ink
+
+        # The full-resolution checks are the slow part, so they run outside the lock
+        same = next((candidate for candidate in candidates
+                     if int(_hamming(candidate.signature.hash, signature.hash)) <= threshold
+                     and signature.new_ink(candidate.signature) <= max_new_ink
+                     and candidate.signature.new_ink(signature) <= max_new_ink
+                     and not signature.new_strokes(candidate.signature)
+                     and not candidate.signature.new_strokes(signature)), None)
+
+        with self._lock:
+            # Another thread may have promoted or evicted the candidate meanwhile
+            if same is not None and any(candidate is same for candidate in self._candidates):
+                same.students.add(student)
+                if len(same.students) < self.min_students:
+                    return False
+                self._candidates = [candidate for candidate in self._candidates if candidate is not same]
+                self._add(same.signature, f"page learned from {len(same.students)} students")
+                logger.info(f"Learned template page seen unchanged for {len(same.students)} students")
+                return True
+
+            if len(self._candidates) >= MAX_CANDIDATES:
+                self._candidates.pop(0)
+            self._candidates.append(_Candidate(signature, {student}))
+            return False
+
+    def summary(self) -> str:
+        """One-line report of the templates and the pages they matched."""
+        return f"Template page index: {len(self._templates)} templates, {self.matches} pages skipped"
+
+    def _add(self, signature: PageSignature, label: str) -> None:
+        """Add a template. Caller holds the lock."""
+        self._templates.append(signature)
+        self._labels.append(label)
+        self._hashes = np.vstack([self._hashes, signature.hash[None, :]])
+
+
+# Index shared by the extractors of all students of a run
+template_pages = TemplatePageIndex()
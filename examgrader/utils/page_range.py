@@ -0,0 +1,161 @@
+"""Page-range views over a shared PDF, used instead of writing split PDFs."""
+
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from examgrader.utils.image_utils import render_page, pixmap_to_image
+
+logger = logging.getLogger(__name__)
+
+
+class SharedPDF:
+    """A PDF opened once and shared by any number of page-range views.
+
+    PyMuPDF documents are not thread-safe, so all access goes through a lock.
+    Rendering holds the GIL anyway, so serializing it costs no parallelism.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """Open the PDF.
+
+        Args:
+            path: Path to the PDF file
+        """
+        self.path = Path(path)
+        self._doc = fitz.open(str(path))
+        self._lock = threading.Lock()
+
+    @property
+    def page_count(self) -> int:
+        """Number of pages in the PDF."""
+        return self._doc.page_count
+
+    def render(self, page_index: int, dpi: int = 300, clip: Optional[fitz.Rect] = None) -> Image.Image:
+        """Render a page to a PIL Image.
+
+        Args:
+            page_index: 0-based page number in the PDF
+            dpi: Resolution for page rendering
+            clip: Optional region of the page to render, in page coordinates
+
+        Returns:
+            Rendered RGB image
+        """
+        with self._lock:
+            return pixmap_to_image(render_page(self._doc[page_index], dpi, clip))
+
+    def text(self, page_index: int, clip: Optional[fitz.Rect] = None) -> str:
+        """Extract the text layer of a page.
+
+        Args:
+            page_index: 0-based page number in the PDF
+            clip: Optional region of the page to extract, in page coordinates
+
+        Returns:
+            Text of the page, empty for scans without a text layer
+        """
+        with self._lock:
+            return self._doc[page_index].get_text(clip=clip)
+
+    def view(self, start_page: int, end_page: int, path: Optional[Union[str, Path]] = None) -> 'PDFPageRange':
+        """Create a view of a contiguous page range.
+
+        Args:
+            start_page: First 0-based page of the range
+            end_page: Last 0-based page of the range (inclusive)
+            path: Path the view stands in for, used to name outputs (defaults to the source path)
+
+        Returns:
+            PDFPageRange over this PDF
+        """
+        return PDFPageRange(self, start_page, end_page, path)
+
+    def export(self, start_page: int, end_page: int, output_path: Union[str, Path]) -> Path:
+        """Write a page range to a new PDF file.
+
+        Returns:
+            Path to the written PDF
+        """
+        with self._lock:
+            new_doc = fitz.open()
+            new_doc.insert_pdf(self._doc, from_page=start_page, to_page=end_page)
+        new_doc.save(str(output_path))
+        new_doc.close()
+        return Path(output_path)
+
+    def close(self) -> None:
+        """Close the PDF. Views over it must no longer be used."""
+        with self._lock:
+            self._doc.close()
+
+    def __enter__(self) -> 'SharedPDF':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class PDFPageRange:
+    """Lightweight view of one student's pages in a shared multi-student PDF.
+
+    Behaves like a separate PDF to the extractors: pages are numbered from 1
+    within the view, and `path` is the file the split PDF would have been
+    written to, so debug images and JSON outputs keep their usual names. No
+    file needs to exist at that path unless the view is exported.
+    """
+
+    def __init__(self, source: SharedPDF, start_page: int, end_page: int,
+                 path: Optional[Union[str, Path]] = None):
+        """Initialize the view.
+
+        Args:
+            source: Shared PDF the pages belong to
+            start_page: First 0-based page of the range
+            end_page: Last 0-based page of the range (inclusive)
+            path: Path the view stands in for (defaults to the source path)
+        """
+        if not 0 <= start_page <= end_page < source.page_count:
+            raise ValueError(f"Invalid page range {start_page}-{end_page} for a {source.page_count}-page PDF")
+        self.source = source
+        self.start_page = start_page
+        self.end_page = end_page
+        self.path = Path(path) if path else source.path
+
+    @property
+    def page_count(self) -> int:
+        """Number of pages in the view."""
+        return self.end_page - self.start_page + 1
+
+    def render(self, page_num: int, dpi: int = 300, clip: Optional[fitz.Rect] = None) -> Image.Image:
+        """Render a page of the view.
+
+        Args:
+            page_num: 1-based page number within the view
+            dpi: Resolution for page rendering
+            clip: Optional region of the page to render, in page coordinates
+
+        Returns:
+            Rendered RGB image
+        """
+        if not 1 <= page_num <= self.page_count:
+            raise IndexError(f"Page {page_num} out of range for {self}")
+        return self.source.render(self.start_page + page_num - 1, dpi, clip)
+
+    def export(self, output_path: Optional[Union[str, Path]] = None) -> Path:
+        """Write the pages of the view to a PDF file.
+
+        Args:
+            output_path: Path of the new PDF (defaults to the view's path)
+
+        Returns:
+            Path to the written PDF
+        """
+        return self.source.export(self.start_page, self.end_page, output_path or self.path)
+
+    def __str__(self) -> str:
+        return f"{self.path.name} (pages {self.start_page}-{self.end_page} of {self.source.path.name})"
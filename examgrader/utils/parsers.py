@@ -6,15 +6,21 @@ import logging
 import time
 from typing import Dict, List, Optional, Any, Tuple, Union, Iterator
 from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from abc import ABC, abstractmethod
 from pathlib import Path
 
 from examgrader.api.gemini import GeminiAPI
 from examgrader.api.openai import OpenAIAPI
+from examgrader.api.governor import governor, OPENAI_RUBRIC
 from examgrader.extractors.questions import QuestionExtractor
 from examgrader.extractors.answers import AnswerExtractor
+from examgrader.utils.blank_page import BlankPageDetector
 from examgrader.utils.file_utils import save_intermediate_json
+from examgrader.utils.page_hash import TemplatePageIndex
+from examgrader.utils.preprocess import PagePreprocessor
+from examgrader.utils.template_subtraction import TemplateSubtractor
+from examgrader.utils.page_range import PDFPageRange
 from examgrader.utils.prompts import PromptManager
 
 logger = logging.getLogger(__name__)
@@ -61,8 +67,10 @@ def parse_table(table_md: str) -> Optional[str]:
 class BaseParser(ABC):
     """Base class for exam content parsers."""
     
-    def __init__(self, filepath: str, gemini_api: Optional[GeminiAPI] = None):
-        self.filepath = filepath
+    def __init__(self, filepath: Union[str, PDFPageRange], gemini_api: Optional[GeminiAPI] = None):
+        # Page-range views are extracted directly and named after the path they stand in for
+        self.source = filepath
+        self.filepath = str(filepath.path) if isinstance(filepath, PDFPageRange) else filepath
         self.gemini_api = gemini_api
         
     def parse(self) -> Tuple[Dict[str, Dict[str, Any]], str]:
@@ -154,15 +162,15 @@ class BaseParser(ABC):
 class RubricGenerator:
     """Generates grading rubrics for exam questions using OpenAI."""
     
-    def __init__(self, openai_api: OpenAIAPI, max_workers: int = 12):
+    def __init__(self, openai_api: OpenAIAPI):
         """Initialize the rubric generator.
         
+        Rubric generation concurrency is limited by the OPENAI_RUBRIC lane of the concurrency governor.
+        
         Args:
             openai_api: Initialized OpenAIAPI instance
-            max_workers: Maximum number of concurrent workers
         """
         self.openai_api = openai_api
-        self.max_workers = max_workers
     
     def generate_rubrics(self, questions: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
         """Generate rubrics for a set of questions.
@@ -173,16 +181,16 @@ class RubricGenerator:
         Returns:
             Updated questions dictionary with rubrics
         """
-        logger.info(f"Generating rubrics for {len(questions)} questions using OpenAI API with {self.max_workers} worker threads...")
+        logger.info(f"Generating rubrics for {len(questions)} questions using OpenAI API with {governor.limit(OPENAI_RUBRIC)} worker threads...")
         
-        # Generate rubrics in parallel
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_question = {
-                executor.submit(self._generate_single_rubric, q_num, q_data): q_num 
-                for q_num, q_data in questions.items()
-            }
-            
-            self._process_rubric_results(questions, future_to_question)
+        # Generate rubrics in parallel on the governor's shared rubric executor
+        executor = governor.executor(OPENAI_RUBRIC)
+        future_to_question = {
+            executor.submit(self._generate_single_rubric, q_num, q_data): q_num 
+            for q_num, q_data in questions.items()
+        }
+        
+        self._process_rubric_results(questions, future_to_question)
             
         return questions
     
@@ -198,7 +206,8 @@ class RubricGenerator:
         response = self.openai_api.call_api(
             user_prompt=prompt,
             model_name="o4-mini",
-            reasoning_effort="high"
+            reasoning_effort="high",
+            lane=OPENAI_RUBRIC
         )
         
         logger.info(f"Generated rubric for question {q_num}")
@@ -244,14 +253,18 @@ class QuestionParser(BaseParser):
     """Parser for exam questions."""
     
     def __init__(self, filepath: str, gemini_api: Optional[GeminiAPI] = None, 
-                 openai_api: Optional[OpenAIAPI] = None, max_workers: int = 12):
+                 openai_api: Optional[OpenAIAPI] = None, max_workers: int = 12,
+                 image_format: Optional[str] = None, image_quality: int = 90):
         super().__init__(filepath, gemini_api)
         self.openai_api = openai_api
         self.max_workers = max_workers
+        self.image_format = image_format
+        self.image_quality = image_quality
     
     def _extract_content(self) -> str:
         """Extract content using QuestionExtractor."""
-        extractor = QuestionExtractor(self.filepath, self.gemini_api)
+        extractor = QuestionExtractor(self.filepath, self.gemini_api, max_workers=self.max_workers,
+                                      image_format=self.image_format, image_quality=self.image_quality)
         content = extractor.extract()
         logger.info("Extracted question content from PDF")
         return content
@@ -310,7 +323,7 @@ class QuestionParser(BaseParser):
             logger.warning("OpenAI API not provided, skipping rubric generation")
             return questions
             
-        rubric_generator = RubricGenerator(self.openai_api, self.max_workers)
+        rubric_generator = RubricGenerator(self.openai_api)
         return rubric_generator.generate_rubrics(questions)
     
     def _save_results(self, content: Dict[str, Dict[str, Any]]) -> str:
@@ -332,14 +345,36 @@ class QuestionParser(BaseParser):
 class AnswerParser(BaseParser):
     """Parser for answer files."""
     
-    def __init__(self, filepath: str, gemini_api: Optional[GeminiAPI] = None, is_correct_answer: bool = True, questions_dict=None):
+    def __init__(self, filepath: Union[str, PDFPageRange], gemini_api: Optional[GeminiAPI] = None, is_correct_answer: bool = True, questions_dict=None,
+                 extraction_mode: str = 'serial', max_workers: int = 4, blank_detector: Optional[BlankPageDetector] = None,
+                 template_index: Optional[TemplatePageIndex] = None,
+                 template_subtractor: Optional[TemplateSubtractor] = None, low_dpi: Optional[int] = None,
+                 preprocessor: Optional[PagePreprocessor] = None, max_segments: int = 1, pages_per_call: int = 1,
+                 image_format: Optional[str] = None, image_quality: int = 90):
         super().__init__(filepath, gemini_api)
         self.is_correct_answer = is_correct_answer
         self.questions_dict = questions_dict
+        self.extraction_mode = extraction_mode
+        self.max_workers = max_workers
+        self.blank_detector = blank_detector
+        self.template_index = template_index
+        self.template_subtractor = template_subtractor
+        self.low_dpi = low_dpi
+        self.preprocessor = preprocessor
+        self.max_segments = max_segments
+        self.pages_per_call = pages_per_call
+        self.image_format = image_format
+        self.image_quality = image_quality
     
     def _extract_content(self) -> str:
         """Extract content using AnswerExtractor."""
-        extractor = AnswerExtractor(self.filepath, self.gemini_api, self.questions_dict)
+        extractor = AnswerExtractor(self.source, self.gemini_api, self.questions_dict,
+                                    extraction_mode=self.extraction_mode, max_workers=self.max_workers,
+                                    max_segments=self.max_segments, pages_per_call=self.pages_per_call,
+                                    blank_detector=self.blank_detector, template_index=self.template_index,
+                                    template_subtractor=self.template_subtractor, low_dpi=self.low_dpi,
+                                    preprocessor=self.preprocessor, image_format=self.image_format,
+                                    image_quality=self.image_quality)
         content = extractor.extract()
         logger.info("Extracted answer content from PDF")
         return content
@@ -351,33 +386,62 @@ class AnswerParser(BaseParser):
 
 def parse_questions(filepath: str, gemini_api: Optional[GeminiAPI] = None, 
                    openai_api: Optional[OpenAIAPI] = None,
-                   max_workers: int = 12) -> Tuple[Dict[str, Dict[str, Any]], str]:
+                   max_workers: int = 12, image_format: Optional[str] = None,
+                   image_quality: int = 90) -> Tuple[Dict[str, Dict[str, Any]], str]:
     """Parse questions from a file.
     
     Args:
         filepath: Path to the file containing questions
         gemini_api: Initialized GeminiAPI instance (optional)
         openai_api: Initialized OpenAIAPI instance (optional)
-        max_workers: Maximum number of worker threads for parallel processing
+        max_workers: Maximum number of question pages transcribed concurrently
+        image_format: Optional format (JPEG, PNG, WEBP) pages are encoded in once before they are
+            sent; None lets the SDK encode them on every request
+        image_quality: Encoder quality for lossy image formats
         
     Returns:
         Tuple of (parsed questions dict, output JSON file path)
     """
-    parser = QuestionParser(filepath, gemini_api, openai_api, max_workers)
+    parser = QuestionParser(filepath, gemini_api, openai_api, max_workers, image_format, image_quality)
     return parser.parse()
 
-def parse_answers(filepath: str, gemini_api: Optional[GeminiAPI] = None, is_correct_answer: bool = True,
-                 questions_dict: Optional[Dict[str, Dict[str, Any]]] = None) -> Tuple[Dict[str, Dict[str, Any]], str]:
+def parse_answers(filepath: Union[str, PDFPageRange], gemini_api: Optional[GeminiAPI] = None, is_correct_answer: bool = True,
+                 questions_dict: Optional[Dict[str, Dict[str, Any]]] = None,
+                 extraction_mode: str = 'serial', max_workers: int = 4,
+                 blank_detector: Optional[BlankPageDetector] = None,
+                 template_index: Optional[TemplatePageIndex] = None,
+                 template_subtractor: Optional[TemplateSubtractor] = None,
+                 low_dpi: Optional[int] = None,
+                 preprocessor: Optional[PagePreprocessor] = None,
+                 max_segments: int = 1,
+                 pages_per_call: int = 1,
+                 image_format: Optional[str] = None,
+                 image_quality: int = 90) -> Tuple[Dict[str, Dict[str, Any]], str]:
     """Parse answers from a file.
     
     Args:
-        filepath: Path to the file containing answers
+        filepath: Path to the file containing answers, or a page-range view of a shared PDF
         gemini_api: Initialized GeminiAPI instance (optional)
         is_correct_answer: Whether this is parsing correct answers (True) or student answers (False)
         questions_dict: Dictionary of parsed questions (required for student answers)
+        extraction_mode: Answer extraction mode for PDF files: 'serial', 'parallel' or 'speculative'
+            (see AnswerExtractor); pages_per_call above 1 sends batches of pages instead
+        max_workers: Maximum number of pages transcribed concurrently in parallel and speculative modes
+        blank_detector: Optional detector of blank pages to skip instead of transcribing
+        template_index: Optional index of pre-printed template pages to skip instead of transcribing
+        template_subtractor: Optional blank answer sheet template to crop pages to their handwriting
+        low_dpi: Optional lower resolution to render pages at first, escalating unreliable pages to full resolution
+        preprocessor: Optional cleanup (deskew, margin crop, grayscale, ...) run on pages before transcription
+        max_segments: Most blocks each page is cut into and transcribed concurrently; 1 sends whole pages
+        pages_per_call: Number of consecutive pages sent in one request, with per-page delimited output
+        image_format: Optional format (JPEG, PNG, WEBP) pages are encoded in once and reused across
+            retries, re-queries and escalations; None lets the SDK encode them on every request
+        image_quality: Encoder quality for lossy image formats
         
     Returns:
         Tuple of (parsed answers dict, output JSON file path)
     """
-    parser = AnswerParser(filepath, gemini_api, is_correct_answer, questions_dict)
+    parser = AnswerParser(filepath, gemini_api, is_correct_answer, questions_dict, extraction_mode, max_workers,
+                          blank_detector, template_index, template_subtractor, low_dpi, preprocessor,
+                          max_segments, pages_per_call, image_format, image_quality)
     return parser.parse()
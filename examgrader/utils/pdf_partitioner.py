@@ -1,28 +1,52 @@
 """Module for partitioning multi-student PDFs into individual files."""
 
 import logging
-import io
 import json
 import re
 import time
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
-from PIL import Image
+from typing import Dict, Iterator, List, Tuple, Optional
+from PIL import Image, ImageDraw, ImageFont
 
 import fitz  # PyMuPDF
 from examgrader.utils.prompts import PromptManager
-from concurrent.futures import ThreadPoolExecutor
+from examgrader.api.governor import governor, GEMINI_EXTRACTION
+from examgrader.utils.page_range import SharedPDF, PDFPageRange
+from examgrader.utils.local_id import IDDetectionStats, find_student_in_text, decode_student_barcode, get_barcode_decoder
 
 logger = logging.getLogger(__name__)
 
-def analyze_multi_student_pdf(pdf_path: Path, gemini_api, max_workers: int = 4) -> List[Dict]:
+# Region of the first page of each student holding the student ID and name, in PDF points
+# (x0, y0, x1, y1) from the top-left corner of the page
+DEFAULT_ID_REGION = (0, 0, 250, 50)
+
+# Resolution the ID region is rendered at
+ID_REGION_DPI = 144
+
+# Width of the label column drawn left of each tile of an ID mosaic, in pixels
+MOSAIC_LABEL_WIDTH = 140
+
+# Size of the page labels drawn in that column
+MOSAIC_LABEL_FONT_SIZE = 48
+
+def analyze_multi_student_pdf(pdf_path: Path, gemini_api, id_region: Optional[Tuple[float, float, float, float]] = None,
+                              source: Optional[SharedPDF] = None, batch_size: int = 1) -> List[Dict]:
     """
     Analyze PDF with Gemini Vision to identify student sections.
     
+    Pages are analyzed in parallel on the governor's shared Gemini executor. Each
+    worker renders only the ID region of its page, so memory and rendering cost
+    scale with the region rather than the page. Pages whose student ID can be read
+    locally from the text layer or a barcode are resolved without calling Gemini.
+    
     Args:
         pdf_path: Path to multi-student PDF
         gemini_api: Initialized Gemini API client
-        max_workers: Maximum number of worker threads for parallel processing (default: 4)
+        id_region: Region holding the student ID and name, in PDF points (default: DEFAULT_ID_REGION)
+        source: Optional already open PDF to render from instead of opening pdf_path
+        batch_size: Number of pages whose ID regions are tiled into one request (1 disables batching)
     
     Returns:
         List of dicts: [
@@ -31,42 +55,37 @@ def analyze_multi_student_pdf(pdf_path: Path, gemini_api, max_workers: int = 4)
             ...
         ]
     """
-    # 1. Open PDF with PyMuPDF
-    doc = fitz.open(pdf_path)
-    
-    # 2. Render pages as images for Gemini Vision API
-    image_data_list = []
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # Scale factor for better resolution
-        image_bytes = pix.tobytes("png")
-        image_data_list.append({
-            "image_bytes": image_bytes, 
-            "page_num": page_num
-        })
+    # 1. Open PDF with PyMuPDF unless the caller shares an open one
+    owns_source = source is None
+    if owns_source:
+        source = SharedPDF(pdf_path)
         
-    # 3. Process pages in parallel using a thread pool
+    # 2. Process pages in parallel, rendering each page's ID region in the worker
     # Using a dictionary with page numbers as keys to avoid synchronization issues
     results_by_page = {}
+    stats = IDDetectionStats()
     
-    def process_page(page_data):
-        page_num = page_data["page_num"]
-        result = analyze_pdf_page(page_data, gemini_api, pdf_path)
+    def process_batch(page_nums):
+        results = analyze_pdf_pages(source, page_nums, gemini_api, id_region, stats)
         
-        # Store result in the dictionary - thread-safe since each thread processes a different page
-        if result:
-            results_by_page[page_num] = result[0]  # Each page has at most one student record
-            logger.info(f"Found student info on page {page_num}: {result}")
+        # Store results in the dictionary - thread-safe since each thread processes different pages
+        for page_num, result in results.items():
+            if result:
+                results_by_page[page_num] = result[0]  # Each page has at most one student record
+                logger.info(f"Found student info on page {page_num}: {result}")
         
-        return result
+        return results
     
-    # Determine appropriate number of worker threads based on input and PDF size
-    actual_workers = min(max_workers, len(image_data_list))
-    logger.info(f"Processing PDF pages with {actual_workers} parallel threads")
+    logger.info(f"Processing PDF pages with {governor.limit(GEMINI_EXTRACTION)} parallel threads")
     
-    with ThreadPoolExecutor(max_workers=actual_workers) as executor:
-        # Process all pages in parallel
-        list(executor.map(process_page, image_data_list))
+    # 3. Process all pages in parallel, batch_size pages per request
+    executor = governor.executor(GEMINI_EXTRACTION)
+    try:
+        list(executor.map(process_batch, page_batches(source.page_count, batch_size)))
+    finally:
+        if owns_source:
+            source.close()
+    logger.info(stats.summary())
     
     # 4. Organize results into a list
     student_records = list(results_by_page.values())
@@ -99,38 +118,492 @@ def analyze_multi_student_pdf(pdf_path: Path, gemini_api, max_workers: int = 4)
     return sorted_records
 
 
-def analyze_pdf_page(page_data: Dict, gemini_api, pdf_path: Path) -> List[Dict]:
+def iter_student_sections(pdf_path: Path, gemini_api, id_region: Optional[Tuple[float, float, float, float]] = None,
+                          source: Optional[SharedPDF] = None, batch_size: int = 1) -> Iterator[Dict]:
     """
-    Send a single PDF page image to Gemini for analysis using the existing generate_content method.
+    Yield each student's section as soon as its page range is known.
+    
+    Pages are analyzed on the governor's shared Gemini executor with at most one
+    lane's worth of pages in flight, and consumed in page order. A section is
+    complete as soon as the next student's first page is found, so downstream
+    stages can start on the first students while later pages are still being
+    analyzed. As in analyze_multi_student_pdf, a student ID seen again on a later
+    page is treated as a continuation page, and pages whose student ID can be read
+    locally are resolved without calling Gemini.
     
     Args:
-        page_data: Dict with page image bytes and page number
-        gemini_api: Initialized Gemini API
-        pdf_path: Path to the PDF file being analyzed
+        pdf_path: Path to multi-student PDF
+        gemini_api: Initialized Gemini API client
+        id_region: Region holding the student ID and name, in PDF points (default: DEFAULT_ID_REGION)
+        source: Optional already open PDF to render from instead of opening pdf_path
+        batch_size: Number of pages whose ID regions are tiled into one request (1 disables batching)
+    
+    Yields:
+        Dicts: {'student_id': 'S12345', 'name': 'John Doe', 'start_page': 0, 'end_page': 3}
+    """
+    owns_source = source is None
+    if owns_source:
+        source = SharedPDF(pdf_path)
+    total_pages = source.page_count
+    executor = governor.executor(GEMINI_EXTRACTION)
+    window = governor.limit(GEMINI_EXTRACTION)
+    
+    batches = iter(page_batches(total_pages, batch_size))
+    pending = deque()
+    current = None
+    seen_ids = set()
+    assigned_pages = 0
+    stats = IDDetectionStats()
+    
+    try:
+        while True:
+            # Keep the window full; workers render their pages' ID regions themselves
+            for page_nums in batches:
+                pending.append((page_nums, executor.submit(analyze_pdf_pages, source, page_nums, gemini_api, id_region, stats)))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+            
+            page_nums, future = pending.popleft()
+            results = future.result()
+            for page_num in page_nums:
+                result = results.get(page_num)
+                if not result or result[0]['student_id'] in seen_ids:
+                    continue
+                
+                record = result[0]
+                logger.info(f"Found student info on page {page_num}: {result}")
+                seen_ids.add(record['student_id'])
+                if current:
+                    current['end_page'] = page_num - 1
+                    assigned_pages += current['end_page'] - current['start_page'] + 1
+                    yield current
+                elif page_num > 0:
+                    logger.error(f"Pages 0-{page_num - 1} precede the first student ID and are not assigned to any student")
+                current = dict(record)
+        
+        if current:
+            current['end_page'] = total_pages - 1
+            assigned_pages += current['end_page'] - current['start_page'] + 1
+            yield current
+    finally:
+        if owns_source:
+            source.close()
+    
+    logger.info(stats.summary())
+    logger.info(f"Identified {len(seen_ids)} student sections in the PDF")
+    if assigned_pages != total_pages:
+        logger.error(f"Page count mismatch: Original PDF has {total_pages} pages, but student sections have {assigned_pages} pages total")
+
+
+def iter_student_sections_by_stride(pdf_path: Path, gemini_api, pages_per_student: int,
+                                    id_region: Optional[Tuple[float, float, float, float]] = None,
+                                    source: Optional[SharedPDF] = None) -> Iterator[Dict]:
+    """
+    Yield each student's section, probing only the pages where boundaries are expected.
+    
+    For exams where every student submits about the same number of pages, the page
+    one stride after each student's first page is probed first. Only when it holds
+    no new student ID are the neighbouring pages scanned, outward from the expected
+    boundary, until the shifted boundary is found. This takes about one ID request
+    per student instead of one per page. The probes of the next few expected
+    boundaries are submitted ahead on the governor's shared Gemini executor, so a
+    run of fixed-length submissions is analyzed in parallel.
+    
+    Students who write their ID on every page make the expected page show the
+    next student even when that student started earlier. Once a page after a
+    student's first one is seen to repeat the student's ID, each boundary found
+    is therefore walked back over the pages showing the same new ID.
+    
+    A student shorter than the stride followed by another short student can be
+    missed; validate the result with validate_stride_mapping.
+    
+    Args:
+        pdf_path: Path to multi-student PDF
+        gemini_api: Initialized Gemini API client
+        pages_per_student: Expected number of pages per student
+        id_region: Region holding the student ID and name, in PDF points (default: DEFAULT_ID_REGION)
+        source: Optional already open PDF to render from instead of opening pdf_path
+    
+    Yields:
+        Dicts: {'student_id': 'S12345', 'name': 'John Doe', 'start_page': 0, 'end_page': 3}
+    """
+    owns_source = source is None
+    if owns_source:
+        source = SharedPDF(pdf_path)
+    total_pages = source.page_count
+    executor = governor.executor(GEMINI_EXTRACTION)
+    window = governor.limit(GEMINI_EXTRACTION)
+    stride = max(1, pages_per_student)
+    
+    stats = IDDetectionStats()
+    probes = {}  # page number -> future of analyze_pdf_page
+    seen_ids = set()
+    repeated_ids = False  # Whether students write their ID on pages after their first one
+    
+    def probe(page_num):
+        if page_num not in probes:
+            probes[page_num] = executor.submit(analyze_pdf_page, source, page_num, gemini_api, id_region, stats)
+        return probes[page_num]
+    
+    def record_at(page_num):
+        result = probe(page_num).result()
+        return result[0] if result else None
+    
+    def first_page_of(record, start_page):
+        # Walk back over the earlier pages of the student that also show the ID
+        page_num = record['start_page'] - 1
+        while repeated_ids and page_num > start_page:
+            earlier = record_at(page_num)
+            if not (earlier and earlier['student_id'] == record['student_id']):
+                break
+            record = earlier
+            page_num -= 1
+        return record
+    
+    def find_next_start(start_page, student_id):
+        nonlocal repeated_ids
+        expected = start_page + stride
+        for ahead in range(window):
+            if expected + ahead * stride < total_pages:
+                probe(expected + ahead * stride)
+        if expected >= total_pages:
+            return None
+        
+        record = record_at(expected)
+        if record and record['student_id'] not in seen_ids:
+            return first_page_of(record, start_page)
+        
+        # The boundary shifted; a page of the current student means it lies further on
+        search_down = not (record and record['student_id'] == student_id)
+        repeated_ids = repeated_ids or not search_down
+        for offset in range(1, total_pages):
+            candidates = []
+            if search_down and expected - offset > start_page:
+                candidates.append(expected - offset)
+            if expected + offset < total_pages:
+                candidates.append(expected + offset)
+            if not candidates:
+                return None
+            for page_num in candidates:
+                probe(page_num)
+            for page_num in candidates:
+                record = record_at(page_num)
+                if record and record['student_id'] not in seen_ids:
+                    logger.info(f"Student boundary shifted from page {expected} to page {page_num}")
+                    return first_page_of(record, start_page)
+        return None
+    
+    try:
+        current = None
+        for page_num in range(total_pages):
+            current = record_at(page_num)
+            if current:
+                if page_num > 0:
+                    logger.error(f"Pages 0-{page_num - 1} precede the first student ID and are not assigned to any student")
+                break
+        
+        if current and stride > 1 and current['start_page'] + 1 < total_pages:
+            # One probe tells whether students write their ID on every page
+            second = record_at(current['start_page'] + 1)
+            repeated_ids = bool(second and second['student_id'] == current['student_id'])
         
+        while current:
+            current = dict(current)
+            logger.info(f"Found student info on page {current['start_page']}: {current}")
+            seen_ids.add(current['student_id'])
+            record = find_next_start(current['start_page'], current['student_id'])
+            current['end_page'] = record['start_page'] - 1 if record else total_pages - 1
+            yield current
+            current = record
+    finally:
+        # Speculative probes past a shifted boundary are no longer needed
+        for future in probes.values():
+            future.cancel()
+        if owns_source:
+            source.close()
+    
+    logger.info(stats.summary())
+    logger.info(f"Boundary search identified {len(seen_ids)} student sections from {len(probes)} of {total_pages} pages")
+
+
+def validate_stride_mapping(student_mappings: Dict[str, Tuple[int, int]], pages_per_student: int) -> List[str]:
+    """
+    Check the page ranges found by boundary search against the expected submission length.
+    
+    Args:
+        student_mappings: Output of create_student_page_mapping
+        pages_per_student: Expected number of pages per student
+    
     Returns:
-        List of student records found in this page
+        IDs of the students whose page range length differs from the expected one
+    """
+    off_stride = []
+    for student_id, (start_page, end_page) in student_mappings.items():
+        page_count = end_page - start_page + 1
+        if page_count != pages_per_student:
+            off_stride.append(student_id)
+            logger.warning(f"Student {student_id} has {page_count} pages (pages {start_page}-{end_page}) instead of "
+                           f"{pages_per_student}; check that its boundaries are right")
+    return off_stride
+
+
+def page_batches(total_pages: int, batch_size: int) -> List[List[int]]:
+    """
+    Split the page numbers of a PDF into consecutive batches.
+    
+    Args:
+        total_pages: Number of pages in the PDF
+        batch_size: Maximum number of pages per batch
+    
+    Returns:
+        List of batches of 0-based page numbers
+    """
+    batch_size = max(1, batch_size)
+    return [list(range(start, min(start + batch_size, total_pages))) for start in range(0, total_pages, batch_size)]
+
+
+def analyze_pdf_pages(source: SharedPDF, page_nums: List[int], gemini_api,
+                      id_region: Optional[Tuple[float, float, float, float]] = None,
+                      stats: Optional[IDDetectionStats] = None) -> Dict[int, List[Dict]]:
+    """
+    Identify the students on a batch of pages, in one mosaic request if the batch has several pages.
+    
+    Pages whose student ID is found locally are not sent to Gemini. Pages whose
+    tile is missing or cannot be parsed in the mosaic response fall back to a
+    single-page request.
+    
+    Args:
+        source: Open multi-student PDF
+        page_nums: 0-based page numbers of the batch
+        gemini_api: Initialized Gemini API
+        id_region: Region holding the student ID and name, in PDF points (default: DEFAULT_ID_REGION)
+        stats: Optional counter of pages resolved locally and remotely
+    
+    Returns:
+        Dict mapping each page number to the student records found on it
+    """
+    results = {}
+    remote_pages = []
+    for page_num in page_nums:
+        record = detect_student_locally(source, page_num, id_region, stats)
+        if record:
+            results[page_num] = record
+        else:
+            remote_pages.append(page_num)
+    
+    if len(remote_pages) > 1:
+        mosaic_results = analyze_id_mosaic(source, remote_pages, gemini_api, id_region)
+        if stats:
+            stats.record('remote', len(mosaic_results))
+        results.update(mosaic_results)
+        fallback_pages = [page_num for page_num in remote_pages if page_num not in mosaic_results]
+        if fallback_pages:
+            logger.info(f"Falling back to single-page requests for pages {fallback_pages} of the ID mosaic")
+    else:
+        fallback_pages = remote_pages
+    
+    for page_num in fallback_pages:
+        results[page_num] = analyze_pdf_page(source, page_num, gemini_api, id_region, stats, local=False)
+    return results
+
+
+@lru_cache(maxsize=1)
+def _label_font() -> ImageFont.ImageFont:
+    """Load the font tile labels are drawn in: the scalable default font, or the bitmap one before Pillow 10.1."""
+    try:
+        return ImageFont.load_default(size=MOSAIC_LABEL_FONT_SIZE)
+    except TypeError:
+        logger.warning("Pillow before 10.1 has no scalable default font; mosaic tile labels use the small bitmap font")
+        return ImageFont.load_default()
+
+
+def build_id_mosaic(tiles: List[Tuple[int, Image.Image]]) -> Image.Image:
+    """
+    Stack ID region crops vertically into one image, each labeled with its tile number.
+    
+    Args:
+        tiles: List of (label, image) tuples, from top to bottom
+    
+    Returns:
+        Mosaic image with a label column on the left and a separator line between tiles
+    """
+    separator = 4
+    font = _label_font()
+    width = MOSAIC_LABEL_WIDTH + max(image.width for _, image in tiles)
+    height = sum(image.height for _, image in tiles) + separator * (len(tiles) - 1)
+    
+    mosaic = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(mosaic)
+    top = 0
+    for label, image in tiles:
+        mosaic.paste(image, (MOSAIC_LABEL_WIDTH, top))
+        draw.rectangle((4, top + 4, MOSAIC_LABEL_WIDTH - 8, top + image.height - 4), outline='black', width=3)
+        draw.text((MOSAIC_LABEL_WIDTH // 2 - 2, top + image.height // 2), str(label), fill='black', font=font, anchor='mm')
+        top += image.height
+        if top < height:
+            draw.rectangle((0, top, width, top + separator - 1), fill='black')
+            top += separator
+    return mosaic
+
+
+def analyze_id_mosaic(source: SharedPDF, page_nums: List[int], gemini_api,
+                      id_region: Optional[Tuple[float, float, float, float]] = None) -> Dict[int, List[Dict]]:
+    """
+    Identify the students on several pages with one request on a mosaic of their ID regions.
+    
+    Tiles are labeled with their page numbers, and the response is mapped back by label.
+    
+    Args:
+        source: Open multi-student PDF
+        page_nums: 0-based page numbers to tile
+        gemini_api: Initialized Gemini API
+        id_region: Region holding the student ID and name, in PDF points (default: DEFAULT_ID_REGION)
+    
+    Returns:
+        Dict mapping page numbers to the student records found on them; pages without
+        a parseable line in the response are left out
     """
     try:
-        image_bytes = page_data["image_bytes"]
-        page_num = page_data["page_num"]
+        mosaic = build_id_mosaic([(page_num, render_id_region(source, page_num, id_region)) for page_num in page_nums])
+        
+        if logger.getEffectiveLevel() <= logging.DEBUG:
+            debug_dir = source.path.with_name(f"debug_cropped_images_{source.path.stem}")
+            debug_dir.mkdir(exist_ok=True, parents=True)
+            debug_path = debug_dir / f"pages_{page_nums[0]}-{page_nums[-1]}_mosaic.png"
+            mosaic.save(debug_path)
+            logger.debug(f"Saved ID mosaic for pages {page_nums[0]}-{page_nums[-1]} to {debug_path}")
+        
+        response_text = gemini_api.generate_content(PromptManager.get_student_id_mosaic_prompt(page_nums), mosaic, thinking_budget=0)
+    except Exception as e:
+        logger.error(f"Error analyzing ID mosaic of pages {page_nums[0]}-{page_nums[-1]}: {str(e)}")
+        return {}
+    
+    results = {}
+    for line in (response_text or '').splitlines():
+        tile_match = re.match(r'\s*Tile\s*(\d+)\s*:\s*(.*)', line)
+        if not tile_match or int(tile_match.group(1)) not in page_nums:
+            continue
         
-        # Convert bytes to PIL Image for Gemini API
-        img = Image.open(io.BytesIO(image_bytes))
+        page_num = int(tile_match.group(1))
+        content = tile_match.group(2)
+        if 'not found' in content.lower():
+            results[page_num] = []
+            continue
         
-        # Define how much to crop (in pixels)
-        crop_width = 500    # pixels from left
-        crop_height = 100   # pixels from top
+        student_id_match = re.search(r'Student ID:\s*([^|\n]+)', content)
+        name_match = re.search(r'Name:\s*([^|\n]+)', content)
+        if student_id_match and name_match:
+            results[page_num] = student_record(student_id_match.group(1).strip(), name_match.group(1).strip(), page_num)
+    
+    return results
+
+
+def student_record(student_id: str, name: str, page_num: int) -> List[Dict]:
+    """
+    Build the student record of a page from an extracted student ID and name.
+    
+    Returns:
+        List with the record, or an empty list if the ID or name is missing or a placeholder
+    """
+    # Only include records with valid student IDs and names
+    if student_id and name and student_id.lower() not in ['not found', 'n/a', 'none', 'unknown'] and name.lower() not in ['not found', 'n/a', 'none', 'unknown']:
+        return [{
+            'student_id': student_id,
+            'name': name,
+            'start_page': page_num
+        }]
+    return []
+
+
+def detect_student_locally(source: SharedPDF, page_num: int,
+                           id_region: Optional[Tuple[float, float, float, float]] = None,
+                           stats: Optional[IDDetectionStats] = None) -> List[Dict]:
+    """
+    Look for the student ID in the ID region without calling an API.
+    
+    The text layer of the region is searched first, then the barcodes in it if a
+    barcode decoder is available. Scans without a text layer or barcode fall
+    through to Gemini.
+    
+    Args:
+        source: Open multi-student PDF
+        page_num: 0-based page number
+        id_region: Region holding the student ID and name, in PDF points (default: DEFAULT_ID_REGION)
+        stats: Optional counter of pages resolved locally and remotely
+    
+    Returns:
+        List with the student record of the page, or an empty list if none was found locally
+    """
+    try:
+        method = 'text'
+        student = find_student_in_text(source.text(page_num, fitz.Rect(id_region or DEFAULT_ID_REGION)))
+        if not student and get_barcode_decoder():
+            method = 'barcode'
+            student = decode_student_barcode(render_id_region(source, page_num, id_region))
+    except Exception as e:
+        logger.warning(f"Local student ID detection failed on page {page_num}: {str(e)}")
+        return []
+    
+    if not student:
+        return []
+    logger.debug(f"Found student ID {student[0]} on page {page_num} in the {method} without calling Gemini")
+    if stats:
+        stats.record(method)
+    return student_record(student[0], student[1], page_num)
+
+
+def render_id_region(source: SharedPDF, page_num: int,
+                     id_region: Optional[Tuple[float, float, float, float]] = None) -> Image.Image:
+    """
+    Render only the region of a page holding the student ID and name.
+    
+    Args:
+        source: Open multi-student PDF
+        page_num: 0-based page number
+        id_region: Region to render, in PDF points (default: DEFAULT_ID_REGION)
+    
+    Returns:
+        Rendered image of the region
+    """
+    return source.render(page_num, ID_REGION_DPI, clip=fitz.Rect(id_region or DEFAULT_ID_REGION))
+
+
+def analyze_pdf_page(source: SharedPDF, page_num: int, gemini_api,
+                     id_region: Optional[Tuple[float, float, float, float]] = None,
+                     stats: Optional[IDDetectionStats] = None, local: bool = True) -> List[Dict]:
+    """
+    Send the ID region of a single PDF page to Gemini for analysis using the existing generate_content method.
+    
+    Args:
+        source: Open multi-student PDF
+        page_num: 0-based page number
+        gemini_api: Initialized Gemini API
+        id_region: Region holding the student ID and name, in PDF points (default: DEFAULT_ID_REGION)
+        stats: Optional counter of pages resolved locally and remotely
+        local: Whether to try detect_student_locally before calling Gemini
         
-        # Crop top-left corner where student ID and name typically appear
-        cropped_img = img.crop((0, 0, crop_width, crop_height))  # (left, top, right, bottom)
+    Returns:
+        List of student records found in this page
+    """
+    if local:
+        record = detect_student_locally(source, page_num, id_region, stats)
+        if record:
+            return record
+    if stats:
+        stats.record('remote')
+    
+    try:
+        # Render the top-left region where student ID and name typically appear
+        cropped_img = render_id_region(source, page_num, id_region)
         
-        logger.debug(f"Cropped page {page_num} image from {img.size} to {cropped_img.size}")
+        logger.debug(f"Rendered ID region of page {page_num} at {cropped_img.size}")
         
         # Save cropped image for debugging if in debug mode
         if logger.getEffectiveLevel() <= logging.DEBUG:
             # Create debug directory relative to the pdf path
-            debug_dir = pdf_path.with_name(f"debug_cropped_images_{pdf_path.stem}")
+            debug_dir = source.path.with_name(f"debug_cropped_images_{source.path.stem}")
             debug_dir.mkdir(exist_ok=True, parents=True)
             debug_path = debug_dir / f"page_{page_num}_crop.png"
             cropped_img.save(debug_path)
@@ -151,13 +624,9 @@ def analyze_pdf_page(page_data: Dict, gemini_api, pdf_path: Path) -> List[Dict]:
             student_id = student_id_match.group(1).strip()
             name = name_match.group(1).strip()
             
-            # Only include records with valid student IDs and names
-            if student_id and name and student_id.lower() not in ['not found', 'n/a', 'none', 'unknown'] and name.lower() not in ['not found', 'n/a', 'none', 'unknown']:
-                return [{
-                    'student_id': student_id,
-                    'name': name,
-                    'start_page': page_num
-                }]
+            record = student_record(student_id, name, page_num)
+            if record:
+                return record
             else:
                 # This page doesn't have a valid student ID - this is expected for pages after the first page of each student
                 logger.debug(f"No valid student ID/name found on page {page_num} - this may be a continuation page")
@@ -168,7 +637,7 @@ def analyze_pdf_page(page_data: Dict, gemini_api, pdf_path: Path) -> List[Dict]:
         return []
         
     except Exception as e:
-        logger.error(f"Error analyzing PDF page {page_data.get('page_num')}: {str(e)}")
+        logger.error(f"Error analyzing PDF page {page_num}: {str(e)}")
         return []
 
 
@@ -263,56 +732,109 @@ def split_pdf_by_student(pdf_path: Path, student_mappings: Dict[str, Tuple[int,
     return output_files
 
 
-def partition_multi_student_pdf(pdf_path: Path, output_dir: Path, gemini_api, max_workers: int = 4) -> List[Path]:
+def create_student_views(source: SharedPDF, student_mappings: Dict[str, Tuple[int, int]],
+                         output_dir: Path) -> List[PDFPageRange]:
     """
-    Main function to partition a multi-student PDF into individual files.
+    Create page-range views of each student's pages in the shared PDF.
     
     Args:
-        pdf_path: Path to multi-student PDF
-        output_dir: Directory to save split PDFs
+        source: Open multi-student PDF
+        student_mappings: Dict mapping student IDs to page ranges
+        output_dir: Directory the split PDFs would be written to; views are named after
+            those files so outputs land where they did with split PDFs
+    
+    Returns:
+        List of page-range views, one per valid student ID
+    """
+    views = []
+    for student_id, (start_page, end_page) in student_mappings.items():
+        # Skip empty or invalid student IDs
+        if not student_id or student_id.lower() in ['not found', 'n/a', 'none', 'unknown']:
+            logger.warning(f"Skipping invalid student ID: {student_id}")
+            continue
+        
+        view = source.view(start_page, end_page, output_dir / f"{student_id}_answers.pdf")
+        views.append(view)
+        logger.debug(f"Created view for student {student_id} with pages {start_page}-{end_page} ({view.page_count} pages)")
+    
+    return views
+
+
+def partition_multi_student_pdf_views(source: SharedPDF, output_dir: Path, gemini_api,
+                                      export_pdfs: bool = False,
+                                      id_region: Optional[Tuple[float, float, float, float]] = None,
+                                      batch_size: int = 1,
+                                      pages_per_student: Optional[int] = None) -> List[PDFPageRange]:
+    """
+    Partition an open multi-student PDF into per-student page-range views.
+    
+    Args:
+        source: Open multi-student PDF
+        output_dir: Directory the views are named after, and split PDFs are written to if exported
         gemini_api: Initialized Gemini API client
-        max_workers: Maximum number of worker threads for parallel processing (default: 4)
+        export_pdfs: Whether to also write each student's pages to a split PDF
+        id_region: Region holding the student ID and name, in PDF points (default: DEFAULT_ID_REGION)
+        batch_size: Number of pages whose ID regions are tiled into one request (1 disables batching)
+        pages_per_student: Expected number of pages per student; if set, student boundaries are found
+            by boundary search instead of analyzing every page
     
     Returns:
-        List of paths to created student PDFs
+        List of page-range views, one per student
     
     Raises:
-        ValueError: If the total number of pages in the split PDFs doesn't match the original PDF
+        ValueError: If the student page ranges don't cover every page of the original PDF
     """
-    # 1. Ensure output directory exists
     output_dir.mkdir(parents=True, exist_ok=True)
+    total_pages = source.page_count
     
-    # 2. Open PDF to get total pages
-    doc = fitz.open(pdf_path)
-    total_pages = len(doc)
-    doc.close()
-    
-    logger.info(f"Partitioning multi-student PDF ({total_pages} pages) into individual files")
+    logger.info(f"Partitioning multi-student PDF ({total_pages} pages) into student page ranges")
     
-    # 3. Analyze PDF to identify student sections
-    student_records = analyze_multi_student_pdf(pdf_path, gemini_api, max_workers=max_workers)
+    # 1. Analyze PDF to identify student sections
+    if pages_per_student:
+        sections = list(iter_student_sections_by_stride(source.path, gemini_api, pages_per_student, id_region, source=source))
+        student_records = [{key: value for key, value in section.items() if key != 'end_page'} for section in sections]
+    else:
+        student_records = analyze_multi_student_pdf(source.path, gemini_api, id_region, source=source, batch_size=batch_size)
     
-    # 4. Create mapping of student IDs to page ranges
+    # 2. Create mapping of student IDs to page ranges and views over them
     student_mappings = create_student_page_mapping(student_records, total_pages)
+    if pages_per_student:
+        validate_stride_mapping(student_mappings, pages_per_student)
+    views = create_student_views(source, student_mappings, output_dir)
     
-    # 5. Split PDF into individual student PDFs
-    split_pdfs = split_pdf_by_student(pdf_path, student_mappings, output_dir)
+    # 3. Verify that all pages are accounted for
+    view_page_count = sum(view.page_count for view in views)
+    logger.debug(f"Original PDF: {total_pages} pages, student page ranges total: {view_page_count} pages")
     
-    # 6. Verify that all pages are accounted for
-    split_page_count = 0
-    for pdf_path in split_pdfs:
-        try:
-            doc = fitz.open(pdf_path)
-            split_page_count += len(doc)
-            doc.close()
-        except Exception as e:
-            logger.error(f"Error checking page count in {pdf_path}: {str(e)}")
-    
-    logger.debug(f"Original PDF: {total_pages} pages, Split PDFs total: {split_page_count} pages")
-    
-    if split_page_count != total_pages:
-        error_msg = f"Page count mismatch: Original PDF has {total_pages} pages, but split PDFs have {split_page_count} pages total"
+    if view_page_count != total_pages:
+        error_msg = f"Page count mismatch: Original PDF has {total_pages} pages, but student page ranges have {view_page_count} pages total"
         logger.error(error_msg)
         raise ValueError(error_msg)
     
-    return split_pdfs 
\ No newline at end of file
+    # 4. Optionally write the split PDFs
+    if export_pdfs:
+        for view in views:
+            view.export()
+            logger.debug(f"Exported {view}")
+    
+    return views
+
+
+def partition_multi_student_pdf(pdf_path: Path, output_dir: Path, gemini_api) -> List[Path]:
+    """
+    Main function to partition a multi-student PDF into individual files.
+    
+    Args:
+        pdf_path: Path to multi-student PDF
+        output_dir: Directory to save split PDFs
+        gemini_api: Initialized Gemini API client
+    
+    Returns:
+        List of paths to created student PDFs
+    
+    Raises:
+        ValueError: If the total number of pages in the split PDFs doesn't match the original PDF
+    """
+    with SharedPDF(pdf_path) as source:
+        views = partition_multi_student_pdf_views(source, output_dir, gemini_api, export_pdfs=True)
+        return [view.path for view in views]
@@ -0,0 +1,202 @@
+"""Vectorized cleanup of scanned pages before they are sent to the API."""
+
+import logging
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from examgrader.utils.blank_page import DEFAULT_INK_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+PREPROCESS_STEPS = ('autocrop', 'deskew', 'grayscale', 'binarize')
+
+# Side of the blocks ink is counted in when finding the content box, so dust specks do not extend it
+CROP_BLOCK_SIZE = 8
+
+# Fraction of ink pixels a block needs to count as inked
+MIN_BLOCK_INK = 0.1
+
+# Number of inked blocks a row or column of blocks needs to count as content, filtering out specks
+MIN_CONTENT_BLOCKS = 2
+
+# Fraction of inked blocks above which a row or column counts as a scanner border or shadow, not content
+MAX_CONTENT_INK = 0.9
+
+# Fraction of the content box size kept as white space around it
+CROP_PADDING = 0.02
+
+# Largest skew corrected, in degrees
+MAX_SKEW = 5.0
+
+# Step of the coarse skew search and of the fine search around its best angle, in degrees
+COARSE_SKEW_STEP = 0.5
+FINE_SKEW_STEP = 0.1
+
+# Skews smaller than this are left alone, in degrees
+MIN_SKEW = 0.1
+
+# Long edge of the downscaled copy the skew is estimated on, in pixels
+SKEW_ESTIMATE_SIZE = 1000
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """Gray level that best separates ink from paper by Otsu's method.
+
+    Args:
+        gray: Grayscale page as a uint8 array
+
+    Returns:
+        Threshold; pixels below it are ink
+    """
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight = np.cumsum(histogram)
+    total = weight[-1]
+    mean = np.cumsum(histogram * levels)
+    background = total - weight
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (mean[-1] * weight - mean * total) ** 2 / (weight * background)
+    variance[~np.isfinite(variance)] = 0
+    return int(np.argmax(variance)) + 1
+
+
+def content_box(gray: np.ndarray, ink_threshold: int = DEFAULT_INK_THRESHOLD) -> Optional[Tuple[int, int, int, int]]:
+    """Find the box around the ink of a page from its row and column projection profiles.
+
+    Args:
+        gray: Grayscale page as a uint8 array
+        ink_threshold: Gray level (0-255) below which a pixel counts as ink
+
+    Returns:
+        (left, top, right, bottom) box in pixels including padding, or None if the page has no ink
+    """
+    block = CROP_BLOCK_SIZE
+    rows, cols = gray.shape[0] // block, gray.shape[1] // block
+    if not rows or not cols:
+        return None
+    ink = (gray[:rows * block, :cols * block] < ink_threshold).reshape(rows, block, cols, block).mean(axis=(1, 3))
+    inked = ink >= MIN_BLOCK_INK
+
+    row_profile = inked.sum(axis=1)
+    col_profile = inked.sum(axis=0)
+    content_rows = np.flatnonzero((row_profile >= MIN_CONTENT_BLOCKS) & (row_profile <= MAX_CONTENT_INK * cols))
+    content_cols = np.flatnonzero((col_profile >= MIN_CONTENT_BLOCKS) & (col_profile <= MAX_CONTENT_INK * rows))
+    if not len(content_rows) or not len(content_cols):
+        return None
+
+    top, bottom = content_rows[0] * block, (content_rows[-1] + 1) * block
+    left, right = content_cols[0] * block, (content_cols[-1] + 1) * block
+    pad_y, pad_x = int((bottom - top) * CROP_PADDING), int((right - left) * CROP_PADDING)
+    return (max(0, left - pad_x), max(0, top - pad_y),
+            min(gray.shape[1], right + pad_x), min(gray.shape[0], bottom + pad_y))
+
+
+def estimate_skew(gray: np.ndarray, ink_threshold: int = DEFAULT_INK_THRESHOLD) -> float:
+    """Estimate the skew of a page from the sharpness of its row projection profile.
+
+    Text lines give the sharpest row profile when they are horizontal, so the ink
+    pixels are projected onto rows at each candidate angle and the angle with the
+    largest profile variance wins. All candidate angles are evaluated at once.
+
+    Args:
+        gray: Grayscale page as a uint8 array
+        ink_threshold: Gray level (0-255) below which a pixel counts as ink
+
+    Returns:
+        Counter-clockwise rotation in degrees that straightens the page
+    """
+    scale = max(gray.shape) / SKEW_ESTIMATE_SIZE
+    if scale > 1:
+        image = Image.fromarray(gray)
+        gray = np.asarray(image.resize((round(gray.shape[1] / scale), round(gray.shape[0] / scale)),
+                                       Image.Resampling.BOX))
+    ys, xs = np.nonzero(gray < ink_threshold)
+    if len(ys) < 100:
+        return 0.0
+    # Spread each pixel over its area, otherwise the pixel grid itself makes 0 degrees look sharpest
+    jitter = np.random.default_rng(0).random((2, len(ys)), dtype=np.float32) - 0.5
+    ys = ys + jitter[0] - gray.shape[0] / 2
+    xs = xs + jitter[1] - gray.shape[1] / 2
+    height = int(np.hypot(*gray.shape)) + 2
+
+    def best_angle(angles: np.ndarray) -> float:
+        radians = np.deg2rad(angles)[:, None]
+        # Row each ink pixel lands on once the page is rotated by each angle
+        rows = np.rint(ys * np.cos(radians) + xs * np.sin(radians) + height / 2).astype(np.int64)
+        offsets = np.arange(len(angles))[:, None] * height
+        profiles = np.bincount((rows + offsets).ravel(), minlength=len(angles) * height).reshape(len(angles), height)
+        return float(angles[int(np.argmax(profiles.astype(np.float32).var(axis=1)))])
+
+    coarse = best_angle(np.arange(-MAX_SKEW, MAX_SKEW + COARSE_SKEW_STEP / 2, COARSE_SKEW_STEP))
+    fine = best_angle(np.arange(coarse - COARSE_SKEW_STEP, coarse + COARSE_SKEW_STEP + FINE_SKEW_STEP / 2,
+                                FINE_SKEW_STEP))
+    return -fine
+
+
+class PagePreprocessor:
+    """Cleans up scanned pages: deskew, margin crop, grayscale or binarize, and downscale.
+
+    Each step can be switched on separately. Steps run in the order grayscale,
+    deskew, autocrop, downscale, binarize, and the image analysis behind them is
+    vectorized with NumPy.
+    """
+
+    def __init__(self, steps: Iterable[str] = ('autocrop', 'deskew', 'grayscale'), max_long_edge: Optional[int] = None,
+                 ink_threshold: int = DEFAULT_INK_THRESHOLD):
+        """Initialize the preprocessor.
+
+        Args:
+            steps: Steps to run, any of PREPROCESS_STEPS
+            max_long_edge: Optional long edge in pixels pages are downscaled to if they are larger
+            ink_threshold: Gray level (0-255) below which a pixel counts as ink
+
+        Raises:
+            ValueError: If a step is unknown
+        """
+        self.steps = set(steps)
+        unknown = self.steps - set(PREPROCESS_STEPS)
+        if unknown:
+            raise ValueError(f"Unknown preprocessing steps: {', '.join(sorted(unknown))}")
+        self.max_long_edge = max_long_edge
+        self.ink_threshold = ink_threshold
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        """Run the enabled steps on a page.
+
+        Args:
+            image: Rendered page
+
+        Returns:
+            Preprocessed page; the image itself if no step changed it
+        """
+        original_size = image.size
+        if 'grayscale' in self.steps or 'binarize' in self.steps:
+            image = image.convert('L')
+        gray = image if image.mode == 'L' else image.convert('L')
+
+        if 'deskew' in self.steps:
+            angle = estimate_skew(np.asarray(gray), self.ink_threshold)
+            if abs(angle) >= MIN_SKEW:
+                logger.debug(f"Deskewing page by {angle:.1f} degrees")
+                image = image.rotate(angle, resample=Image.Resampling.BILINEAR, fillcolor='white')
+                gray = image if image.mode == 'L' else image.convert('L')
+
+        if 'autocrop' in self.steps:
+            box = content_box(np.asarray(gray), self.ink_threshold)
+            if box and box != (0, 0) + image.size:
+                image = image.crop(box)
+
+        if self.max_long_edge and max(image.size) > self.max_long_edge:
+            scale = self.max_long_edge / max(image.size)
+            image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                 Image.Resampling.LANCZOS)
+
+        if 'binarize' in self.steps:
+            gray = np.asarray(image)
+            image = Image.fromarray(np.where(gray < otsu_threshold(gray), 0, 255).astype(np.uint8))
+
+        if image.size != original_size:
+            logger.debug(f"Preprocessed page {original_size} -> {image.size}")
+        return image
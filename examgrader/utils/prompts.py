@@ -1,6 +1,6 @@
 """Module containing prompt templates for AI interactions."""
 
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 class PromptManager:
     """Manages prompts for different types of extractions and grading"""
@@ -43,6 +43,33 @@ The explanation should be clear and brief, explaining how many points were award
 
     Otherwise, respond with "NOT FOUND"."""
 
+    @staticmethod
+    def get_student_id_mosaic_prompt(tile_labels: List[int]) -> str:
+        """Get prompt for extracting student IDs and names from a mosaic of labeled page crops
+        
+        Args:
+            tile_labels: Labels drawn on the tiles, from top to bottom
+        """
+        labels = ", ".join(str(label) for label in tile_labels)
+        return f"""The image is a vertical stack of {len(tile_labels)} tiles separated by horizontal lines. Each tile is the top left corner of a handwritten exam page, with its tile number printed in a box on the left: {labels}.
+
+For each tile, identify the student ID and name written on it.
+    1. The student ID contains exactly **nine digits** (e.g., 412410001). 
+    2. The student name contains **traditional Chinese characters** (e.g., 黃耀廷)
+
+Note that a tile may contain other irrelevant text below the student ID and name. 
+Note that most tiles may not contain a student ID and name at all.
+
+Respond with exactly one line per tile, in tile order, in this exact format:
+Tile [tile number]: Student ID: [student ID] | Name: [student name]
+
+If a tile contains no student ID and name, respond for it with:
+Tile [tile number]: NOT FOUND
+
+e.g.,
+Tile 12: Student ID: 412410001 | Name: 黃耀廷
+Tile 13: NOT FOUND"""
+
     @staticmethod
     def get_jailbreak_detection_prompt() -> str:
         """Get prompt for detecting jailbreak attempts in user prompts"""
@@ -123,6 +150,30 @@ DETAILS: [Detailed explanation of findings]
           * Ensure consistent subproblem labeling (e.g. 2a, 2b, 2c, 2d, ...)
         """
     
+    @staticmethod
+    def get_answer_extraction_no_context_note() -> str:
+        """Get note appended to the answer extraction prompt when the previous page is unknown"""
+        return """Note: This page is transcribed on its own, without knowing which question the previous page ended with.
+        If the page begins with text without a question number and subproblem letter, do NOT guess its question number.
+        Instead, start your output with the line 題號：（續） followed by that text, then format the remaining answers on the page as usual."""
+    
+    @staticmethod
+    def get_answer_batch_note(page_count: int) -> str:
+        """Get note appended to the answer extraction prompt when several pages are sent in one request"""
+        return f"""Note: This request contains {page_count} page images of the same answer sheet, in page order.
+        Transcribe every page. Begin the output of each page with a line of the form ===== PAGE n =====, where n is the
+        position of the page image in this request (1 to {page_count}), even if the page holds no answers.
+        Any note about the previous page refers to the page before the first image. If a page begins with text without a
+        question number and subproblem letter, it continues the last question of the page before it; format it as
+        題號：<that question>（續） as usual."""
+    
+    @staticmethod
+    def get_answer_segment_note() -> str:
+        """Get note appended to the answer extraction prompt for a block cut from the middle of a page"""
+        return """Note: This image is a horizontal strip cut from a page below another strip, which is transcribed separately.
+        Transcribe only what is in this strip. If the strip begins with text without a question number and subproblem letter, do NOT guess its question number.
+        Instead, start your output with the line 題號：（續） followed by that text, then format the remaining answers in the strip as usual."""
+    
     @staticmethod
     def get_question_extraction_prompt() -> str:
         """Get prompt for extracting questions from pages"""
@@ -164,16 +215,18 @@ DETAILS: [Detailed explanation of findings]
         <content including any table or figure markup>"""
 
     @staticmethod
-    def get_grading_prompt(question_data: Dict[str, Any], correct_ans: Dict[str, Any], student_ans: Dict[str, Any]) -> str:
-        """Get prompt for grading an answer
+    def get_grading_prompt_segments(question_data: Dict[str, Any], correct_ans: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the parts of the grading prompt that do not depend on the student's answer
         
         Args:
             question_data: Dictionary with question information
             correct_ans: Dictionary with correct answer information
-            student_ans: Dictionary with student answer information
             
         Returns:
-            Formatted grading prompt
+            Dictionary with the formatted question text, correct answer text and scoring rules
+            
+        Raises:
+            ValueError: If the question has no usable rubric
         """
         # Format the question text with any tables or figures
         question_text = question_data['text']
@@ -192,6 +245,48 @@ DETAILS: [Detailed explanation of findings]
             correct_text = correct_text.replace('[TABLE]', table_md, 1)
         for figure in correct_ans.get('figures', []):
             correct_text = correct_text.replace('[FIGURE]', f"[Figure: {figure}]", 1)
+
+        # Get the rubric for this question
+        rubric = question_data.get('rubric', '')
+        if not rubric or rubric.startswith('Failed to generate rubric'):
+            # If no rubric is available, raise an error
+            raise ValueError("No rubric available for grading. A rubric is required for grading.")
+        
+        scoring_rules = f"""**Rubric評分標準**
+{rubric}
+
+**注意事項**
+- 根據以上Rubric評分標準給分，總分為{question_data['score']}分
+- 可以給予部分分數，但不能超過各項Rubric評分標準的分數上限
+- 若學生的答案和參考答案不同但合理，可獨立根據其方法的正確性和完整性評分
+- 簡短說明每一個Rubric評分項目的評分理由，無得分也請說明"""
+        
+        return {
+            'question_text': question_text,
+            'correct_text': correct_text,
+            'correct_has_tables': len(correct_ans.get('tables', [])) > 0,
+            'scoring_rules': scoring_rules,
+        }
+
+    @staticmethod
+    def get_grading_prompt(question_data: Dict[str, Any], correct_ans: Dict[str, Any], student_ans: Dict[str, Any],
+                           segments: Optional[Dict[str, Any]] = None) -> str:
+        """Get prompt for grading an answer
+        
+        Args:
+            question_data: Dictionary with question information
+            correct_ans: Dictionary with correct answer information
+            student_ans: Dictionary with student answer information
+            segments: Optional pre-rendered result of get_grading_prompt_segments()
+            
+        Returns:
+            Formatted grading prompt
+        """
+        if segments is None:
+            segments = PromptManager.get_grading_prompt_segments(question_data, correct_ans)
+        question_text = segments['question_text']
+        correct_text = segments['correct_text']
+        scoring_rules = segments['scoring_rules']
             
         # Format the student answer text with any tables or figures
         student_text = student_ans['text']
@@ -203,7 +298,7 @@ DETAILS: [Detailed explanation of findings]
             student_text = student_text.replace('[FIGURE]', f"[Figure: {figure}]", 1)
         
         has_tables = (
-            len(correct_ans.get('tables', [])) > 0 or 
+            segments['correct_has_tables'] or 
             len(student_ans.get('tables', [])) > 0
         )
         
@@ -212,21 +307,6 @@ DETAILS: [Detailed explanation of findings]
 - 學生答案表格格式和參考答案表格格式通常不同，只要內容基本相同即可
 - 重點在於學生答案的表格要傳達的信息，是否和參考答案的表格要傳達的信息一樣，而非表格的格式
 """ if has_tables else ""
-
-        # Get the rubric for this question
-        rubric = question_data.get('rubric', '')
-        if not rubric or rubric.startswith('Failed to generate rubric'):
-            # If no rubric is available, raise an error
-            raise ValueError("No rubric available for grading. A rubric is required for grading.")
-        
-        scoring_rules = f"""**Rubric評分標準**
-{rubric}
-
-**注意事項**
-- 根據以上Rubric評分標準給分，總分為{question_data['score']}分
-- 可以給予部分分數，但不能超過各項Rubric評分標準的分數上限
-- 若學生的答案和參考答案不同但合理，可獨立根據其方法的正確性和完整性評分
-- 簡短說明每一個Rubric評分項目的評分理由，無得分也請說明"""
         
         prompt = f"""
 以下是題目與參考答案：
@@ -0,0 +1,102 @@
+"""Cutting answer pages into blocks at horizontal whitespace gaps."""
+
+import logging
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from examgrader.utils.blank_page import DEFAULT_INK_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Most blocks a page is cut into
+DEFAULT_MAX_SEGMENTS = 4
+
+# Largest fraction of ink pixels a row may have and still count as whitespace
+MAX_GAP_INK = 0.002
+
+# Rows and columns inked over more than this fraction are ruled lines or scanner borders, not writing
+RULED_LINE_INK = 0.5
+
+# Smallest whitespace gap a page is cut at, as a fraction of the page height
+MIN_GAP_FRACTION = 0.015
+
+# Smallest block height, as a fraction of the page height; cuts leaving shorter blocks are not made
+MIN_SEGMENT_FRACTION = 0.1
+
+
+def whitespace_gaps(gray: np.ndarray, ink_threshold: int = DEFAULT_INK_THRESHOLD) -> List[Tuple[int, int]]:
+    """Find the runs of whitespace rows between the writing on a page.
+
+    Ruled lines and vertical borders are ignored, so lined and squared paper
+    still has gaps between lines of writing.
+
+    Args:
+        gray: Grayscale page as a uint8 array
+        ink_threshold: Gray level (0-255) below which a pixel counts as ink
+
+    Returns:
+        (first row, end row) of each gap at least MIN_GAP_FRACTION of the page high,
+        excluding the margins above the first and below the last writing
+    """
+    ink = gray < ink_threshold
+    writing_cols = ink.mean(axis=0) <= RULED_LINE_INK
+    row_ink = ink[:, writing_cols].mean(axis=1) if writing_cols.any() else np.zeros(len(gray))
+    blank = (row_ink <= MAX_GAP_INK) | (row_ink > RULED_LINE_INK)
+
+    # Starts and ends of the runs of blank rows
+    edges = np.diff(np.concatenate(([0], blank.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    min_gap = max(1, int(len(gray) * MIN_GAP_FRACTION))
+    return [(int(start), int(end)) for start, end in zip(starts, ends)
+            if end - start >= min_gap and start > 0 and end < len(gray)]
+
+
+def segment_rows(gray: np.ndarray, max_segments: int = DEFAULT_MAX_SEGMENTS,
+                 ink_threshold: int = DEFAULT_INK_THRESHOLD) -> List[Tuple[int, int]]:
+    """Choose where to cut a page into at most max_segments blocks.
+
+    The widest gaps are cut first, at their middle, as long as every block stays
+    at least MIN_SEGMENT_FRACTION of the page high.
+
+    Args:
+        gray: Grayscale page as a uint8 array
+        max_segments: Most blocks to cut the page into
+        ink_threshold: Gray level (0-255) below which a pixel counts as ink
+
+    Returns:
+        (top, bottom) rows of each block in page order; the whole page if it is not cut
+    """
+    height = len(gray)
+    min_height = int(height * MIN_SEGMENT_FRACTION)
+    cuts = [0, height]
+    for start, end in sorted(whitespace_gaps(gray, ink_threshold), key=lambda gap: gap[0] - gap[1]):
+        if len(cuts) - 1 >= max_segments:
+            break
+        cut = (start + end) // 2
+        position = int(np.searchsorted(cuts, cut))
+        if cut - cuts[position - 1] >= min_height and cuts[position] - cut >= min_height:
+            cuts.insert(position, cut)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def split_page(image: Image.Image, max_segments: int = DEFAULT_MAX_SEGMENTS,
+               ink_threshold: int = DEFAULT_INK_THRESHOLD) -> List[Image.Image]:
+    """Cut a page into blocks of answers at its widest whitespace gaps.
+
+    Args:
+        image: Rendered page
+        max_segments: Most blocks to cut the page into
+        ink_threshold: Gray level (0-255) below which a pixel counts as ink
+
+    Returns:
+        Full-width crops of the blocks in page order; [image] if the page is not cut
+    """
+    if max_segments <= 1:
+        return [image]
+    rows = segment_rows(np.asarray(image.convert('L')), max_segments, ink_threshold)
+    if len(rows) == 1:
+        return [image]
+    logger.debug(f"Cut page into {len(rows)} blocks at rows {[top for top, _ in rows[1:]]}")
+    return [image.crop((0, top, image.width, bottom)) for top, bottom in rows]
@@ -0,0 +1,232 @@
+"""Cropping printed answer sheets down to the handwriting added to a blank template."""
+
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from examgrader.utils.blank_page import DEFAULT_INK_THRESHOLD
+from examgrader.utils.page_range import SharedPDF
+
+logger = logging.getLogger(__name__)
+
+# Side of the pixel blocks the ink masks are computed on
+MASK_BLOCK_SIZE = 4
+
+# Largest offset between a scanned page and its template that alignment searches, in blocks
+MAX_SHIFT_BLOCKS = 25
+
+# Side of the tiles aligned separately after the global alignment, so skewed scans line up too, in blocks
+TILE_BLOCKS = 48
+
+# Largest offset each tile is moved by relative to the global alignment, in blocks
+MAX_TILE_SHIFT_BLOCKS = 3
+
+# Blocks the template ink is grown by, absorbing residual misalignment and scanner blur
+TEMPLATE_DILATION_BLOCKS = 1
+
+# Smallest number of new-ink blocks in a block row for it to count as handwriting, filtering out specks
+MIN_ROW_INK_BLOCKS = 2
+
+# Handwriting rows closer than this many blocks are cropped as one band
+BAND_GAP_BLOCKS = 12
+
+# Blocks of context kept around each band
+BAND_PADDING_BLOCKS = 4
+
+# Height of the separator drawn between stacked bands, in pixels
+BAND_SEPARATOR = 4
+
+
+def ink_blocks(gray: np.ndarray) -> np.ndarray:
+    """Mark the MASK_BLOCK_SIZE blocks of a grayscale page that contain any ink."""
+    block = MASK_BLOCK_SIZE
+    rows, cols = gray.shape[0] // block, gray.shape[1] // block
+    darkest = gray[:rows * block, :cols * block].reshape(rows, block, cols, block).min(axis=(1, 3))
+    return darkest < DEFAULT_INK_THRESHOLD
+
+
+def _dilate(mask: np.ndarray, radius: int) -> np.ndarray:
+    """Grow a boolean mask by radius blocks in every direction."""
+    padded = np.pad(mask, radius)
+    rows, cols = mask.shape
+    grown = np.zeros_like(mask)
+    for dy in range(2 * radius + 1):
+        for dx in range(2 * radius + 1):
+            grown |= padded[dy:dy + rows, dx:dx + cols]
+    return grown
+
+
+def _profile_shift(page_profile: np.ndarray, template_profile: np.ndarray, max_shift: int) -> int:
+    """Offset of the page relative to the template that best lines up two ink projections."""
+    page_profile = page_profile - page_profile.mean()
+    template_profile = template_profile - template_profile.mean()
+    length = min(len(page_profile), len(template_profile))
+    best_shift, best_score = 0, -np.inf
+    for shift in range(-max_shift, max_shift + 1):
+        if shift >= 0:
+            score = np.dot(page_profile[shift:length], template_profile[:length - shift])
+        else:
+            score = np.dot(page_profile[:length + shift], template_profile[-shift:length])
+        if score > best_score:
+            best_shift, best_score = shift, score
+    return best_shift
+
+
+def _shift_mask(mask: np.ndarray, dy: int, dx: int) -> np.ndarray:
+    """Move a boolean mask by (dy, dx) blocks, filling uncovered blocks with False."""
+    shifted = np.zeros_like(mask)
+    rows, cols = mask.shape
+    shifted[max(dy, 0):rows + min(dy, 0), max(dx, 0):cols + min(dx, 0)] = \
+        mask[max(-dy, 0):rows + min(-dy, 0), max(-dx, 0):cols + min(-dx, 0)]
+    return shifted
+
+
+def new_ink_blocks(page_ink: np.ndarray, template_ink: np.ndarray) -> np.ndarray:
+    """Find the ink blocks of a page that are not on its template.
+
+    The page is aligned to the template by cross-correlating their ink projections,
+    then refined tile by tile to follow skew; template ink is grown to absorb
+    residual misalignment before it is subtracted.
+
+    Args:
+        page_ink: Ink blocks of the page, from ink_blocks()
+        template_ink: Ink blocks of the template at the same size
+
+    Returns:
+        Boolean mask of MASK_BLOCK_SIZE blocks holding new ink
+    """
+    dy = _profile_shift(page_ink.sum(axis=1).astype(np.float32), template_ink.sum(axis=1).astype(np.float32), MAX_SHIFT_BLOCKS)
+    dx = _profile_shift(page_ink.sum(axis=0).astype(np.float32), template_ink.sum(axis=0).astype(np.float32), MAX_SHIFT_BLOCKS)
+    # Skew moves each part of the page by a different offset, so each tile is refined on its own
+    offsets = [(dy + sy, dx + sx) for sy in range(-MAX_TILE_SHIFT_BLOCKS, MAX_TILE_SHIFT_BLOCKS + 1)
+               for sx in range(-MAX_TILE_SHIFT_BLOCKS, MAX_TILE_SHIFT_BLOCKS + 1)]
+    leftovers = page_ink & ~np.stack([_dilate(_shift_mask(template_ink, oy, ox), TEMPLATE_DILATION_BLOCKS)
+                                      for oy, ox in offsets])
+    new_ink = np.zeros_like(page_ink)
+    for top in range(0, page_ink.shape[0], TILE_BLOCKS):
+        for left in range(0, page_ink.shape[1], TILE_BLOCKS):
+            tiles = leftovers[:, top:top + TILE_BLOCKS, left:left + TILE_BLOCKS]
+            new_ink[top:top + TILE_BLOCKS, left:left + TILE_BLOCKS] = tiles[int(np.argmin(tiles.sum(axis=(1, 2))))]
+    return new_ink
+
+
+def _bands(row_has_ink: np.ndarray) -> List[Tuple[int, int]]:
+    """Group the block rows holding handwriting into padded bands of (first row, last row)."""
+    rows = np.flatnonzero(row_has_ink)
+    if not len(rows):
+        return []
+    bands = []
+    start = previous = rows[0]
+    for row in rows[1:]:
+        if row - previous > BAND_GAP_BLOCKS:
+            bands.append((start, previous))
+            start = row
+        previous = row
+    bands.append((start, previous))
+    last_row = len(row_has_ink) - 1
+    return [(max(0, first - BAND_PADDING_BLOCKS), min(last_row, last + BAND_PADDING_BLOCKS)) for first, last in bands]
+
+
+class TemplateSubtractor:
+    """Crops student pages to the regions where they differ from a blank answer sheet.
+
+    Each page is aligned to the template page with the same number by cross-correlating
+    their ink projections, then refined tile by tile to follow skew. Template ink is
+    grown to absorb residual misalignment and subtracted, and the rows that still hold ink are cropped out of the original page
+    and stacked. The crops keep the original pixels and reach from the left edge of
+    the printed content, so question labels next to the answers stay visible.
+    """
+
+    def __init__(self, template_path: Union[str, Path]):
+        """Open the blank template PDF.
+
+        Args:
+            template_path: Path to a PDF of the blank answer sheet, one page per answer page
+        """
+        self.template_path = Path(template_path)
+        self._template = SharedPDF(self.template_path)
+        self._masks: Dict[Tuple[int, Tuple[int, int]], np.ndarray] = {}
+        self._lock = threading.Lock()
+        logger.info(f"Subtracting {self._template.page_count}-page answer sheet template {self.template_path}")
+
+    @property
+    def page_count(self) -> int:
+        """Number of pages in the template."""
+        return self._template.page_count
+
+    def _template_mask(self, page_index: int, size: Tuple[int, int]) -> np.ndarray:
+        """Ink blocks of a template page rendered at the size of a student page, cached per size."""
+        key = (page_index, size)
+        with self._lock:
+            mask = self._masks.get(key)
+        if mask is None:
+            page_width = self._template.render(page_index, 72).width
+            image = self._template.render(page_index, round(72 * size[0] / page_width))
+            if image.size != size:
+                image = image.resize(size, Image.Resampling.BILINEAR)
+            mask = ink_blocks(np.asarray(image.convert('L')))
+            with self._lock:
+                self._masks[key] = mask
+        return mask
+
+    def handwriting_mask(self, page_num: int, image: Image.Image) -> Optional[np.ndarray]:
+        """Find the ink blocks of a page that are not on its template.
+
+        Args:
+            page_num: 1-based page number, selecting the template page
+            image: Rendered student page
+
+        Returns:
+            Boolean mask of MASK_BLOCK_SIZE blocks, or None if the template has no such page
+        """
+        if page_num > self.page_count:
+            return None
+        page_ink = ink_blocks(np.asarray(image.convert('L')))
+        return new_ink_blocks(page_ink, self._template_mask(page_num - 1, image.size))
+
+    def apply(self, page_num: int, image: Image.Image) -> Optional[Image.Image]:
+        """Crop a page down to its handwriting.
+
+        Args:
+            page_num: 1-based page number, selecting the template page
+            image: Rendered student page
+
+        Returns:
+            Stacked crops of the handwritten bands; the page itself if the template has no
+            page for it; None if the page holds no handwriting
+        """
+        mask = self.handwriting_mask(page_num, image)
+        if mask is None:
+            return image
+
+        bands = _bands(mask.sum(axis=1) >= MIN_ROW_INK_BLOCKS)
+        if not bands:
+            return None
+
+        block = MASK_BLOCK_SIZE
+        template_cols = np.flatnonzero(self._template_mask(page_num - 1, image.size).any(axis=0))
+        ink_cols = np.flatnonzero(mask.any(axis=0))
+        left = min(template_cols[0] if len(template_cols) else ink_cols[0], ink_cols[0])
+        right = min(mask.shape[1] - 1, ink_cols[-1] + BAND_PADDING_BLOCKS)
+        box_left, box_right = left * block, (right + 1) * block
+
+        crops = [image.crop((box_left, first * block, box_right, (last + 1) * block)) for first, last in bands]
+        height = sum(crop.height for crop in crops) + BAND_SEPARATOR * (len(crops) - 1)
+        stacked = Image.new(image.mode, (box_right - box_left, height), 'white')
+        draw = ImageDraw.Draw(stacked)
+        top = 0
+        for crop in crops:
+            stacked.paste(crop, (0, top))
+            top += crop.height
+            if top < height:
+                draw.rectangle((0, top, stacked.width, top + BAND_SEPARATOR - 1), fill='black')
+                top += BAND_SEPARATOR
+        return stacked
+
+    def close(self) -> None:
+        """Close the template PDF."""
+        self._template.close()
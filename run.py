@@ -6,7 +6,11 @@ from examgrader.main import main
 from examgrader.web import app
 
 if __name__ == '__main__':
-    if '--web' in sys.argv:
+    if len(sys.argv) > 1 and sys.argv[1] == 'compile':
+        # Compile questions, rubrics and correct answers into an exam bundle
+        from examgrader.bundle import compile_main
+        sys.exit(compile_main(sys.argv[2:]))
+    elif '--web' in sys.argv:
         import argparse
         parser = argparse.ArgumentParser(description='ExamGrader - Web Interface')
         parser.add_argument('--web', action='store_true', help='Start web interface')
@@ -0,0 +1,99 @@
+"""Tests for the pure logic of answer extraction."""
+
+import fitz  # PyMuPDF
+import pytest
+
+from examgrader.extractors.answers import AnswerExtractor, QuestionNumberValidator
+
+QUESTIONS = {key: {'text': '', 'score': 1} for key in ['1', '2', '2a', '2b', '3', '4', '5']}
+
+
+@pytest.fixture
+def validator():
+    return QuestionNumberValidator(QUESTIONS)
+
+
+def test_answer_sequence_skips_questions_with_subproblems(validator):
+    assert validator.answer_sequence == ['1', '2a', '2b', '3', '4', '5']
+
+
+def test_prediction_spreads_remaining_questions_over_remaining_pages(validator):
+    # Five questions are left after 1 for five pages, one per page
+    assert validator.predict_last_question('1', None, pages_ahead=1, pages_remaining=5) == ('2', 'a')
+    assert validator.predict_last_question('1', None, pages_ahead=3, pages_remaining=5) == ('3', None)
+
+
+def test_prediction_before_the_first_page(validator):
+    assert validator.predict_last_question(None, None, pages_ahead=1, pages_remaining=6) == ('1', None)
+
+
+def test_prediction_stops_at_the_last_question(validator):
+    assert validator.predict_last_question('4', None, pages_ahead=5, pages_remaining=1) == ('5', None)
+
+
+def test_prediction_keeps_parenthesized_subproblem_format(validator):
+    assert validator.predict_last_question('2', '(a)', pages_ahead=1, pages_remaining=4) == ('2', '(b)')
+
+
+def test_prediction_of_unknown_subproblem_starts_at_its_main_question(validator):
+    assert validator.predict_last_question('2', 'z', pages_ahead=1, pages_remaining=4) == ('2', 'b')
+
+
+def test_no_prediction_without_pages_ahead(validator):
+    assert validator.predict_last_question('2', 'a', pages_ahead=0, pages_remaining=4) == ('2', 'a')
+
+
+class FakeGeminiAPI:
+    """Answers batch requests with a fixed response and single pages with their own answer."""
+
+    def __init__(self, batch_response: str):
+        self.batch_response = batch_response
+        self.requests = []  # Number of pages of each request
+
+    def generate_content(self, prompt, image=None, **kwargs):
+        pages = len(image) if isinstance(image, list) else 1
+        self.requests.append(pages)
+        return self.batch_response if pages > 1 else "題號：3\n答：single page"
+
+
+@pytest.fixture
+def answer_pdf(tmp_path):
+    """Three-page answer PDF."""
+    path = tmp_path / "student.pdf"
+    with fitz.open() as doc:
+        for page_num in range(1, 4):
+            doc.new_page().insert_text((72, 72), f"Answer page {page_num}")
+        doc.save(path)
+    return str(path)
+
+
+def test_split_batch_response():
+    text = "preamble\n===== PAGE 1 =====\n題號：1\n答：a\n  == PAGE 2 ==  \n題號：2a\n答：b\n"
+    assert AnswerExtractor._split_batch_response(text, 2) == ["題號：1\n答：a", "題號：2a\n答：b"]
+
+
+@pytest.mark.parametrize('text', [
+    "",
+    None,
+    "題號：1\n答：a",
+    "===== PAGE 1 =====\na",
+    "===== PAGE 2 =====\nb\n===== PAGE 1 =====\na",
+    "===== PAGE 1 =====\na\n===== PAGE 1 =====\na\n===== PAGE 2 =====\nb",
+    "===== PAGE 1 =====\na\n===== PAGE 2 =====\nb\n===== PAGE 3 =====\nc",
+])
+def test_split_batch_response_rejects_misdelimited_pages(text):
+    assert AnswerExtractor._split_batch_response(text, 2) is None
+
+
+def test_batched_extraction_uses_delimited_pages(answer_pdf):
+    api = FakeGeminiAPI("===== PAGE 1 =====\n題號：1\n答：x\n===== PAGE 2 =====\n題號：2a\n答：y")
+    text = AnswerExtractor(answer_pdf, api, QUESTIONS, pages_per_call=2).extract()
+    assert api.requests == [2, 1]
+    assert "答：x" in text and "答：y" in text and "single page" in text
+
+
+def test_batched_extraction_falls_back_to_single_pages(answer_pdf):
+    api = FakeGeminiAPI("題號：1\n答：not delimited")
+    text = AnswerExtractor(answer_pdf, api, QUESTIONS, pages_per_call=2).extract()
+    assert api.requests == [2, 1, 1, 1]
+    assert "not delimited" not in text
@@ -0,0 +1,55 @@
+"""Tests for the on-disk API response cache."""
+
+import json
+import os
+
+from examgrader.api.cache import ResponseCache
+
+
+def entry_size(response: str, request_bytes: int = 0) -> int:
+    """Size on disk of a cache entry."""
+    return len(json.dumps({'response': response, 'request_bytes': request_bytes}, ensure_ascii=False).encode('utf-8'))
+
+
+def test_hit_after_put(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    key = ResponseCache.make_key("test", {'prompt': 'p'})
+    assert cache.get(key) is None
+    cache.put(key, "answer", request_bytes=100)
+    assert cache.get(key) == "answer"
+    assert (cache.hits, cache.misses, cache.bytes_saved) == (1, 1, 100)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=3 * entry_size("x" * 10))
+    for key in "abc":
+        cache.put(key, "x" * 10)
+    cache.get("a")
+    cache.put("d", "x" * 10)
+
+    assert cache.get("b") is None
+    assert not os.path.exists(cache._entry_path("b"))
+    for key in "acd":
+        assert cache.get(key) == "x" * 10
+
+
+def test_index_rebuilt_in_last_use_order(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    for age, key in enumerate("abc"):
+        cache.put(key, "x" * 10)
+        os.utime(cache._entry_path(key), (1000 - age, 1000 - age))
+
+    # c was used longest ago, so it is the first to go when the limit shrinks
+    reopened = ResponseCache(str(tmp_path), max_bytes=2 * entry_size("x" * 10))
+    assert reopened.get("c") is None
+    assert reopened.get("a") == reopened.get("b") == "x" * 10
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("a", "answer")
+    with open(cache._entry_path("a"), 'w') as f:
+        f.write("{not json")
+    assert cache.get("a") is None
+    assert cache.get("a") is None
+    assert cache.misses == 2
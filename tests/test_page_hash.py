@@ -0,0 +1,53 @@
+"""Tests for skipping unchanged template pages."""
+
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import pytest
+
+from examgrader.utils.image_utils import pixmap_to_image, render_page
+from examgrader.utils.page_hash import TemplatePageIndex
+
+QUESTIONS_PDF = Path(__file__).resolve().parent.parent / 'Data' / 'Homework1_2025.pdf'
+DPI = 150
+
+
+# One short line of answer, too little ink for the coarse grid to notice
+ANSWER = "x = 3.14 ans"
+ANSWER_SIZE = 11
+
+
+def rendered_page(page_index: int = 0, answer: str = None):
+    """Render a page of the questions PDF, optionally with one line of answer written on it."""
+    with fitz.open(QUESTIONS_PDF) as doc:
+        page = doc[page_index]
+        if answer:
+            page.insert_text((300, page.rect.height * 0.6), answer, fontsize=ANSWER_SIZE)
+        return pixmap_to_image(render_page(page, DPI))
+
+
+@pytest.fixture(scope='module')
+def index():
+    index = TemplatePageIndex()
+    assert index.seed_from_pdf(QUESTIONS_PDF, dpi=DPI) > 0
+    return index
+
+
+def test_unchanged_template_page_matches(index):
+    assert index.match(index.signature(rendered_page())) is not None
+
+
+def test_template_page_with_one_answer_line_is_not_skipped(index):
+    signature = index.signature(rendered_page(answer=ANSWER))
+    template = index.signature(rendered_page())
+    assert signature.new_ink(template) <= index.max_new_ink
+    assert index.match(signature) is None
+
+
+def test_answer_line_blocks_learning_page_as_template():
+    index = TemplatePageIndex(min_students=2)
+    blank = index.signature(rendered_page())
+    answered = index.signature(rendered_page(answer=ANSWER))
+    assert not index.observe(blank, 'student1')
+    assert not index.observe(answered, 'student2')
+    assert index.match(answered) is None
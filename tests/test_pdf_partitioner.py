@@ -0,0 +1,78 @@
+"""Tests for partitioning multi-student PDFs by boundary search."""
+
+import threading
+
+import pytest
+
+from examgrader.utils import pdf_partitioner
+from examgrader.utils.pdf_partitioner import iter_student_sections_by_stride
+
+
+class FakePDF:
+    """Stands in for an open multi-student PDF."""
+
+    def __init__(self, page_count: int):
+        self.page_count = page_count
+
+    def close(self):
+        pass
+
+
+def fake_scan(monkeypatch, starts, page_count, id_on_every_page=False):
+    """Serve student IDs from a page layout instead of Gemini.
+
+    Args:
+        starts: First page of each student, in order
+        page_count: Number of pages in the PDF
+        id_on_every_page: Whether every page shows its student's ID, not only the first
+
+    Returns:
+        Set of the page numbers that were probed
+    """
+    probed = set()
+    lock = threading.Lock()
+
+    def analyze_pdf_page(source, page_num, gemini_api, id_region=None, stats=None):
+        with lock:
+            probed.add(page_num)
+        student = sum(1 for start in starts if start <= page_num) - 1
+        if student < 0 or (page_num != starts[student] and not id_on_every_page):
+            return []
+        return [{'student_id': f"S{student}", 'name': f"Student {student}", 'start_page': page_num}]
+
+    monkeypatch.setattr(pdf_partitioner, 'analyze_pdf_page', analyze_pdf_page)
+    return probed
+
+
+def sections(page_count, stride):
+    return [(section['student_id'], section['start_page'], section['end_page'])
+            for section in iter_student_sections_by_stride(None, None, stride, source=FakePDF(page_count))]
+
+
+def test_fixed_length_submissions_probe_only_the_boundaries(monkeypatch):
+    probed = fake_scan(monkeypatch, [0, 3, 6, 9], 12)
+    assert sections(12, 3) == [("S0", 0, 2), ("S1", 3, 5), ("S2", 6, 8), ("S3", 9, 11)]
+    # Page 1 is probed once to tell whether students write their ID on every page
+    assert probed == {0, 1, 3, 6, 9}
+
+
+@pytest.mark.parametrize('id_on_every_page', [False, True])
+def test_boundary_shifted_later(monkeypatch, id_on_every_page):
+    fake_scan(monkeypatch, [0, 4, 7], 10, id_on_every_page)
+    assert sections(10, 3) == [("S0", 0, 3), ("S1", 4, 6), ("S2", 7, 9)]
+
+
+@pytest.mark.parametrize('id_on_every_page', [False, True])
+def test_boundary_shifted_earlier(monkeypatch, id_on_every_page):
+    fake_scan(monkeypatch, [0, 2, 5], 8, id_on_every_page)
+    assert sections(8, 3) == [("S0", 0, 1), ("S1", 2, 4), ("S2", 5, 7)]
+
+
+def test_last_student_shorter_than_the_stride(monkeypatch):
+    fake_scan(monkeypatch, [0, 3, 6], 8)
+    assert sections(8, 3) == [("S0", 0, 2), ("S1", 3, 5), ("S2", 6, 7)]
+
+
+def test_pages_before_the_first_id_are_not_assigned(monkeypatch):
+    fake_scan(monkeypatch, [1, 4], 7)
+    assert sections(7, 3) == [("S0", 1, 3), ("S1", 4, 6)]
@@ -0,0 +1,58 @@
+"""Tests for the per-model rate limiter."""
+
+import pytest
+
+from examgrader.api import rate_limiter
+from examgrader.api.rate_limiter import TokenBucket, parse_rate_limits
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the monotonic clock of the rate limiter with one the test advances."""
+    now = [0.0]
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits(["o4-mini=500:200000", " gemini = :1000 ", "other=60:"]) == {
+        'o4-mini': (500, 200000),
+        'gemini': (None, 1000),
+        'other': (60, None),
+    }
+
+
+@pytest.mark.parametrize('spec', ["o4-mini", "o4-mini=500", "o4-mini=five:100"])
+def test_parse_rate_limits_rejects_malformed(spec):
+    with pytest.raises(ValueError, match="expected MODEL=RPM:TPM"):
+        parse_rate_limits([spec])
+
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=2)
+    assert bucket._try_take(10) == 0
+    assert bucket._try_take(4) == pytest.approx(2.0)
+
+    clock[0] = 1.0
+    assert bucket._try_take(4) == pytest.approx(1.0)
+    clock[0] = 2.0
+    assert bucket._try_take(4) == 0
+
+
+def test_token_bucket_refill_is_capped(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=2)
+    bucket._try_take(10)
+    clock[0] = 60.0
+    assert bucket._try_take(10) == 0
+    assert bucket._try_take(1) > 0
+
+
+def test_oversized_request_waits_for_full_bucket_and_goes_negative(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=1)
+    bucket._try_take(5)
+    assert bucket._try_take(25) == pytest.approx(5.0)
+
+    clock[0] = 5.0
+    assert bucket._try_take(25) == 0
+    # The 15 tokens over capacity are paid back before the next request
+    assert bucket._try_take(1) == pytest.approx(16.0)